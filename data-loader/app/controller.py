@@ -20,6 +20,7 @@ import re
 import traceback
 import pandas as pd
 from database_functions import reports, fib_indices, posts, reshares, profile_links
+from library import backend_util
 from top_fibers_pkg.utils import get_logger
 
 FIB_INDICES = "fib_indices"
@@ -31,10 +32,19 @@ LOG_FNAME = "database_server.log"
 script_name = os.path.basename(__file__)
 logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name, also_print=True)
 
+
+class ReportAlreadyAddedError(Exception):
+    """Raised by `add_data` if the report is already in the database."""
+
 def add_data(read_dir, platform, selected_month):
     """
     Read preprocessed files and pass data to the database
 
+    The report, its FIB indices, posts and reshares are all added in one
+    transaction, with one batched statement per table: either all of them are
+    added or (if anything fails) none of them are, so a failed load can simply
+    be run again.
+
     Parameters
     -----------
     - read_dir (str): directory to read data from. Combined with `selected_month`
@@ -46,95 +56,112 @@ def add_data(read_dir, platform, selected_month):
     Returns
     -----------
     None
+
+    Exceptions
+    -----------
+    - ReportAlreadyAddedError, if the report is already in the database
     """
     list_dir = os.listdir(os.path.join(read_dir, selected_month))
 
-    if len(list_dir) > 0:
-        logger.info("Found the data directory on that day!")
-        file_date = extract_date_convert_datetime(list_dir[0])
-
-        # If the report has already been added to the database for this platform, we skip
-        if not reports.report_already_added(file_date, selected_month, platform):
-            report_id = reports.add_reports(file_date, selected_month, platform)
-
-            for file in list_dir:
-                try:
-                    path_to_data = os.path.join(read_dir, selected_month, file)
-
-                    # This block loads the fib indices file for a given month and
-                    # sends its data to the database.
-                    # The file loaded is based on the provided `platform`
-                    if FIB_INDICES in file:
-                        logger.info(
-                            f"Loading fib indices file for month: {selected_month}"
-                        )
-                        df_fib_indices = pd.read_parquet(path_to_data)
-
-                        # The data frame is already sorted in descending order so
-                        # taking the top N rows selects the top N FIBers
-                        temp_df = df_fib_indices.head(N_ROWS)
-                        for index, row in temp_df.iterrows():
-                            try:
-                                # Send data to fib_indices table
-                                fib_indices.add_fib_indices(
-                                    row.user_id,
-                                    report_id.get("id"),
-                                    row.fib_index,
-                                    row.total_reshares,
-                                    row.username,
-                                    platform,
-                                )
-                            except Exception as err:
-                                traceback.print_tb(err.__traceback__)
-                                logger.error("Error in adding data to fib indices")
-
-                    # This block loads the top spreaders file for a given month and
-                    # sends its data to the database.
-                    # The file loaded is based on the provided `platform`
-                    elif TOP_SPREADERS in file:
-                        logger.info(
-                           f"Loading top spreader file for the month: {selected_month}"
-                        )
-                        df_top_spreaders = pd.read_parquet(path_to_data)
-                        for index, row in df_top_spreaders.iterrows():
-                            try:
-                                # Send data to posts table
-                                posts.add_posts(
-                                    row.post_id,
-                                    row.user_id,
-                                    platform,
-                                    row.timestamp,
-                                    row.post_url,)
-                                # Send data to reshares table
-                                reshares.add_reshares(
-                                    row.post_id,
-                                    report_id.get("id"),
-                                    platform,
-                                    row.num_reshares,
-                                )
-                            except Exception as err:
-                                traceback.print_tb(err.__traceback__)
-                                logger.error(
-                                    "Error in adding data to post table or reshares table"
-                                )
-                except FileNotFoundError as e:
-                    traceback.print_tb(e.__traceback__)
-                    logger.error(f"file {file} does not exist")
-        else:
-            logger.error(
-                "There is already records with the file date. Can not proceed!"
-            )
-            raise Exception(
-                "Already there is a record with file date. Can not proceed!"
-            )
-    else:
+    if len(list_dir) == 0:
         logger.error("There is no files related to that name!")
         raise Exception("There is no files related to the that name!")
 
+    logger.info("Found the data directory on that day!")
+    file_date = extract_date_convert_datetime(list_dir[0])
+
+    # Read all files first, so the transaction below only sends data
+    fib_indices_dfs = []
+    top_spreaders_dfs = []
+    for file in list_dir:
+        path_to_data = os.path.join(read_dir, selected_month, file)
+
+        # This block loads the fib indices file for a given month.
+        # The file loaded is based on the provided `platform`
+        if FIB_INDICES in file:
+            logger.info(f"Loading fib indices file for month: {selected_month}")
+            df_fib_indices = pd.read_parquet(path_to_data)
+
+            # The data frame is already sorted in descending order so
+            # taking the top N rows selects the top N FIBers
+            fib_indices_dfs.append(df_fib_indices.head(N_ROWS))
+
+        # This block loads the top spreaders file for a given month.
+        # The file loaded is based on the provided `platform`
+        elif TOP_SPREADERS in file:
+            logger.info(f"Loading top spreader file for the month: {selected_month}")
+            top_spreaders_dfs.append(pd.read_parquet(path_to_data))
+
+    try:
+        with backend_util.get_db_transaction() as cur:
+            # If the report has already been added to the database for this
+            # platform, we skip
+            if reports.report_already_added(
+                file_date, selected_month, platform, cur=cur
+            ):
+                logger.error(
+                    "There is already records with the file date. Can not proceed!"
+                )
+                raise ReportAlreadyAddedError(
+                    "Already there is a record with file date. Can not proceed!"
+                )
+            report_id = reports.add_reports(
+                file_date, selected_month, platform, cur=cur
+            ).get("id")
+
+            # Send data to fib_indices table
+            fib_indices_rows = []
+            for df_fib_indices in fib_indices_dfs:
+                fib_indices_rows.extend(
+                    (
+                        row.user_id,
+                        report_id,
+                        row.fib_index,
+                        row.total_reshares,
+                        row.username,
+                        platform,
+                    )
+                    for row in df_fib_indices.itertuples(index=False)
+                )
+            num_rows = fib_indices.add_fib_indices_batch(fib_indices_rows, cur=cur)
+            logger.info(f"Adding {num_rows} rows to fib_indices")
+
+            # Send data to posts table and reshares table
+            posts_rows = []
+            reshares_rows = []
+            for df_top_spreaders in top_spreaders_dfs:
+                for row in df_top_spreaders.itertuples(index=False):
+                    posts_rows.append(
+                        (
+                            row.post_id,
+                            row.user_id,
+                            platform,
+                            row.timestamp,
+                            row.post_url,
+                        )
+                    )
+                    reshares_rows.append(
+                        (row.post_id, report_id, platform, row.num_reshares)
+                    )
+            num_rows = posts.add_posts_batch(posts_rows, cur=cur)
+            logger.info(f"Adding {num_rows} rows to posts")
+            num_rows = reshares.add_reshares_batch(reshares_rows, cur=cur)
+            logger.info(f"Adding {num_rows} rows to reshares")
+
+        logger.info(f"Report added (id: {report_id}), transaction committed.")
+    except ReportAlreadyAddedError:
+        raise
+    except Exception as err:
+        traceback.print_tb(err.__traceback__)
+        logger.error("Error in adding the report. Nothing was added to the database.")
+        raise
+
 
 def add_profile_pic_links(read_file, platform):
     """
-    Check the profile pictures existed, if no pass the data to profile_link table
+    Pass the profile picture links to the profile_links table: links of new users
+    are added and changed links are updated, in bulk (see
+    `profile_links.upsert_profile_links_batch`).
 
     Parameters
     -----------
@@ -147,22 +174,21 @@ def add_profile_pic_links(read_file, platform):
     None
     """
     logger.info("Add profile picture links!")
-    df_profile_links = pd.read_parquet(read_file)
-    existing_links = profile_links.get_all_profile_links()
-    for index, row in df_profile_links.iterrows():
-        # check if the user_id already exists in the database
-        if existing_links is None or row.user_id not in existing_links:
-            try:
-                profile_links.add_profile_links(
-                    row.user_id,
-                    platform,
-                    row.profile_image_url
-                )
-            except Exception as err:
-                traceback.print_tb(err.__traceback__)
-                logger.error(
-                    "Error in adding data to profile link table!"
-                )
+    df_profile_links = pd.read_parquet(
+        read_file, columns=["user_id", "profile_image_url"]
+    )
+    rows = [
+        (user_id, platform, profile_image_url)
+        for user_id, profile_image_url in df_profile_links.itertuples(
+            index=False, name=None
+        )
+    ]
+    try:
+        num_rows = profile_links.upsert_profile_links_batch(rows)
+        logger.info(f"Added or updated {num_rows} of {len(rows)} profile links")
+    except Exception as err:
+        traceback.print_tb(err.__traceback__)
+        logger.error("Error in adding data to profile link table!")
 
 
 def extract_date_convert_datetime(file_name):
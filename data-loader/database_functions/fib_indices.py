@@ -11,12 +11,15 @@ Outputs:
 Authors: Pasan Kamburugamuwa & Matthew DeVerna
 """
 from flask import Flask
+from psycopg2.extras import execute_values
 from library import backend_util
 
 app = Flask(__name__)
 
 
-def add_fib_indices(user_id, report_id, fib_index, total_reshares, username, platform):
+def add_fib_indices(
+    user_id, report_id, fib_index, total_reshares, username, platform, cur=None
+):
     """
     Add data to the FIB indices database table.
 
@@ -28,12 +31,15 @@ def add_fib_indices(user_id, report_id, fib_index, total_reshares, username, pla
     - total_reshares (int): total reshares earned by `user_id` during this report period
     - username (str): the username of `user_id`
     - platform (str): the name of the platform (should be "twitter" or "facebook")
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (dict): {'id': fib_index_id}
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         try:
             add_fib_index = (
                 "INSERT INTO fib_indices "
@@ -51,3 +57,33 @@ def add_fib_indices(user_id, report_id, fib_index, total_reshares, username, pla
             return result
         except Exception as ex:
             raise Exception(ex)
+
+
+def add_fib_indices_batch(rows, cur=None):
+    """
+    Add many rows to the FIB indices database table at once, with one multi-row
+    INSERT statement (per `backend_util.INSERT_PAGE_SIZE` rows).
+
+    Parameters
+    -----------
+    - rows (list[tuple]): one tuple per row with the same values as the
+        parameters of `add_fib_indices`:
+        (user_id, report_id, fib_index, total_reshares, username, platform)
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
+
+    Returns
+    -----------
+    result (int): the number of rows added
+    """
+    with backend_util.get_db_cursor(cur) as cur:
+        add_fib_index = (
+            "INSERT INTO fib_indices "
+            "(user_id, report_id, fib_index, total_reshares, username, platform) "
+            "values %s"
+        )
+        execute_values(
+            cur, add_fib_index, rows, page_size=backend_util.INSERT_PAGE_SIZE
+        )
+        return len(rows)
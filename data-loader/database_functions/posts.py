@@ -11,12 +11,13 @@ Outputs:
 Authors: Pasan Kamburugamuwa & Matthew DeVerna
 """
 from flask import Flask
+from psycopg2.extras import execute_values
 from library import backend_util
 
 app = Flask(__name__)
 
 
-def add_posts(post_id, user_id, platform, timestamp, url):
+def add_posts(post_id, user_id, platform, timestamp, url, cur=None):
     """
     Add data to the posts database table.
 
@@ -27,12 +28,15 @@ def add_posts(post_id, user_id, platform, timestamp, url):
     - platform (str): the name of the platform (should be "twitter" or "facebook")
     - timestamp (str): second level epoch timestamp indicating when `post_id` was sent
     - url (str): the full url for `post_id`
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (dict): {'post_id': post_fetch_id}
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         try:
             add_post = (
                 "INSERT INTO posts "
@@ -48,3 +52,29 @@ def add_posts(post_id, user_id, platform, timestamp, url):
         except Exception as ex:
             raise Exception(ex)
 
+
+def add_posts_batch(rows, cur=None):
+    """
+    Add many rows to the posts database table at once, with one multi-row INSERT
+    statement (per `backend_util.INSERT_PAGE_SIZE` rows).
+
+    Parameters
+    -----------
+    - rows (list[tuple]): one tuple per row with the same values as the
+        parameters of `add_posts`: (post_id, user_id, platform, timestamp, url)
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
+
+    Returns
+    -----------
+    result (int): the number of rows added
+    """
+    with backend_util.get_db_cursor(cur) as cur:
+        add_post = (
+            "INSERT INTO posts "
+            "(post_id, user_id, platform, timestamp, url) "
+            "values %s"
+        )
+        execute_values(cur, add_post, rows, page_size=backend_util.INSERT_PAGE_SIZE)
+        return len(rows)
@@ -10,9 +10,10 @@ Outputs:
 
 Authors: Pasan Kamburugamuwa & Matthew DeVerna
 """
+from psycopg2.extras import execute_values
 from library import backend_util
 
-def add_profile_links(user_id, platform, profile_image_url):
+def add_profile_links(user_id, platform, profile_image_url, cur=None):
     """
     Add data to the profile links database table.
 
@@ -21,12 +22,15 @@ def add_profile_links(user_id, platform, profile_image_url):
     - user_id (str): the id of the user. This will be facebook or twitter.
     - platform (str): which platform -> facebook, twitter
     - profile_image_url (str): url of the profile picture.
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (dict): {'user_id': profile_profile_pic_fetch_id}
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         try:
             add_profile_links = (
                 "INSERT INTO profile_links "
@@ -43,19 +47,21 @@ def add_profile_links(user_id, platform, profile_image_url):
             raise Exception(ex)
 
 
-def get_all_profile_links():
+def get_all_profile_links(cur=None):
     """
     Add function gets all the available profile pictures in database data table profile_links
 
     Parameters
     -----------
-     -None
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (array): user_ids
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         select_query = ("SELECT user_id FROM profile_links")
         cur.execute(select_query)
         if cur.rowcount > 0:
@@ -63,3 +69,58 @@ def get_all_profile_links():
             user_ids = [row[0] for row in cur.fetchall()]
             # Return the list of user IDs
             return user_ids
+
+
+def upsert_profile_links_batch(rows, cur=None):
+    """
+    Add new profile links and update the changed ones, in one statement per
+    `backend_util.INSERT_PAGE_SIZE` rows (a multi-row INSERT ... ON CONFLICT).
+
+    Requires the unique index on (user_id, platform) (see
+    `database_script/add_profile_links_unique_index.sql`). Existing rows are only
+    updated if their `profile_image_url` changed, and rows that are not in
+    `rows` are left as they are.
+
+    Parameters
+    -----------
+    - rows (list[tuple]): one (user_id, platform, profile_image_url) tuple per
+        row. If a (user_id, platform) pair is repeated, the last one is kept.
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
+
+    Returns
+    -----------
+    result (int): the number of rows added or updated
+    """
+    # A single statement can not update the same row twice
+    latest_links = {
+        (user_id, platform): profile_image_url
+        for user_id, platform, profile_image_url in rows
+    }
+    rows = [
+        (user_id, platform, profile_image_url)
+        for (user_id, platform), profile_image_url in latest_links.items()
+    ]
+
+    with backend_util.get_db_cursor(cur) as cur:
+        upsert_profile_links = (
+            "INSERT INTO profile_links "
+            "(user_id, platform, profile_image_url) "
+            "values %s "
+            "ON CONFLICT (user_id, platform) DO UPDATE "
+            "SET profile_image_url = EXCLUDED.profile_image_url "
+            "WHERE profile_links.profile_image_url "
+            "IS DISTINCT FROM EXCLUDED.profile_image_url"
+        )
+        num_rows = 0
+        page_size = backend_util.INSERT_PAGE_SIZE
+        for start in range(0, len(rows), page_size):
+            execute_values(
+                cur,
+                upsert_profile_links,
+                rows[start : start + page_size],
+                page_size=page_size,
+            )
+            num_rows += cur.rowcount
+        return num_rows
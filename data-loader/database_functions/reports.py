@@ -16,7 +16,7 @@ from library import backend_util
 app = Flask(__name__)
 
 
-def add_reports(date, report_name, platform):
+def add_reports(date, report_name, platform, cur=None):
     """
     Add data to the reports database table.
 
@@ -27,12 +27,15 @@ def add_reports(date, report_name, platform):
     - report_name (str): the name of the report. Will be the date (format: ""%Y_%m"")
         for which the report is generated.
     - platform (str): the name of the platform (should be "twitter" or "facebook")
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (dict): {"id" : add_report}
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         try:
             add_report = (
                 "INSERT INTO reports "
@@ -49,7 +52,7 @@ def add_reports(date, report_name, platform):
             raise Exception(ex)
 
 
-def report_already_added(date, report_name, platform):
+def report_already_added(date, report_name, platform, cur=None):
     """
     Check if a specific report already exists in the database
 
@@ -60,12 +63,15 @@ def report_already_added(date, report_name, platform):
     - report_name (str): the name of the report. Will be the date (format: ""%Y_%m"")
         for which the report is generated.
     - platform (str): the name of the platform (should be "twitter" or "facebook")
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (bool): False if report exists. True if it does not.
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         select_query = (
             "SELECT id from reports where date= %s and name = %s and platform = %s;"
         )
@@ -75,3 +81,30 @@ def report_already_added(date, report_name, platform):
         else:
             result = False
         return result
+
+
+def get_existing_reports(report_names, platforms, cur=None):
+    """
+    Find which of the reports for `report_names` and `platforms` already exist
+    in the database, with a single query.
+
+    Parameters
+    -----------
+    - report_names (list[str]): the names of the reports (format: "%Y_%m")
+    - platforms (list[str]): the names of the platforms
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
+
+    Returns
+    -----------
+    result (set): the (report_name, platform) pairs that exist
+    """
+    with backend_util.get_db_cursor(cur) as cur:
+        select_query = (
+            "SELECT DISTINCT name, platform FROM reports "
+            "WHERE name = ANY(%s) AND platform = ANY(%s);"
+        )
+        cur.execute(select_query, (list(report_names), list(platforms)))
+        result = {(name, platform) for name, platform in cur.fetchall()}
+        return result
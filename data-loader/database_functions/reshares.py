@@ -11,12 +11,13 @@ Outputs:
 Authors: Pasan Kamburugamuwa & Matthew DeVerna
 """
 from flask import Flask
+from psycopg2.extras import execute_values
 from library import backend_util
 
 app = Flask(__name__)
 
 # Add reshares data to table
-def add_reshares(post_id, report_id, platform, num_shares):
+def add_reshares(post_id, report_id, platform, num_shares, cur=None):
     """
     Add data to the reshares database table.
 
@@ -25,12 +26,15 @@ def add_reshares(post_id, report_id, platform, num_shares):
     - post_id (str): a posts unique id
     - report_id (str): the id for the report that maps to post_id
     - num_shares (int/float): the number of times that post_id was reshared
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
 
     Returns
     -----------
     result (dict): {"post_id": post_fetch_id}
     """
-    with backend_util.get_db_cursor() as cur:
+    with backend_util.get_db_cursor(cur) as cur:
         try:
             add_reshare = (
                 "INSERT INTO reshares "
@@ -46,3 +50,31 @@ def add_reshares(post_id, report_id, platform, num_shares):
         except Exception as ex:
             raise Exception(ex)
 
+
+def add_reshares_batch(rows, cur=None):
+    """
+    Add many rows to the reshares database table at once, with one multi-row
+    INSERT statement (per `backend_util.INSERT_PAGE_SIZE` rows).
+
+    Parameters
+    -----------
+    - rows (list[tuple]): one tuple per row with the same values as the
+        parameters of `add_reshares`: (post_id, report_id, platform, num_shares)
+    - cur (psycopg2 cursor): the cursor of an open transaction (see
+        `backend_util.get_db_transaction`). Default = None (run in its own
+        transaction)
+
+    Returns
+    -----------
+    result (int): the number of rows added
+    """
+    with backend_util.get_db_cursor(cur) as cur:
+        add_reshare = (
+            "INSERT INTO reshares "
+            "(post_id, report_id, platform, num_reshares) "
+            "values %s"
+        )
+        execute_values(
+            cur, add_reshare, rows, page_size=backend_util.INSERT_PAGE_SIZE
+        )
+        return len(rows)
@@ -0,0 +1,14 @@
+-- Migration for databases created before profile links were upserted.
+-- Keeps only the latest row of each (user_id, platform) pair, then adds the
+-- unique index that `INSERT ... ON CONFLICT (user_id, platform)` relies on.
+BEGIN;
+
+DELETE FROM profile_links older
+USING profile_links newer
+WHERE older.user_id = newer.user_id
+	AND older.platform IS NOT DISTINCT FROM newer.platform
+	AND older.id < newer.id;
+
+CREATE UNIQUE INDEX idx_profile_links_user_id_platform ON profile_links (user_id, platform);
+
+COMMIT;
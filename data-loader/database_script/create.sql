@@ -50,6 +50,7 @@ CREATE INDEX idx_posts_user_id ON posts (user_id);
 CREATE INDEX idx_posts_platform ON posts (platform);
 CREATE INDEX idx_fib_indices_user_id ON fib_indices(user_id);
 CREATE INDEX idx_reports_name ON reports(name);
+CREATE UNIQUE INDEX idx_profile_links_user_id_platform ON profile_links (user_id, platform);
 
 
 --ACCESS DB
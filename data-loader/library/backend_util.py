@@ -2,6 +2,9 @@
 Purpose:
     This script used to read the data from /home/data/apps/topfibers/repo/data-loader/conf/fibindex.config
     and pass these data to other modules in the data-loader
+    The config file is parsed once. The connection pool is only created when the
+    first connection is needed, and connections are checked (and replaced if
+    broken, e.g. after a database restart) every time they are checked out.
 Inputs:
     - No inputs to this file
 Outputs:
@@ -13,25 +16,37 @@ Authors: Pasan Kamburugamuwa
 import os
 import configparser
 import logging
+import threading
+import time
 import traceback
+import psycopg2
+from functools import lru_cache
 from psycopg2 import pool
 from contextlib import contextmanager
 from top_fibers_pkg.utils import get_logger
 
 config_file_path = '/home/data/apps/topfibers/repo/data-loader/conf/fibindex.config'
+# Maximum number of rows sent in one multi-row INSERT statement
+INSERT_PAGE_SIZE = 10_000
+# Default maximum number of pooled connections (see `get_database_pool_size`)
+DEFAULT_POOL_SIZE = 10
+# Number of times to try opening a working connection, waiting
+# RECONNECT_WAIT * attempt seconds after each failed attempt
+RECONNECT_ATTEMPTS = 5
+RECONNECT_WAIT = 2
 LOG_DIR = "/home/data/apps/topfibers/repo/logs"
 LOG_FNAME = "database_server.log"
 script_name = os.path.basename(__file__)
 logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name, also_print=True)
 
+@lru_cache(maxsize=None)
 def get_fib_index_conf():
-    try:
-        config_parser = configparser.ConfigParser()
-        config_parser.read(config_file_path)
-        return config_parser
-    except FileNotFoundError as fnf_error:
-        traceback.print_tb(fnf_error.__traceback__)
+    """Parse the config file (only once, later calls return the same parser)."""
+    config_parser = configparser.ConfigParser()
+    if not config_parser.read(config_file_path):
+        logger.error(f"Unable to find the fibIndex config file: {config_file_path}")
         raise Exception('Unable to find the fibIndex config file')
+    return config_parser
 
 def get_database_host():
     try:
@@ -83,36 +98,220 @@ def get_database_password():
         logger.error("Error in finding the postgresql database password")
         raise Exception('Unable to find the postgresql database password')
 
+def get_database_pool_size():
+    """
+    Return the maximum number of pooled connections: `database-pool-size` in the
+    config file, if set, otherwise DEFAULT_POOL_SIZE.
+    """
+    try:
+        config = get_fib_index_conf()
+        return config["POSTGRESQL_DATABASE"].getint(
+            "database-pool-size", DEFAULT_POOL_SIZE
+        )
+    except Exception as e:
+        traceback.print_tb(e.__traceback__)
+        logger.error("Error in finding the postgresql database pool size")
+        raise Exception('Unable to find the postgresql database pool size')
+
+
+class LazyConnectionPool(pool.ThreadedConnectionPool):
+    """
+    A thread-safe connection pool that opens connections only when they are
+    first needed, and keeps up to `maxconn` of them open once returned.
+    """
+
+    def __init__(self, maxconn, *args, **kwargs):
+        # IDs of opened connections that have not been checked out yet
+        self._new_connection_ids = set()
+        # No connection is opened now...
+        super().__init__(0, maxconn, *args, **kwargs)
+        # ...but returned connections are only closed beyond `minconn` idle ones
+        self.minconn = maxconn
+
+    def _connect(self, key=None):
+        con = super()._connect(key)
+        self._new_connection_ids.add(id(con))
+        return con
+
+    def is_new_connection(self, con):
+        """
+        Return True if `con` was opened for this checkout (rather than reused
+        from the idle connections). Only the first call for a connection does.
+        """
+        with self._lock:
+            if id(con) not in self._new_connection_ids:
+                return False
+            self._new_connection_ids.discard(id(con))
+            return True
+
+    def close_idle(self):
+        """Close all idle connections (e.g., after a database restart)."""
+        with self._lock:
+            idle_connections, self._pool = self._pool, []
+        for con in idle_connections:
+            try:
+                con.close()
+            except Exception:
+                pass
+
+
 db = None
+_db_lock = threading.RLock()
+_db_slots = None
+
+
+def init_db_pool(pool_size=None):
+    """
+    Create the connection pool. An existing pool is closed first, so this should
+    be called before any connection is checked out (e.g., to size the pool for a
+    number of worker threads).
+
+    Parameters
+    -----------
+    - pool_size (int): the maximum number of connections. Checking out more
+        connections than that waits until one is returned. Default = None (see
+        `get_database_pool_size`)
+
+    Returns
+    -----------
+    db (LazyConnectionPool)
+    """
+    global db, _db_slots
+    if pool_size is None:
+        pool_size = get_database_pool_size()
+    if pool_size < 1:
+        raise ValueError("`pool_size` must be at least one!")
 
-try:
-    db = pool.SimpleConnectionPool(1,
-                                10,
-                                host=get_database_host(),
-                                database=get_database_name(),
-                                user=get_database_username(),
-                                password=get_database_password(),
-                                port=get_database_port())
-except:
-    logger.info("Can not connect to FibIndex Database")
-    pass
+    with _db_lock:
+        if db is not None:
+            db.closeall()
+        db = LazyConnectionPool(
+            pool_size,
+            host=get_database_host(),
+            database=get_database_name(),
+            user=get_database_username(),
+            password=get_database_password(),
+            port=get_database_port(),
+        )
+        _db_slots = threading.BoundedSemaphore(pool_size)
+        logger.info(f"Created FibIndex Database connection pool (size: {pool_size})")
+        return db
+
+
+def get_db_pool():
+    """Return the connection pool, creating it on first use."""
+    with _db_lock:
+        if db is not None:
+            return db
+        return init_db_pool()
+
+
+def _is_connection_usable(con):
+    """Return True if `con` is open and answers a trivial query."""
+    if con.closed:
+        return False
+    try:
+        # End any transaction left open, then check the server responds
+        con.rollback()
+        with con.cursor() as cur:
+            cur.execute("SELECT 1")
+        con.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _checkout_connection(db_pool):
+    """
+    Check out a working connection from `db_pool`. Broken connections are closed
+    and replaced. A broken idle connection means the database restarted (which
+    breaks all of them), so all idle connections are closed and a new one is
+    opened. Only failures to open a working connection (e.g., while the database
+    restarts) count towards the RECONNECT_ATTEMPTS attempts.
+    """
+    attempt = 0
+    while True:
+        try:
+            con = db_pool.getconn()
+            is_new_connection = db_pool.is_new_connection(con)
+            if _is_connection_usable(con):
+                return con
+            db_pool.putconn(con, close=True)
+            if not is_new_connection:
+                logger.warning("Replacing broken FibIndex Database connections")
+                db_pool.close_idle()
+                continue
+            raise psycopg2.OperationalError("New database connection is not working")
+
+        except psycopg2.OperationalError as e:
+            attempt += 1
+            if attempt == RECONNECT_ATTEMPTS:
+                logger.error("Can not connect to FibIndex Database")
+                raise
+            wait_time = RECONNECT_WAIT * attempt
+            logger.warning(
+                f"Can not connect to FibIndex Database ({str(e).strip()}). "
+                f"Retrying in {wait_time} seconds..."
+            )
+            time.sleep(wait_time)
 
 
 @contextmanager
 def get_db_connection():
-    con = db.getconn()
-    try:
-        yield con
-    finally:
-        db.putconn(con)
+    """
+    Yield a working connection from the pool (created on first use) and return
+    it to the pool afterwards. Connections that broke while in use are closed
+    instead of being returned.
+    """
+    with _db_lock:
+        db_pool = get_db_pool()
+        db_slots = _db_slots
+    with db_slots:
+        con = _checkout_connection(db_pool)
+        try:
+            yield con
+        finally:
+            db_pool.putconn(con, close=bool(con.closed))
 
 
 @contextmanager
-def get_db_cursor():
+def get_db_transaction():
+    """
+    Yield a cursor whose statements all run in one transaction on one pooled
+    connection. The transaction is committed if the block succeeds and rolled
+    back (and the error raised again) otherwise, so it is all-or-nothing.
+    """
     with get_db_connection() as connection:
         cursor = connection.cursor()
         try:
             yield cursor
             connection.commit()
+        except Exception:
+            # If the connection broke, rolling back fails too. Raise the
+            # original error instead.
+            try:
+                connection.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+            raise
         finally:
             cursor.close()
+
+
+@contextmanager
+def get_db_cursor(cursor=None):
+    """
+    Yield a cursor for the statements of one database function.
+
+    Parameters
+    -----------
+    - cursor (psycopg2 cursor): the cursor of an open transaction (see
+        `get_db_transaction`). If given, it is yielded as it is and the caller's
+        transaction is neither committed nor rolled back. Default = None (run
+        the statements in their own transaction)
+    """
+    if cursor is not None:
+        yield cursor
+    else:
+        with get_db_transaction() as cursor:
+            yield cursor
@@ -1,69 +1,276 @@
 """
 Purpose:
     The main python script that sends (i.e., "serves") data to the database.
-    By default, the script will send data for the current month. If you would like
-    to send older data, you must manually update the MONTHS variable with
-    the dates you would like to update. See comments below for examples.
+    By default, the script will send data for the current month. To backfill older
+    data, pass a range of months (and, optionally, platforms). Reports that are
+    already in the database are found with a single query and skipped, and the
+    missing (month, platform) reports are loaded concurrently by a bounded pool of
+    workers (each with its own database connection). Each report is loaded in one
+    transaction (see `controller.add_data`), so a failed load is simply retried.
 
 Inputs:
-    None
+    -s / --start-month: first month to send, format: YYYY_MM (default: current
+        month)
+    -e / --end-month: last month to send (inclusive), format: YYYY_MM (default:
+        current month)
+    -p / --platforms: platforms to send (default: PLATFORMS)
+    -w / --workers: number of reports loaded at the same time (default: 4)
+    -r / --retries: number of times a failed report is retried (default: 3)
+
+    Examples:
+    - Current month (the default, run by `run_data_loader.sh`):
+        python server.py
+    - All months of 2022 for both platforms:
+        python server.py -s 2022_01 -e 2022_12 -p Facebook Twitter
 
 Output:
     None
 
 Author: Pasan Kamburugamuwa & Matthew DeVerna
 """
+import argparse
 import datetime
 import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-# Only used if updating all months
 import pandas as pd
 
 from app import controller
+from database_functions import reports
+from library import backend_util
 from top_fibers_pkg.utils import get_logger
 
 facebook_data_path = "/home/data/apps/topfibers/repo/data/derived/fib_results/facebook"
 twitter_data_path = "/home/data/apps/topfibers/repo/data/derived/fib_results/twitter"
 twitter_profile_pic_file_path = "/home/data/apps/topfibers/repo/data/derived/twitter_profile_links/top_fiber_profile_image_links.parquet"
-# PLATFORMS = ["Facebook", "Twitter"]
+ALL_PLATFORMS = ["Facebook", "Twitter"]
+# Default platforms
 PLATFORMS = ["Facebook"]
 LOG_DIR = "/home/data/apps/topfibers/repo/logs"
 LOG_FNAME = "database_server.log"
+SCRIPT_PURPOSE = "Send data for a range of months and platforms to the database."
+
+# Default number of reports loaded at the same time
+NUM_WORKERS = 4
+# Default number of retries for each report, waiting RETRY_WAIT * attempt
+# seconds before each one
+NUM_RETRIES = 3
+RETRY_WAIT = 10
+
+
+def parse_cl_args(script_purpose=""):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+
+    Returns
+    --------------
+    - args (argparse.Namespace) : the parsed arguments
+    """
+    current_month = datetime.datetime.now().strftime("%Y_%m")
+    parser = argparse.ArgumentParser(description=script_purpose)
+    parser.add_argument(
+        "-s",
+        "--start-month",
+        metavar="Start month",
+        help="First month to send (format: YYYY_MM). Default: current month",
+        default=current_month,
+    )
+    parser.add_argument(
+        "-e",
+        "--end-month",
+        metavar="End month",
+        help="Last month to send, inclusive (format: YYYY_MM). Default: current month",
+        default=current_month,
+    )
+    parser.add_argument(
+        "-p",
+        "--platforms",
+        metavar="Platforms",
+        help=f"Platforms to send, any of {ALL_PLATFORMS}. Default: {PLATFORMS}",
+        nargs="+",
+        choices=ALL_PLATFORMS,
+        default=PLATFORMS,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="Workers",
+        help=f"Number of reports loaded at the same time. Default: {NUM_WORKERS}",
+        type=int,
+        default=NUM_WORKERS,
+    )
+    parser.add_argument(
+        "-r",
+        "--retries",
+        metavar="Retries",
+        help=f"Number of times a failed report is retried. Default: {NUM_RETRIES}",
+        type=int,
+        default=NUM_RETRIES,
+    )
+    return parser.parse_args()
 
-### Use commented out only one of the MONTHS rows to dicate the months for which
-### data is sent to the database. Default = current month
-# --- All months ---
-# MONTHS = [dt.strftime("%Y_%m") for dt in pd.date_range("2022-01", "2023-01", freq="MS")]
-# --- Specific months ---
-#MONTHS = ["2023_01","2023_02","2023_03","2023_04","2023_05"]
-# --- Current month (should be the default) ---
-MONTHS = [datetime.datetime.now().strftime("%Y_%m")]
 
-def update_database():
+def get_months(start_month, end_month):
+    """
+    Return all months between `start_month` and `end_month` (inclusive).
+
+    Parameters
+    -----------
+    - start_month (str): the first month (format: "%Y_%m")
+    - end_month (str): the last month (format: "%Y_%m")
+
+    Returns
+    -----------
+    months (list[str]): the months (format: "%Y_%m")
+    """
+    start = datetime.datetime.strptime(start_month, "%Y_%m")
+    end = datetime.datetime.strptime(end_month, "%Y_%m")
+    if start > end:
+        raise ValueError("`start_month` must not be after `end_month`!")
+    return [dt.strftime("%Y_%m") for dt in pd.date_range(start, end, freq="MS")]
+
+
+def get_read_dir(platform):
+    """Return the directory with the data of `platform`."""
+    return facebook_data_path if platform == "Facebook" else twitter_data_path
+
+
+def load_report(selected_month, platform, retries=NUM_RETRIES):
+    """
+    Send the data of one (month, platform) report to the database, retrying
+    failed attempts. Retries are safe because each attempt is all-or-nothing,
+    and a report that turns out to be in the database already (e.g., the last
+    attempt was committed but its connection broke before it returned) is not
+    added again.
+
+    Parameters
+    -----------
+    - selected_month (str): the month of the report (format: "%Y_%m")
+    - platform (str): the platform of the report
+    - retries (int): the number of times a failed attempt is retried
+
+    Returns
+    -----------
+    result (bool): True if the report was added, False if it was already in the
+        database
+    """
+    read_dir = get_read_dir(platform)
+    for attempt in range(1, retries + 2):
+        try:
+            logger.info(
+                f"Adding data to database for platform: {platform}, "
+                f"month: {selected_month} (attempt {attempt})..."
+            )
+            controller.add_data(read_dir, platform, selected_month)
+            logger.info(f"Success: platform: {platform}, month: {selected_month}")
+            return True
+        except controller.ReportAlreadyAddedError:
+            logger.info(
+                f"Report already in the database: platform: {platform}, "
+                f"month: {selected_month}"
+            )
+            return False
+        except Exception:
+            logger.exception(
+                f"Problem sending data for platform: {platform}, "
+                f"month: {selected_month} (attempt {attempt})!"
+            )
+            if attempt > retries:
+                raise
+            wait_time = RETRY_WAIT * attempt
+            logger.info(f"Retrying in {wait_time} seconds...")
+            time.sleep(wait_time)
+
+
+def update_database(
+    months, platforms=PLATFORMS, workers=NUM_WORKERS, retries=NUM_RETRIES
+):
     """
     Update the Top FIBers database with the controller.add_data() function.
+
+    Only the (month, platform) reports that are not in the database yet are sent,
+    `workers` of them at the same time.
+
+    Parameters
+    -----------
+    - months (list[str]): the months to send (format: "%Y_%m")
+    - platforms (list[str]): the platforms to send. Default = PLATFORMS
+    - workers (int): the number of reports loaded at the same time. Default =
+        NUM_WORKERS
+    - retries (int): the number of times a failed report is retried. Default =
+        NUM_RETRIES
+
+    Returns
+    -----------
+    None
+
+    Exceptions
+    -----------
+    - Exception, if any report could not be sent (after all others are done)
     """
-    logger.info("Begin load past month data")
-    for selected_month in MONTHS:
-        for platform in PLATFORMS:
-            read_dir = (
-                facebook_data_path if platform == "Facebook" else twitter_data_path
+    logger.info(f"Begin loading data for months: {months}, platforms: {platforms}")
+
+    # Find the reports that are already in the database with one query
+    existing_reports = reports.get_existing_reports(months, platforms)
+    missing_reports = [
+        (selected_month, platform)
+        for selected_month in months
+        for platform in platforms
+        if (selected_month, platform) not in existing_reports
+    ]
+    logger.info(
+        f"Reports already in the database: {len(existing_reports)}, "
+        f"missing: {len(missing_reports)}"
+    )
+
+    # Reports without data can not be loaded (no need to retry them)
+    failed_reports = []
+    reports_to_load = []
+    for selected_month, platform in missing_reports:
+        month_dir = os.path.join(get_read_dir(platform), selected_month)
+        if os.path.isdir(month_dir) and len(os.listdir(month_dir)) > 0:
+            reports_to_load.append((selected_month, platform))
+        else:
+            logger.error(f"There is no data for the report in: {month_dir}")
+            failed_reports.append((selected_month, platform))
+
+    # Every worker uses one connection at a time
+    backend_util.init_db_pool(max(workers, backend_util.get_database_pool_size()))
+    added_reports = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        future_to_report = {
+            executor.submit(load_report, selected_month, platform, retries): (
+                selected_month,
+                platform,
             )
+            for selected_month, platform in reports_to_load
+        }
+        for future in as_completed(future_to_report):
+            report = future_to_report[future]
             try:
-                # Read data for the specified month
-                logger.info(f"Adding data to database for platform: {platform}, month: {selected_month}...")
-                controller.add_data(read_dir, platform, selected_month)
+                if future.result():
+                    added_reports.append(report)
+            except Exception:
+                failed_reports.append(report)
 
-                # Add data to profile link table
-                if platform == 'Twitter':
-                    logger.info(f"Adding data to profile_link table...")
-                    controller.add_profile_pic_links(twitter_profile_pic_file_path, platform)
-                logger.info("Success.")
-                logger.info("-" * 50)
+    # Add data to profile link table
+    if any(platform == "Twitter" for _, platform in added_reports):
+        logger.info(f"Adding data to profile_link table...")
+        controller.add_profile_pic_links(twitter_profile_pic_file_path, "Twitter")
 
-            except Exception as e:
-                logger.exception(f"Problem sending data!")
-                raise Exception(e)
+    logger.info(f"Reports added: {len(added_reports)}")
+    logger.info("-" * 50)
+    if failed_reports:
+        logger.error(f"Problem sending data for reports: {sorted(failed_reports)}")
+        raise Exception(f"Problem sending data for reports: {sorted(failed_reports)}")
 
 
 if __name__ == "__main__":
@@ -72,7 +279,18 @@ if __name__ == "__main__":
     logger.info("-" * 50)
     logger.info(f"Begin script: {__file__}")
 
-    update_database()
+    args = parse_cl_args(SCRIPT_PURPOSE)
+    if args.workers < 1:
+        raise ValueError("`--workers` must be at least one!")
+    if args.retries < 0:
+        raise ValueError("`--retries` must not be negative!")
+
+    update_database(
+        get_months(args.start_month, args.end_month),
+        platforms=list(dict.fromkeys(args.platforms)),
+        workers=args.workers,
+        retries=args.retries,
+    )
 
     logger.info(f"Successfully updated database.")
     logger.info("-" * 50)
@@ -0,0 +1,435 @@
+"""
+Functions for collecting CrowdTangle posts for many search terms at once.
+
+The CrowdTangle API limits the number of calls we can make per minute, but each
+call can take a long time to answer (up to 10,000 posts are returned at once).
+Searching one domain at a time, and sleeping before every call, leaves most of
+that quota unused. Instead, several domains are searched concurrently by asyncio
+tasks that all share one token-bucket rate limiter, so calls never exceed the
+quota no matter how many domains are in flight. Each task keeps the pagination
+state of its own domain and retries failed or empty queries with the same limits
+and exponential backoff as before. The (blocking) HTTP calls run in a pool of
+threads, through one `CrowdTangleClient` (i.e., a pool of kept-alive
+connections), and posts are written out as each response streams in.
+
+Each domain's posts are written to its own segment, which is checkpointed after
+every query (see `segmented_output`). Completed domains are skipped and the
+others continue from their last checkpoint, so an interrupted collection can be
+restarted without querying anything twice.
+"""
+import asyncio
+import datetime
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# count = 10000 only if you request it, otherwise it's 100
+# NOTE: This is more than `ct_get_search_posts` says is allowed because we
+# requested increased API limits from CrowdTangle folks.
+NUMBER_OF_POSTS_PER_CALL = 10_000
+
+# Maximum number of calls made per minute, across all domains (one call every 8
+# seconds, as when domains were searched one at a time)
+MAX_CALLS_PER_MINUTE = 7.5
+
+# Number of domains searched at the same time
+MAX_CONCURRENT_DOMAINS = 4
+
+# Base number of seconds to wait after encountering an error, raised to the number of try counts
+WAIT_BTWN_ERROR_BASE = 2
+
+# Maximum number of times to retry (*consecutive* failures) for a single domain
+MAX_ATTEMPTS = 5
+
+# Maximum number of times to retry (*consecutive* failures) for domains that return no posts
+MAX_EMPTY_ATTEMPTS = 2
+
+# Maximum number of queries for a single domain (~5M posts)
+MAX_QUERIES_PER_DOMAIN = 500
+
+CT_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class TokenBucket:
+    """
+    An asyncio token-bucket rate limiter.
+
+    Tokens are added at a constant `rate` (per second), up to `capacity`, and
+    each call to `acquire` takes one. Callers are served in the order they
+    arrive, so no domain is starved by the others.
+    """
+
+    def __init__(self, rate, capacity=1):
+        """
+        Initialize a full bucket.
+
+        Parameters:
+            - rate (float): number of tokens added per second
+            - capacity (int): the maximum number of tokens, i.e. the number of
+                calls that can be made at once after a pause. Default: 1 (calls
+                are always spread at least 1 / `rate` seconds apart)
+
+        Exceptions:
+            - ValueError
+        """
+        if rate <= 0:
+            raise ValueError("`rate` must be greater than zero!")
+        if capacity < 1:
+            raise ValueError("`capacity` must be at least one!")
+
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        # Created in `acquire`, so the lock belongs to the running event loop
+        self._lock = None
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _stream_posts_page(client, domain, start, end, segment):
+    """
+    Run one search query for `domain` in the period [start, end] and write each
+    post to `segment` as it is decoded (see `CrowdTangleClient.iter_search_posts`).
+
+    Returns the number of posts written, the dates of the first (most recent) and
+    last (oldest) ones (None if there are none) and the exception that ended the
+    response early, if any. Exceptions raised before any post was written are not
+    caught.
+    """
+    num_posts = 0
+    most_recent_date_str = None
+    oldest_date_str = None
+    posts = client.iter_search_posts(
+        count=NUMBER_OF_POSTS_PER_CALL,
+        start_time=start,
+        end_time=end,
+        include_history=None,
+        sort_by="date",
+        types=None,
+        search_term=domain,
+        account_types=None,
+        min_interactions=0,
+        offset=0,
+        platforms="facebook",
+        lang=None,
+    )
+    try:
+        for post, post_json in posts:
+            segment.write_post(post_json)
+            if num_posts == 0:
+                most_recent_date_str = post["date"]
+            oldest_date_str = post["date"]
+            num_posts += 1
+    except Exception as e:
+        if num_posts == 0:
+            raise
+        # The posts written so far are kept, so the next query must start after them
+        return num_posts, most_recent_date_str, oldest_date_str, e
+    return num_posts, most_recent_date_str, oldest_date_str, None
+
+
+async def _wait_before_retry(try_count, log):
+    """Wait WAIT_BTWN_ERROR_BASE**`try_count` seconds before retrying a query."""
+    wait_time = WAIT_BTWN_ERROR_BASE**try_count
+    if wait_time > 60:
+        log(f"Waiting {wait_time / 60} minutes...")
+    else:
+        log(f"Waiting {wait_time} seconds...")
+    await asyncio.sleep(wait_time)
+    log("Retrying...")
+
+
+async def collect_domain_posts(
+    domain,
+    start_date,
+    end_date,
+    client,
+    limiter,
+    segment,
+    logger,
+    executor=None,
+):
+    """
+    Collect all Facebook posts that match `domain` between `start_date` and
+    `end_date`.
+
+    Posts are returned most recent first, so each query moves the end of the
+    period back to (one second before) the oldest post returned so far, until
+    the start of the period is reached. The segment is checkpointed after each
+    query, and a segment with a checkpoint continues from its cursor.
+
+    Parameters:
+    -----------
+    - domain (str) : the search term
+    - start_date (datetime) : the earliest time at which a post could be posted
+    - end_date (datetime) : the latest time at which a post could be posted
+    - client (CrowdTangleClient) : the client used to query CrowdTangle
+    - limiter (TokenBucket) : rate limiter shared by all domains
+    - segment (segmented_output.DomainSegment) : the domain's (open) segment. It
+        is marked as completed once all posts are collected.
+    - logger : logging object
+    - executor (concurrent.futures.Executor) : the executor that runs HTTP calls.
+        Default = None (the event loop's default executor)
+
+    Returns:
+    -----------
+    - total_posts (int) : the number of posts collected (including those of
+        previous runs)
+    """
+
+    def log(msg):
+        logger.info(f"[{domain}] {msg}")
+
+    total_posts = segment.num_posts
+    try_count = 0
+    query_count = 0
+    zero_post_count = 0
+    completed = False
+
+    loop = asyncio.get_running_loop()
+    end = end_date
+    if segment.cursor is not None:
+        end = segment.cursor
+        log(f"Continuing from checkpoint ({total_posts:,} posts), end date: {end}")
+    while True:
+        try:
+            # Posts are written as they are returned. We sort by `date` so the
+            # MOST RECENT post will be the first one.
+            await limiter.acquire()
+            (
+                num_posts,
+                most_recent_date_str,
+                oldest_date_str,
+                stream_error,
+            ) = await loop.run_in_executor(
+                executor,
+                _stream_posts_page,
+                client,
+                domain,
+                start_date,
+                end,
+                segment,
+            )
+
+        except Exception as e:
+            # Includes CrowdTangle's error message, if any
+            logger.exception(f"[{domain}] {e}")
+
+            # Handle the retries...
+            try_count += 1
+            log(f"There are {MAX_ATTEMPTS - try_count} tries left.")
+            if (MAX_ATTEMPTS - try_count) <= 0:
+                log("Breaking out of loop!")
+                break
+            await _wait_before_retry(try_count, log)
+            continue
+
+        # Returned CT results successfully, with zero posts
+        if num_posts == 0:
+            log("Zero posts were returned.")
+            try_count += 1
+            zero_post_count += 1
+            log(f"Empty retries remaining: {MAX_EMPTY_ATTEMPTS - zero_post_count}")
+            log(f"Total retries remaining: {MAX_ATTEMPTS - try_count}")
+            if zero_post_count >= MAX_EMPTY_ATTEMPTS:
+                log(f"{MAX_EMPTY_ATTEMPTS} consecutive queries with no posts.")
+                log("Breaking out of loop!")
+                completed = True
+                break
+            elif (MAX_ATTEMPTS - try_count) <= 0:
+                log("Breaking out of loop!")
+                break
+            await _wait_before_retry(try_count, log)
+            continue
+
+        if stream_error is not None:
+            # The response ended early, after some posts were written. Continue
+            # from the oldest of them, but count the error as a failed try.
+            logger.error(f"[{domain}] Response ended early: {stream_error}")
+            try_count += 1
+            log(f"There are {MAX_ATTEMPTS - try_count} tries left.")
+        else:
+            # Returned CT results successfully, with new posts. Reset the retry counts.
+            try_count = 0
+            zero_post_count = 0
+
+        log(f"\t|--> {oldest_date_str} - {most_recent_date_str}: {num_posts:,} posts.")
+        total_posts += num_posts
+        log(f"Total posts collected: {total_posts:,}")
+
+        # Update the time period we're searching.
+        # ---------------------------------------
+        # Facebook returns data in backwards order, meaning more recent posts are
+        # provided first. If we do not have all data it means that we are missing
+        # OLDER data. So we update the `end` time period (which is the most recent
+        # time parameter) with the oldest/earliest post we find and ensure we do
+        # not pull the same data twice by subtracting by one second to make sure
+        # there is no overlap.
+        # ---------------------------------------
+        oldest_date_dt = datetime.datetime.strptime(oldest_date_str, CT_DATE_FORMAT)
+        oldest_date_dt = oldest_date_dt - datetime.timedelta(seconds=1)
+        end = oldest_date_dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+        # Keep this query's posts, and where the next query starts
+        segment.commit_page(end)
+
+        # If this is true, we have a bad query. (start_date is a date object)
+        empty_time = datetime.time(0, 0, 0)
+        if oldest_date_dt <= datetime.datetime.combine(start_date, empty_time):
+            log("\t|--> end <= start so we have all data.")
+            completed = True
+            break
+
+        # More than MAX_QUERIES_PER_DOMAIN queries, we move on to the next domain
+        query_count += 1
+        if query_count > MAX_QUERIES_PER_DOMAIN:
+            completed = True
+            break
+
+        # If all conditionals are passed, we query with the new end date
+        log(f"\t|--> New end date: {end}")
+
+        if stream_error is not None:
+            if (MAX_ATTEMPTS - try_count) <= 0:
+                log("Breaking out of loop!")
+                break
+            await _wait_before_retry(try_count, log)
+
+    # Domains that ran out of retries are collected again by the next run
+    if completed:
+        segment.mark_completed()
+    else:
+        log("Not completed, it will continue from its checkpoint next time.")
+    return total_posts
+
+
+async def _collect_posts(
+    domains,
+    start_date,
+    end_date,
+    client,
+    output,
+    logger,
+    max_concurrent_domains,
+    calls_per_minute,
+):
+    """Run `collect_posts` in the running event loop."""
+    limiter = TokenBucket(calls_per_minute / 60)
+    num_domains = len(domains)
+    domain_posts = dict()
+    remaining_domains = iter(enumerate(domains, start=1))
+
+    async def collect_remaining_domains(executor):
+        # Tasks share one iterator, so each domain is collected by a single task
+        for idx, domain in remaining_domains:
+            logger.info(
+                f"Collect posts matching domain {idx} of {num_domains}: {domain}"
+            )
+            with output.open_segment(domain) as segment:
+                if segment.completed:
+                    logger.info(
+                        f"[{domain}] Already completed ({segment.num_posts:,} posts)"
+                    )
+                    domain_posts[domain] = segment.num_posts
+                    continue
+                domain_posts[domain] = await collect_domain_posts(
+                    domain,
+                    start_date,
+                    end_date,
+                    client,
+                    limiter,
+                    segment,
+                    logger,
+                    executor=executor,
+                )
+            logger.info(f"Completed domain {idx} of {num_domains}: {domain}")
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_domains) as executor:
+        await asyncio.gather(
+            *(
+                collect_remaining_domains(executor)
+                for _ in range(max_concurrent_domains)
+            )
+        )
+
+    return {domain: domain_posts[domain] for domain in domains}
+
+
+def collect_posts(
+    domains,
+    start_date,
+    end_date,
+    client,
+    output,
+    logger,
+    max_concurrent_domains=MAX_CONCURRENT_DOMAINS,
+    calls_per_minute=MAX_CALLS_PER_MINUTE,
+):
+    """
+    Collect all Facebook posts that match each domain between `start_date` and
+    `end_date` (see `collect_domain_posts`), searching up to
+    `max_concurrent_domains` domains at the same time.
+
+    Each domain's posts are written to its own segment of `output`, and domains
+    completed by a previous run are skipped. Concatenate the segments with
+    `output.concatenate` afterwards.
+
+    Parameters:
+    -----------
+    - domains (list[str]) : the search terms
+    - start_date (datetime) : the earliest time at which a post could be posted
+    - end_date (datetime) : the latest time at which a post could be posted
+    - client (CrowdTangleClient) : the client used to query CrowdTangle. Its
+        pool should hold at least `max_concurrent_domains` connections.
+    - output (segmented_output.SegmentedOutput) : the segments of the output
+        file. Its domains should be `domains`.
+    - logger : logging object
+    - max_concurrent_domains (int) : the number of domains searched at the same
+        time. Default = MAX_CONCURRENT_DOMAINS
+    - calls_per_minute (float) : the maximum number of calls made per minute,
+        across all domains. Default = MAX_CALLS_PER_MINUTE
+
+    Returns:
+    -----------
+    - domain_posts (dict) : {domain : the number of posts collected (including
+        those of previous runs)}
+
+    Exceptions:
+    -----------
+    - TypeError, ValueError
+    """
+    if not isinstance(domains, list):
+        raise TypeError("`domains` must be a list!")
+    if not isinstance(max_concurrent_domains, int):
+        raise TypeError("`max_concurrent_domains` must be an integer!")
+    if max_concurrent_domains < 1:
+        raise ValueError("`max_concurrent_domains` must be at least one!")
+
+    return asyncio.run(
+        _collect_posts(
+            domains,
+            start_date,
+            end_date,
+            client,
+            output,
+            logger,
+            max_concurrent_domains,
+            calls_per_minute,
+        )
+    )
@@ -1,8 +1,78 @@
 """
 Functions used to communicate with CrowdTangle API
 """
+import codecs
+import json
+import re
+
 import requests
 
+from requests.adapters import HTTPAdapter
+
+# The CrowdTangle search endpoint
+CT_SEARCH_URL = "https://api.crowdtangle.com/posts/search"
+
+# Seconds to wait for a connection to the API, and between bytes of a response
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+
+# Number of (decompressed) bytes of a response read at a time when streaming posts
+STREAM_CHUNK_SIZE = 2**20
+
+# The start of the list of posts in a search response, and the separators
+# between posts
+_POSTS_START_REGEX = re.compile(r'"posts"\s*:\s*\[')
+_SEPARATOR_REGEX = re.compile(r"[\s,]*")
+
+
+def _get_search_params(
+    count=100,
+    start_time=None,
+    end_time=None,
+    include_history=None,
+    sort_by="date",
+    types=None,
+    search_term=None,
+    account_types=None,
+    min_interactions=0,
+    offset=0,
+    api_token=None,
+    platforms="facebook,instagram",
+    lang=None,
+):
+    """
+    Return the request parameters of a search query (see `ct_get_search_posts`
+    for details on each parameter).
+    """
+    # Defining a params dict for the parameters to be sent to the API
+    PARAMS = {
+        "count": count,
+        "sortBy": sort_by,
+        "token": api_token,
+        "minInteractions": min_interactions,
+        "offset": offset,
+    }
+
+    # add params parameters
+    if start_time:
+        PARAMS["startDate"] = start_time
+    if end_time:
+        PARAMS["endDate"] = end_time
+    if include_history == "true":
+        PARAMS["includeHistory"] = include_history
+    if types:
+        PARAMS["types"] = types
+    if account_types:
+        PARAMS["accountTypes"] = account_types
+    if search_term:
+        PARAMS["searchTerm"] = search_term
+    if platforms:
+        PARAMS["platforms"] = platforms
+    if lang:
+        PARAMS["language"] = lang
+
+    return PARAMS
+
 
 def ct_get_search_posts(
     count=100,
@@ -18,6 +88,7 @@ def ct_get_search_posts(
     api_token=None,
     platforms="facebook,instagram",
     lang=None,
+    url_base=CT_SEARCH_URL,
 ):
     """
     Retrieve posts from Facebook/Instagram based on the passed parameters.
@@ -94,6 +165,9 @@ def ct_get_search_posts(
             Default: None (no restrictions)
             Options: 2-letter code found in reference below. See ref above for some exceptions.
             REF:https://en.wikipedia.org/wiki/List_of_ISO_639-1_codes
+        - url_base (str, optional): URL of the search endpoint (e.g., a local stub server
+            for testing).
+            Default: CT_SEARCH_URL
     Returns:
         [dict]: The Response contains both a status code and a result. The status will always
             be 200 if there is no error. The result contains an array of post objects and a
@@ -102,39 +176,173 @@ def ct_get_search_posts(
         ct_get_posts(include_history = 'true', api_token="AKJHXDFYTGEBKRJ6535")
     """
 
-    # API-endpoint
-    URL_BASE = "https://api.crowdtangle.com/posts/search"
-    # Defining a params dict for the parameters to be sent to the API
-    PARAMS = {
-        "count": count,
-        "sortBy": sort_by,
-        "token": api_token,
-        "minInteractions": min_interactions,
-        "offset": offset,
-    }
-
-    # add params parameters
-    if start_time:
-        PARAMS["startDate"] = start_time
-    if end_time:
-        PARAMS["endDate"] = end_time
-    if include_history == "true":
-        PARAMS["includeHistory"] = include_history
-    if types:
-        PARAMS["types"] = types
-    if account_types:
-        PARAMS["accountTypes"] = account_types
-    if search_term:
-        PARAMS["searchTerm"] = search_term
-    if platforms:
-        PARAMS["platforms"] = platforms
-    if lang:
-        PARAMS["language"] = lang
+    PARAMS = _get_search_params(
+        count=count,
+        start_time=start_time,
+        end_time=end_time,
+        include_history=include_history,
+        sort_by=sort_by,
+        types=types,
+        search_term=search_term,
+        account_types=account_types,
+        min_interactions=min_interactions,
+        offset=offset,
+        api_token=api_token,
+        platforms=platforms,
+        lang=lang,
+    )
 
     # sending get request and saving the response as response object
-    r = requests.get(url=URL_BASE, params=PARAMS)
+    r = requests.get(url=url_base, params=PARAMS)
     if r.status_code != 200:
         print(f"status: {r.status_code}")
         print(f"reason: {r.reason}")
         print(f"details: {r.raise_for_status()}")
     return r
+
+
+def iter_response_posts(chunks):
+    """
+    Decode the posts of a search response one at a time, as its body arrives,
+    so that only one chunk of the body (and one post) is held in memory.
+
+    Parameters:
+        - chunks (iterable[bytes]): the (decompressed) body of a search response,
+            in chunks of any size
+
+    Yields:
+        - (post, post_json) (tuple): each post (dict), in the order of the
+            response, and its JSON text (on a single line)
+
+    Exceptions:
+        - ValueError: if the body has no list of posts (e.g., an error message,
+            which is included) or ends before the end of the list
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    # Position in `buffer` of the next post, None until the list of posts is found
+    position = None
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        if position is None:
+            match = _POSTS_START_REGEX.search(buffer)
+            if match is None:
+                continue
+            position = match.end()
+
+        while True:
+            position = _SEPARATOR_REGEX.match(buffer, position).end()
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                post, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The rest of the post has not arrived yet
+                break
+
+            post_json = buffer[position:end]
+            if "\n" in post_json:
+                post_json = json.dumps(post)
+            yield post, post_json
+            position = end
+
+        buffer = buffer[position:]
+        position = 0
+
+    buffer += text_decoder.decode(b"", final=True)
+    if position is None:
+        raise ValueError(f"No posts in the response: {buffer[:1000]}")
+    raise ValueError("The response ended before the end of the list of posts!")
+
+
+class CrowdTangleClient:
+    """
+    A client for the CrowdTangle search endpoint that reuses its connections.
+
+    All queries go through one `requests.Session`, so connections are kept alive
+    and reused (one TCP+TLS handshake per pooled connection, instead of one per
+    query). Responses are gzip/deflate compressed, every query has a connect and
+    read timeout, and posts are decoded one at a time while the response streams
+    in (see `iter_response_posts`).
+
+    Example:
+    with CrowdTangleClient(api_token) as client:
+        for post, post_json in client.iter_search_posts(search_term="example.com"):
+            ...
+    """
+
+    def __init__(
+        self,
+        api_token,
+        url_base=CT_SEARCH_URL,
+        pool_size=10,
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    ):
+        """
+        Create the client's session.
+
+        Parameters:
+            - api_token (str): the API token needed to pull data
+            - url_base (str): URL of the search endpoint (e.g., a local stub
+                server for testing). Default: CT_SEARCH_URL
+            - pool_size (int): the maximum number of connections kept alive,
+                i.e. the number of queries that can run at the same time (from
+                different threads) without opening new connections. Default: 10
+            - timeout (tuple): seconds to wait for a connection and between bytes
+                of a response. Default: (CONNECT_TIMEOUT, READ_TIMEOUT)
+        """
+        self.api_token = api_token
+        self.url_base = url_base
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+        )
+
+    def iter_search_posts(self, **search_params):
+        """
+        Run one search query and yield its posts as the response streams in.
+
+        Parameters:
+            - search_params: parameters of the query, as the keyword arguments of
+                `ct_get_search_posts` (except `api_token` and `url_base`)
+
+        Yields:
+            - (post, post_json) (tuple): each post (dict), most recent first if
+                sorted by date, and its JSON text (on a single line)
+
+        Exceptions:
+            - requests.HTTPError: if the query fails (status code other than 200)
+            - ValueError: see `iter_response_posts`
+        """
+        params = _get_search_params(api_token=self.api_token, **search_params)
+        with self.session.get(
+            self.url_base, params=params, timeout=self.timeout, stream=True
+        ) as response:
+            if response.status_code != 200:
+                # Include CrowdTangle's error message, if any
+                raise requests.HTTPError(
+                    f"status: {response.status_code}, reason: {response.reason}, "
+                    f"details: {response.text[:1000]}",
+                    response=response,
+                )
+            yield from iter_response_posts(
+                response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            )
+
+    def close(self):
+        """Close all pooled connections."""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
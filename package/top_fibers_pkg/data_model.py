@@ -4,11 +4,118 @@ fib calculation scripts.
 """
 import datetime
 
+from functools import lru_cache
 from .data import get_dict_val
 
 TWITTER_V1_DT_CONVERSION_STR = "%a %b %d %H:%M:%S %z %Y"
 TWITTER_V2_DT_CONVERSION_STR = None  # TODO: Update when V2 added
 CROWDTANGLE_DT_CONVERSION_STR = "%Y-%m-%d %H:%M:%S"
+TWITTER_V1_POST_URL_TEMPLATE = "https://twitter.com/{username}/status/{post_id}"
+
+# Number of raw time strings whose timestamps are cached. Retweets and quotes
+# repeat the original tweet's time string, so many lookups are cache hits.
+TIMESTAMP_CACHE_SIZE = 2**18
+
+_MONTH_NUMS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_twitter_v1_timestamp(created_at):
+    """
+    Convert a Twitter V1 "created_at" time to an epoch timestamp.
+
+    The fixed format (e.g., "Wed Oct 10 20:19:24 +0000 2018") is parsed by
+    position, which is much faster than `datetime.strptime`. Any other string is
+    passed to `datetime.strptime` with TWITTER_V1_DT_CONVERSION_STR.
+
+    Parameters:
+    -----------
+    - created_at (str) : the "created_at" time of a tweet
+
+    Returns:
+    -----------
+    - timestamp (int or None) : epoch seconds, or None if `created_at` is invalid
+    """
+    try:
+        if (
+            len(created_at) == 30
+            and created_at[19] == " "
+            and created_at[20] in "+-"
+            and created_at[25] == " "
+        ):
+            offset = int(created_at[21:23]) * 3600 + int(created_at[23:25]) * 60
+            if created_at[20] == "-":
+                offset = -offset
+            dt_obj = datetime.datetime(
+                int(created_at[26:30]),
+                _MONTH_NUMS[created_at[4:7]],
+                int(created_at[8:10]),
+                int(created_at[11:13]),
+                int(created_at[14:16]),
+                int(created_at[17:19]),
+                tzinfo=datetime.timezone.utc,
+            )
+            return int(dt_obj.timestamp()) - offset
+
+        dt_obj = datetime.datetime.strptime(created_at, TWITTER_V1_DT_CONVERSION_STR)
+        return int(dt_obj.timestamp())
+    except:
+        return None
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_crowdtangle_timestamp(created_at):
+    """
+    Convert a CrowdTangle "date" time to an epoch timestamp.
+
+    The fixed format (e.g., "2022-10-10 20:19:24") is parsed by position, which is
+    much faster than `datetime.strptime`. Any other string is passed to
+    `datetime.strptime` with CROWDTANGLE_DT_CONVERSION_STR. Like before, times are
+    naive and so they are interpreted in the machine's local time zone.
+
+    Parameters:
+    -----------
+    - created_at (str) : the "date" time of a CrowdTangle post
+
+    Returns:
+    -----------
+    - timestamp (int or None) : epoch seconds, or None if `created_at` is invalid
+    """
+    try:
+        if (
+            len(created_at) == 19
+            and created_at[4] == "-"
+            and created_at[7] == "-"
+            and created_at[10] == " "
+        ):
+            dt_obj = datetime.datetime(
+                int(created_at[0:4]),
+                int(created_at[5:7]),
+                int(created_at[8:10]),
+                int(created_at[11:13]),
+                int(created_at[14:16]),
+                int(created_at[17:19]),
+            )
+        else:
+            dt_obj = datetime.datetime.strptime(
+                created_at, CROWDTANGLE_DT_CONVERSION_STR
+            )
+        return int(dt_obj.timestamp())
+    except:
+        return None
 
 
 class PostBase:
@@ -60,6 +167,12 @@ class PostBase:
         """
         raise NotImplementedError
 
+    def get_post_timestamp(self):
+        """
+        Get the time a post was shared as an integer epoch timestamp.
+        """
+        raise NotImplementedError
+
     def get_reshare_count(self):
         """
         Return the number of times that the post was reshared
@@ -151,13 +264,15 @@ class Tweet_v1(PostBase):
         created_at = self.get_value(["created_at"])
         if not timestamp:
             return created_at
-        try:
-            dt_obj = datetime.datetime.strptime(
-                created_at, TWITTER_V1_DT_CONVERSION_STR
-            )
-            return str(int(dt_obj.timestamp()))
-        except:
-            return None
+        post_timestamp = parse_twitter_v1_timestamp(created_at)
+        return None if post_timestamp is None else str(post_timestamp)
+
+    def get_post_timestamp(self):
+        """
+        Return the "created_at" post time of a post as an integer epoch timestamp.
+        None is returned if the time is missing or invalid.
+        """
+        return parse_twitter_v1_timestamp(self.get_value(["created_at"]))
 
     def get_reshare_count(self):
         """
@@ -178,8 +293,8 @@ class Tweet_v1(PostBase):
         Return the link to the tweet (str)
         so that one can click it and check the tweet in a web browser
         """
-        return (
-            f"https://twitter.com/{self.get_user_handle()}/status/{self.get_post_ID()}"
+        return TWITTER_V1_POST_URL_TEMPLATE.format(
+            username=self.get_user_handle(), post_id=self.get_post_ID()
         )
 
     def get_user_ID(self):
@@ -286,13 +401,15 @@ class FbIgPost(PostBase):
         created_at = self.get_value(["date"])
         if not timestamp:
             return created_at
-        try:
-            dt_obj = datetime.datetime.strptime(
-                created_at, CROWDTANGLE_DT_CONVERSION_STR
-            )
-            return str(int(dt_obj.timestamp()))
-        except:
-            return None
+        post_timestamp = parse_crowdtangle_timestamp(created_at)
+        return None if post_timestamp is None else str(post_timestamp)
+
+    def get_post_timestamp(self):
+        """
+        Return the "date" field as an integer epoch timestamp. None is returned if
+        the time is missing or invalid.
+        """
+        return parse_crowdtangle_timestamp(self.get_value(["date"]))
 
     def get_reshare_count(self):
         """
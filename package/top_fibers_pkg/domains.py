@@ -0,0 +1,168 @@
+"""
+Functions for loading the iffy list of domains and matching URLs against it.
+
+Matching a URL by taking the last two labels of its host (e.g., "co.uk" for
+"www.dailyexpose.co.uk") is wrong for domains under multi-label suffixes and for
+listed subdomains (e.g., "de.rt.com"). A `DomainMatcher` is instead compiled
+once from the list into a trie of reversed host labels ("com" -> "rt" -> "de"),
+so a host matches if it is a listed domain or any subdomain of one. Hosts are
+extracted with a single regular expression (no full `urlparse`) and the result
+of each host lookup is cached, since the same hosts appear over and over again.
+
+Some list entries include a path (e.g., "stormfront.org/forum"). URLs on those
+hosts only match if their path starts with the listed one.
+"""
+import glob
+import os
+import re
+
+from functools import lru_cache
+from .utils import load_lines
+
+# Number of hosts whose lookups are cached by each DomainMatcher
+HOST_CACHE_SIZE = 2**16
+
+# Optional scheme and user info, then the host (group 1), an optional port and
+# the path (group 2)
+_URL_REGEX = re.compile(
+    r"(?:[A-Za-z][A-Za-z0-9+.-]*://)?(?:[^/?#@]*@)?([^/?#:]*)(?::[0-9]*)?([^?#]*)"
+)
+
+# Key of a trie node that marks the end of a listed domain. Labels are never None.
+_END = None
+
+# Path prefixes of a host that matches regardless of the path
+_ANY_PATH = ("",)
+
+
+def load_domains(domains_dir):
+    """
+    Loads the **latest** iffy list of domains given the proper directory path.
+    Prepare them for matching by stripping extra text (e.g., "https://", "http://", "*")
+
+    Parameters
+    ------------
+    - domains_dir (str) : path to the iffy_list directory
+
+    Returns
+    ------------
+    - domains (list) : list of domains (some may include a path, e.g.,
+        "stormfront.org/forum")
+    """
+    all_domains_files = sorted(glob.glob(os.path.join(domains_dir, "*iffy_list.txt")))
+    latest_domains_filepath = all_domains_files[-1]
+
+    # Load domains to match in below query and clean up
+    domains = load_lines(latest_domains_filepath)
+    domains = [domain.replace("https://", "") for domain in domains]
+    domains = [domain.replace("http://", "") for domain in domains]
+    domains = [domain.replace("www.", "") for domain in domains]
+    domains = [domain.rstrip("/*") for domain in domains]
+    return domains
+
+
+class DomainMatcher:
+    """
+    Match URLs against a list of domains.
+
+    A URL matches if its host is one of the domains or a subdomain of one (e.g.,
+    "www.dailyexpose.co.uk" matches "dailyexpose.co.uk", but not "co.uk"), and,
+    for domains listed with a path, if the URL's path starts with that path.
+    """
+
+    def __init__(self, domains):
+        """
+        Compile `domains` into a trie of reversed host labels.
+
+        Parameters:
+            - domains (list[str]): domains to match, as returned by
+                `load_domains` (e.g., "example.com" or "example.com/some/path")
+
+        Exceptions:
+            - TypeError
+        """
+        if isinstance(domains, str):
+            raise TypeError("`domains` must be a list of strings, not a string!")
+
+        self.domains = list(domains)
+        self._trie = dict()
+        for domain in self.domains:
+            if not isinstance(domain, str):
+                raise TypeError("All `domains` must be strings!")
+            self._add_domain(domain)
+        self._build_host_cache()
+
+    def _add_domain(self, domain):
+        """Add a single domain (with an optional path) to the trie."""
+        host, _, path = domain.strip().partition("/")
+        host = host.lower().rstrip(".")
+        if host.startswith("www."):
+            host = host[len("www.") :]
+        if not host:
+            return
+
+        node = self._trie
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, dict())
+
+        # An empty path prefix matches any path
+        path_prefix = f"/{path}" if path else ""
+        node.setdefault(_END, set()).add(path_prefix)
+
+    def _build_host_cache(self):
+        """Wrap the trie lookup of each host in a (per matcher) LRU cache."""
+        self._lookup_host = lru_cache(maxsize=HOST_CACHE_SIZE)(self._find_host)
+
+    def _find_host(self, host):
+        """
+        Return the path prefixes of all listed domains that `host` is (a
+        subdomain of), _ANY_PATH if any of them matches all paths, or None if
+        there are none.
+        """
+        path_prefixes = []
+        node = self._trie
+        for label in reversed(host.lower().rstrip(".").split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            if _END in node:
+                if "" in node[_END]:
+                    return _ANY_PATH
+                path_prefixes.extend(node[_END])
+        return tuple(path_prefixes) or None
+
+    def matches(self, url):
+        """
+        Return True if `url` matches one of the domains (see the class docstring).
+
+        Parameters:
+            - url (str): full URL. Anything that is not a string (e.g., a missing
+                URL) does not match.
+
+        Returns:
+            - (bool)
+        """
+        if not isinstance(url, str):
+            return False
+
+        host, path = _URL_REGEX.match(url).groups()
+        path_prefixes = self._lookup_host(host)
+        if path_prefixes is None:
+            return False
+        if path_prefixes is _ANY_PATH:
+            return True
+        return any(path.startswith(prefix) for prefix in path_prefixes)
+
+    def __getstate__(self):
+        """
+        Exclude the host cache when pickling (e.g., to send a matcher to other
+        processes). It is rebuilt, empty, by `__setstate__`.
+        """
+        state = self.__dict__.copy()
+        del state["_lookup_host"]
+        return state
+
+    def __setstate__(self, state):
+        """Restore a pickled matcher and rebuild its host cache."""
+        self.__dict__.update(state)
+        self._build_host_cache()
@@ -1,9 +1,16 @@
 """
 A collection of functions that are utilized in the calc_fib_indices.py script.
+
+Functions that work with the data extracted from raw files accept either the
+original dictionaries or an `InternedPostStore` holding the same information.
 """
+import numpy as np
 import pandas as pd
 
 from collections import defaultdict, Counter
+from .data_model import TWITTER_V1_POST_URL_TEMPLATE
+from .interned_store import InternedPostStore
+from .projection import TWITTER_V1_TWEET_FIELDS
 
 
 def calc_fib_index(rt_counts):
@@ -35,14 +42,130 @@ def calc_fib_index(rt_counts):
     return fib_position
 
 
-def create_userid_total_reshares(postid_num_reshares, userid_postids):
+def calc_fib_indices_batch(rt_counts, offsets):
+    """
+    Calculate the FIB-index of many users at once.
+
+    Reshare counts for all users are passed as one flat array, with `offsets`
+    marking where each user's counts begin and end (CSR layout). That is, the
+    counts for user `i` are `rt_counts[offsets[i]:offsets[i + 1]]`.
+
+    All segments are sorted in a single pass (descending within each user) and
+    each count is compared against its rank within its segment. Because the
+    sorted counts decrease while the ranks increase, a user's FIB-index is simply
+    the number of positions where count >= rank. Results are identical to calling
+    `calc_fib_index` on each user's list.
+
+    Example:
+    calc_fib_indices_batch(rt_counts=[5, 1, 3, 0, 2, 2], offsets=[0, 3, 4, 6])
+    >>> array([2, 0, 2])
+
+    Parameters:
+    -----------
+    - rt_counts (array-like) : flat array of reshare counts for all users
+    - offsets (array-like) : monotonically increasing integer array of length
+        `num_users + 1`, with offsets[0] == 0 and offsets[-1] == len(rt_counts)
+
+    Return:
+    -----------
+    - fib_indices (numpy.ndarray) : each user's FIB index (int64), in the same
+        order as the segments defined by `offsets`
+
+    Errors:
+    -----------
+    - ValueError
+    """
+    rt_counts = np.asarray(rt_counts)
+    offsets = np.asarray(offsets, dtype=np.int64)
+
+    # Unsigned counts would wrap around when negated for the descending sort
+    if rt_counts.dtype.kind == "u":
+        rt_counts = rt_counts.astype(np.int64)
+
+    if rt_counts.ndim != 1 or offsets.ndim != 1:
+        raise ValueError("`rt_counts` and `offsets` must be one-dimensional!")
+    if len(offsets) == 0 or offsets[0] != 0 or offsets[-1] != len(rt_counts):
+        raise ValueError(
+            "`offsets` must start at 0 and end at the length of `rt_counts`!"
+        )
+
+    seg_lengths = np.diff(offsets)
+    if np.any(seg_lengths < 0):
+        raise ValueError("`offsets` must be monotonically increasing!")
+
+    num_users = len(seg_lengths)
+    if len(rt_counts) == 0:
+        return np.zeros(num_users, dtype=np.int64)
+
+    # Segment (user) index of every count. int32 halves temporary memory when
+    # there are few enough users.
+    seg_dtype = np.int32 if num_users < 2**31 else np.int64
+    seg_ids = np.repeat(np.arange(num_users, dtype=seg_dtype), seg_lengths)
+
+    # Sort by segment, then by count in descending order within the segment.
+    # For non-negative integer counts both keys are packed into a single int64
+    # so that one (much faster) value sort suffices.
+    max_count = int(rt_counts.max())
+    min_count = int(rt_counts.min())
+    packable = (
+        rt_counts.dtype.kind == "i"
+        and min_count >= 0
+        and num_users * (max_count + 1) < 2**62
+    )
+    if packable:
+        sorted_counts = seg_ids.astype(np.int64)
+        sorted_counts *= max_count + 1
+        sorted_counts += max_count
+        sorted_counts -= rt_counts
+        sorted_counts.sort()
+        sorted_counts %= max_count + 1
+        np.subtract(max_count, sorted_counts, out=sorted_counts)
+    else:
+        order = np.lexsort((-rt_counts, seg_ids))
+        sorted_counts = rt_counts[order]
+        del order
+
+    # seg_ids are already grouped, so ordering does not change them. The
+    # 1-based rank of each count within its segment then comes from the offsets.
+    ranks = np.arange(1, len(rt_counts) + 1, dtype=np.int64)
+    ranks -= offsets[:-1][seg_ids]
+
+    meets_criteria = sorted_counts >= ranks
+    del sorted_counts, ranks
+    return np.bincount(seg_ids[meets_criteria], minlength=num_users).astype(
+        np.int64
+    )
+
+
+def _get_store_user_reshares(store):
+    """
+    Return the reshare counts in `store` grouped by user (CSR layout).
+
+    Parameters:
+    -----------
+    - store (InternedPostStore) : the store to read from
+
+    Returns:
+    -----------
+    - post_order (numpy.ndarray) : post indices grouped by user index
+    - offsets (numpy.ndarray) : offsets of each user's posts within `post_order`
+    - rt_counts (numpy.ndarray) : reshare counts of the posts in `post_order`
+    """
+    post_order, offsets = store.get_user_post_offsets()
+    rt_counts = store.get_post_reshares()[post_order]
+    return post_order, offsets, rt_counts
+
+
+def create_userid_total_reshares(postid_num_reshares, userid_postids=None):
     """
     Create a dictionary mapping userIDs to the total number of reshares
     that they earned across all posts.
 
     Parameters:
     -----------
-    - postid_num_reshares (dict) : {post_id_str : number of reshares in data}
+    - postid_num_reshares (dict or InternedPostStore) : {post_id_str : number of
+        reshares in data}, or a store holding all post data (in which case
+        `userid_postids` is not needed)
     - userid_postids (dict) : {userid_x : set([postids sent by userid_x])}
 
     Returns:
@@ -53,6 +176,21 @@ def create_userid_total_reshares(postid_num_reshares, userid_postids):
     -----------
     - Exception, TypeError
     """
+    if isinstance(postid_num_reshares, InternedPostStore):
+        store = postid_num_reshares
+        post_order, offsets, rt_counts = _get_store_user_reshares(store)
+
+        # Skip users left without posts (only possible if a post was re-added
+        # under a different user), as `reduceat` needs non-empty segments
+        user_idxs = np.flatnonzero(np.diff(offsets))
+        if len(user_idxs) == 0:
+            return {}
+        totals = np.add.reduceat(rt_counts, offsets[user_idxs])
+        return {
+            store.user_ids[user_idx]: int(total)
+            for user_idx, total in zip(user_idxs, totals)
+        }
+
     if not isinstance(postid_num_reshares, dict):
         raise TypeError("`postid_num_reshares` must be a dict!")
     if not isinstance(userid_postids, dict):
@@ -70,14 +208,16 @@ def create_userid_total_reshares(postid_num_reshares, userid_postids):
         raise Exception(e)
 
 
-def create_userid_reshare_lists(postid_num_reshares, userid_postids):
+def create_userid_reshare_lists(postid_num_reshares, userid_postids=None):
     """
     Create dictionaries mapping user IDs to a list of reshare counts they earned
     for all of their posts.
 
     Parameters:
     -----------
-    - postid_num_reshares (dict) : {post_id_str : number of reshares in data}
+    - postid_num_reshares (dict or InternedPostStore) : {post_id_str : number of
+        reshares in data}, or a store holding all post data (in which case
+        `userid_postids` is not needed)
     - userid_postids (dict) : {userid_x : set([postids sent by userid_x])}
 
     Returns:
@@ -88,6 +228,16 @@ def create_userid_reshare_lists(postid_num_reshares, userid_postids):
     -----------
     - Exception, TypeError
     """
+    if isinstance(postid_num_reshares, InternedPostStore):
+        store = postid_num_reshares
+        post_order, offsets, rt_counts = _get_store_user_reshares(store)
+        return {
+            store.user_ids[user_idx]: rt_counts[
+                offsets[user_idx] : offsets[user_idx + 1]
+            ].tolist()
+            for user_idx in np.flatnonzero(np.diff(offsets))
+        }
+
     if not isinstance(postid_num_reshares, dict):
         raise TypeError("`postid_num_reshares` must be a dict!")
     if not isinstance(userid_postids, dict):
@@ -151,10 +301,161 @@ def create_fib_frame(userid_reshare_lists, userid_username, userid_total_reshare
         raise Exception(e)
 
 
+def create_fib_frame_fused(
+    postid_num_reshares, userid_postids=None, userid_username=None
+):
+    """
+    Create the same dataframe as `create_fib_frame` in a single traversal of
+    `userid_postids`, without building the intermediate reshare list and total
+    reshare dictionaries, per-user record dicts, or merging two dataframes.
+
+    Reshare counts are gathered into one flat array (CSR layout) and handed to
+    `calc_fib_indices_batch`, while total reshares are taken from the cumulative
+    sum of that same array.
+
+    Parameters:
+    -----------
+    - postid_num_reshares (dict or InternedPostStore) : {post_id_str : number of
+        reshares in data}, or a store holding all post data (in which case the
+        other parameters are not needed)
+    - userid_postids (dict) : {userid_x : set([postids sent by userid_x])}
+    - userid_username (dict) : {userid : username}
+
+    Returns:
+    -----------
+    - fib_frame (pandas.DataFrame) : a dataframe containing the following columns:
+        - user_id (str) : the user's Twitter user ID
+        - username (str) : the user's username/handle
+        - fib_index (int) : the fib index for that user
+        - total_reshares (int) : total number of reshares earned by user_id
+
+    Exceptions:
+    -----------
+    - Exception, TypeError
+    """
+    if isinstance(postid_num_reshares, InternedPostStore):
+        store = postid_num_reshares
+    else:
+        store = None
+        if not isinstance(postid_num_reshares, dict):
+            raise TypeError("`postid_num_reshares` must be a dict!")
+        if not isinstance(userid_postids, dict):
+            raise TypeError("`userid_postids` must be a dict!")
+        if not isinstance(userid_username, dict):
+            raise TypeError("`userid_username` must be a dict!")
+
+    try:
+        if store is not None:
+            _, offsets, rt_counts = _get_store_user_reshares(store)
+
+            # Skip users left without posts (only possible if a post was re-added
+            # under a different user)
+            user_idxs = np.flatnonzero(np.diff(offsets))
+            if len(user_idxs) < store.num_users:
+                offsets = np.append(offsets[user_idxs], offsets[-1])
+            user_ids = [store.user_ids[user_idx] for user_idx in user_idxs]
+            usernames = [store.get_username(user_idx) for user_idx in user_idxs]
+
+        else:
+            num_users = len(userid_postids)
+            user_ids = list(userid_postids.keys())
+            usernames = [userid_username[userid] for userid in user_ids]
+
+            offsets = np.zeros(num_users + 1, dtype=np.int64)
+            np.cumsum(
+                np.fromiter(
+                    (len(post_ids) for post_ids in userid_postids.values()),
+                    dtype=np.int64,
+                    count=num_users,
+                ),
+                out=offsets[1:],
+            )
+            rt_counts = np.fromiter(
+                (
+                    postid_num_reshares[post_id]
+                    for post_ids in userid_postids.values()
+                    for post_id in post_ids
+                ),
+                dtype=np.int64,
+                count=offsets[-1],
+            )
+
+        cumulative_counts = np.zeros(len(rt_counts) + 1, dtype=np.int64)
+        np.cumsum(rt_counts, out=cumulative_counts[1:])
+        total_reshares = cumulative_counts[offsets[1:]] - cumulative_counts[offsets[:-1]]
+
+        return pd.DataFrame(
+            {
+                "user_id": user_ids,
+                "username": usernames,
+                "fib_index": calc_fib_indices_batch(rt_counts, offsets),
+                "total_reshares": total_reshares,
+            }
+        )
+
+    except Exception as e:
+        raise Exception(e)
+
+
+def get_top_k_positions(fib_frame, num, rank_type):
+    """
+    Return the positions of the top `num` rows of `fib_frame` based on `rank_type`,
+    without sorting the entire frame.
+
+    Partial selection (numpy.partition) finds the `num`-th largest value in O(n).
+    Only rows at or above that value are then sorted, in descending order of
+    `rank_type` with ties broken by ascending `user_id`, so the selection is
+    deterministic regardless of the order of the input rows.
+
+    Parameters:
+    -----------
+    - fib_frame (pandas.DataFrame) : a dataframe containing at least the `user_id`
+        and `rank_type` columns
+    - num (int) : number of top rows to return
+    - rank_type (str) : the column to utilize for ranking (descending order)
+
+    Return:
+    -----------
+    - top_positions (numpy.ndarray) : integer positions (for use with `.iloc`) of
+        the top `num` rows, in ranked order
+
+    Exceptions:
+    -----------
+    TypeError, ValueError
+    """
+    if not isinstance(fib_frame, pd.DataFrame):
+        raise TypeError("`fib_frame` must be a pd.DataFrame!")
+    if rank_type not in fib_frame.columns:
+        raise ValueError(f"`rank_type` ({rank_type}) is not a column of `fib_frame`!")
+    if not isinstance(num, int):
+        raise TypeError("`num` must be an integer!")
+    if num < 0:
+        raise ValueError("`num` must be non-negative!")
+
+    values = fib_frame[rank_type].to_numpy()
+    num_rows = len(values)
+    if num == 0 or num_rows == 0:
+        return np.array([], dtype=np.int64)
+
+    if num >= num_rows:
+        candidates = np.arange(num_rows)
+    else:
+        kth_largest = np.partition(values, num_rows - num)[num_rows - num]
+        candidates = np.flatnonzero(values >= kth_largest)
+
+    # Only the candidates (top rows plus any ties with the cutoff) are sorted
+    user_ids = fib_frame["user_id"].to_numpy()[candidates]
+    order = np.lexsort((user_ids, -values[candidates]))
+    return candidates[order[:num]]
+
+
 def get_top_spreaders(fib_frame, num, rank_type=None):
     """
     Return the top `num` spreaders of misinformation from the fib_frame.
 
+    The top spreaders are found with `get_top_k_positions`, so `fib_frame` is
+    neither sorted nor modified. Ties are broken by ascending `user_id`.
+
     Parameters:
     -----------
     - fib_frame (pandas.DataFrame) : a dataframe containing the following columns:
@@ -180,13 +481,61 @@ def get_top_spreaders(fib_frame, num, rank_type=None):
     if not isinstance(num, int):
         raise TypeError("`num` must be an integer!")
 
-    # Get top 50 users with most total retweets
-    fib_frame.sort_values(by=rank_type, ascending=False, inplace=True)
-    return set(list(fib_frame["user_id"].head(num)))
+    top_positions = get_top_k_positions(fib_frame, num, rank_type)
+    return set(fib_frame["user_id"].iloc[top_positions])
+
+
+def sort_fib_frame(fib_frame, rank_type="fib_index", num_sorted=None):
+    """
+    Sort `fib_frame` in descending order of `rank_type`, with ties broken by
+    ascending `user_id`.
+
+    If `num_sorted` is provided, only the first `num_sorted` rows are guaranteed
+    to be in sorted order (found with `get_top_k_positions`) and the remaining rows
+    follow in their original order. This is all that is required by downstream
+    consumers that only read the head of the output file (e.g., the data-loader
+    reads the first `N_ROWS` rows), and costs O(n) instead of O(n log n).
+
+    Parameters:
+    -----------
+    - fib_frame (pandas.DataFrame) : a dataframe containing at least the `user_id`
+        and `rank_type` columns
+    - rank_type (str) : the column to utilize for ranking (descending order)
+        - Options: ["total_reshares", "fib_index"]. Default: "fib_index"
+    - num_sorted (int or None) : number of leading rows to sort. If None (default),
+        the entire frame is sorted.
+
+    Return:
+    -----------
+    - sorted_frame (pandas.DataFrame) : the sorted frame, with a reset index
+
+    Exceptions:
+    -----------
+    TypeError, ValueError
+    """
+    if not isinstance(fib_frame, pd.DataFrame):
+        raise TypeError("`fib_frame` must be a pd.DataFrame!")
+    if rank_type not in ["total_reshares", "fib_index"]:
+        raise ValueError("`rank_type` must be either 'total_reshares' or 'fib_index'!")
+    if num_sorted is not None and not isinstance(num_sorted, int):
+        raise TypeError("`num_sorted` must be an integer or None!")
+
+    if num_sorted is None:
+        num_sorted = len(fib_frame)
+
+    top_positions = get_top_k_positions(fib_frame, num_sorted, rank_type)
+    is_top = np.zeros(len(fib_frame), dtype=bool)
+    is_top[top_positions] = True
+    positions = np.concatenate([top_positions, np.flatnonzero(~is_top)])
+    return fib_frame.iloc[positions].reset_index(drop=True)
 
 
 def create_top_spreader_df(
-    top_spreaders, userid_postids, postid_num_reshares, postid_timestamp, postid_url
+    top_spreaders,
+    userid_postids,
+    postid_num_reshares=None,
+    postid_timestamp=None,
+    postid_url=None,
 ):
     """
     Create a dataframe containing all posts sent by the top spreaders.
@@ -194,7 +543,9 @@ def create_top_spreader_df(
     Parameters:
     ------------
     - top_spreaders (set) : top spreader user IDs
-    - userid_postids (dict) : maps user IDs to a set of (str) post IDs
+    - userid_postids (dict or InternedPostStore) : maps user IDs to a set of (str)
+        post IDs, or a store holding all post data (in which case the remaining
+        parameters are not needed)
     - postid_num_reshares (dict) : maps post IDs to number of reshares (int)
     - postid_timestamp (dict) : maps post IDs to (str) timestamps
     - postid_url (dict) : maps post IDs to (str) post URLs
@@ -212,6 +563,11 @@ def create_top_spreader_df(
     -----------
     TypeError
     """
+    if isinstance(userid_postids, InternedPostStore):
+        if not isinstance(top_spreaders, set):
+            raise TypeError("`top_spreaders` must be a set!")
+        return _create_top_spreader_df_from_store(top_spreaders, userid_postids)
+
     if not isinstance(userid_postids, dict):
         raise TypeError("`userid_postids` must be a dict!")
     if not isinstance(postid_num_reshares, dict):
@@ -240,3 +596,125 @@ def create_top_spreader_df(
 
     except Exception as e:
         raise Exception(e)
+
+
+def _create_top_spreader_df_from_store(top_spreaders, store):
+    """
+    Create the same dataframe as `create_top_spreader_df` from an `InternedPostStore`.
+
+    Parameters:
+    ------------
+    - top_spreaders (set) : top spreader user IDs
+    - store (InternedPostStore) : the store holding all post data
+
+    Returns:
+    -----------
+    - top_spreaders_df (pandas.DataFrame) : see `create_top_spreader_df`
+    """
+    try:
+        post_order, offsets = store.get_user_post_offsets()
+        post_reshares = store.get_post_reshares()
+        top_spreader_records = []
+        for user_id in top_spreaders:
+            user_idx = store.get_user_index(user_id)
+            for post_idx in post_order[offsets[user_idx] : offsets[user_idx + 1]]:
+                top_spreader_records.append(
+                    {
+                        "user_id": user_id,
+                        "post_id": store.post_ids[post_idx],
+                        "num_reshares": int(post_reshares[post_idx]),
+                        "timestamp": str(store.post_timestamp[post_idx]),
+                        "post_url": store.get_post_url(post_idx),
+                    }
+                )
+        top_spreaders_df = pd.DataFrame.from_records(top_spreader_records)
+        return top_spreaders_df
+
+    except Exception as e:
+        raise Exception(e)
+
+
+def create_tweet_store():
+    """
+    Return an empty InternedPostStore for tweets, which derives tweet URLs and
+    tracks the profile image URL of each tweet's user.
+    """
+    return InternedPostStore(
+        reshare_policy="max",
+        url_template=TWITTER_V1_POST_URL_TEMPLATE,
+        track_profile_images=True,
+    )
+
+
+def add_tweet_rows(rows, earliest_date_tstamp, store):
+    """
+    Add the base, retweeted and quoted tweets of each row to `store`. Only keep
+    tweets that occurred on or after the earliest date.
+
+    Parameters:
+    -----------
+    - rows (iterable) : rows of TWITTER_FIB_COLUMNS values, from a post store or
+        from raw tweets (see calc_twitter_fib_indices.py)
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices
+    - store (InternedPostStore) : the store to add data to
+
+    Returns:
+    -----------
+    - store (InternedPostStore) : the updated store
+    """
+    num_fields = len(TWITTER_V1_TWEET_FIELDS)
+    for row in rows:
+        for start in range(0, len(row), num_fields):
+            (
+                post_id,
+                user_id,
+                username,
+                timestamp,
+                num_reshares,
+                profile_image_url,
+            ) = row[start : start + num_fields]
+
+            # Not a retweet/quote (or missing a valid creation time)
+            if timestamp is None:
+                continue
+
+            if timestamp < earliest_date_tstamp:
+                # Skip anything posted before the earliest date. If the base
+                # tweet is skipped, its retweet/quote objs are too.
+                if start == 0:
+                    break
+                continue
+
+            store.add_post(
+                post_id,
+                user_id,
+                username,
+                timestamp,
+                num_reshares,
+                profile_image_url=profile_image_url,
+            )
+
+    return store
+
+
+def create_profile_image_df(store):
+    """
+    Create the "latest profile image URL per user" index of all users in `store`,
+    so that profile image links can be looked up without reading raw data.
+
+    Parameters:
+    -----------
+    - store (InternedPostStore) : the store holding all tweet data
+
+    Returns:
+    -----------
+    - profile_image_df (pandas.DataFrame) : a dataframe with the following columns:
+        - user_id (str) : a unique Twitter user ID
+        - profile_image_url (str) : the profile image URL of the user's most
+            recent tweet
+    """
+    user_ids, profile_image_urls = store.get_latest_profile_image_urls()
+    return pd.DataFrame(
+        {"user_id": user_ids, "profile_image_url": profile_image_urls}
+    )
@@ -0,0 +1,702 @@
+"""
+A compact store for the post data extracted in the FIB calculation scripts.
+
+User IDs, post IDs and usernames are interned once, mapping each string to a
+dense integer. Per-post attributes are then kept in typed arrays indexed by those
+integers, instead of several dictionaries keyed by post ID strings.
+"""
+from array import array
+
+import numpy as np
+import pyarrow as pa
+
+RESHARE_POLICIES = ["max", "last"]
+
+
+class InternedPostStore:
+    """
+    Store post data with interned IDs and typed per-post arrays.
+
+    Each post is stored once, no matter how many times it is added. When a post is
+    added again its attributes are updated as follows:
+        - num_reshares : depends on `reshare_policy`. "max" keeps the largest
+            count seen (e.g., Twitter retweet counts) and "last" keeps the most
+            recently added count (e.g., CrowdTangle share counts).
+        - timestamp, user, username and URL : the most recently added values win.
+
+    A user's username is the one attached to the most recently added post sent
+    by that user.
+
+    Each post also records when it was last added (a sequence number counting
+    all calls to `add_post`). This allows a store built from all data to be
+    filtered to a time window afterwards (see `filter_by_timestamp`) with the
+    same result as only adding the posts inside that window.
+
+    Post URLs can either be stored explicitly (`url_template=None`) or derived
+    lazily from the post's username and ID (e.g., Twitter), which avoids storing
+    one URL string per post.
+
+    Optionally, the profile image URL of each post's user is tracked as well
+    (interned, like usernames), so that the latest profile image of every user is
+    known without reading the raw data again (see `get_latest_profile_image_urls`).
+    """
+
+    def __init__(
+        self, reshare_policy="max", url_template=None, track_profile_images=False
+    ):
+        """
+        Initialize an empty store.
+
+        Parameters:
+            - reshare_policy (str): how to update the reshare count of a post that
+                is added more than once. Options: ["max", "last"]. Default: "max"
+            - url_template (str or None): if provided, post URLs are derived with
+                `url_template.format(username=..., post_id=...)` and not stored.
+                If None (default), the URL passed to `add_post` is stored.
+            - track_profile_images (bool): if True, the profile image URL passed
+                to `add_post` is stored for each post. Default: False
+        """
+        if reshare_policy not in RESHARE_POLICIES:
+            raise ValueError(f"`reshare_policy` must be one of {RESHARE_POLICIES}!")
+        if url_template is not None and not isinstance(url_template, str):
+            raise TypeError("`url_template` must be a string or None!")
+
+        self.reshare_policy = reshare_policy
+        self.url_template = url_template
+
+        # Interned strings: index -> string (list) and string -> index (dict)
+        self.user_ids = []
+        self.post_ids = []
+        self.usernames = []
+        self._user_index = dict()
+        self._post_index = dict()
+        self._username_index = dict()
+
+        # Per-user attributes
+        self.user_username = array("q")
+
+        # Per-post attributes
+        self.post_user = array("q")
+        self.post_username = array("q")
+        self.post_timestamp = array("q")
+        self.post_reshares = array("q")
+        self.post_seq = array("q")
+        self.post_urls = [] if url_template is None else None
+
+        # Interned profile image URLs and the index of each post's one, if tracked
+        self.profile_image_urls = []
+        self._profile_image_index = dict()
+        self.post_profile_image = array("q") if track_profile_images else None
+
+        # Number of calls to `add_post` (including those merged from other stores)
+        self.num_adds = 0
+
+    @property
+    def num_posts(self):
+        """Return the number of unique posts in the store."""
+        return len(self.post_ids)
+
+    @property
+    def num_users(self):
+        """Return the number of unique users in the store."""
+        return len(self.user_ids)
+
+    def _intern_username(self, username):
+        """Return the index of `username`, adding it if it is new."""
+        username_idx = self._username_index.get(username)
+        if username_idx is None:
+            username_idx = len(self.usernames)
+            self._username_index[username] = username_idx
+            self.usernames.append(username)
+        return username_idx
+
+    def _intern_profile_image_url(self, profile_image_url):
+        """Return the index of `profile_image_url`, adding it if it is new."""
+        url_idx = self._profile_image_index.get(profile_image_url)
+        if url_idx is None:
+            url_idx = len(self.profile_image_urls)
+            self._profile_image_index[profile_image_url] = url_idx
+            self.profile_image_urls.append(profile_image_url)
+        return url_idx
+
+    def _intern_user(self, user_id):
+        """Return the index of `user_id`, adding it if it is new."""
+        user_idx = self._user_index.get(user_id)
+        if user_idx is None:
+            user_idx = len(self.user_ids)
+            self._user_index[user_id] = user_idx
+            self.user_ids.append(user_id)
+            self.user_username.append(-1)
+        return user_idx
+
+    def add_post(
+        self,
+        post_id,
+        user_id,
+        username,
+        timestamp,
+        num_reshares,
+        post_url=None,
+        profile_image_url=None,
+    ):
+        """
+        Add a single post to the store.
+
+        Parameters:
+            - post_id (str): the post's unique ID
+            - user_id (str): the ID of the user who sent the post
+            - username (str): the username/handle of `user_id`
+            - timestamp (int): epoch timestamp of when the post was sent
+            - num_reshares (int): the number of times the post was reshared
+            - post_url (str): full URL to the post. Required only if the store
+                was created without a `url_template`.
+            - profile_image_url (str): URL to the profile image of `user_id`.
+                Only stored if the store tracks profile images.
+        """
+        user_idx = self._intern_user(user_id)
+        username_idx = self._intern_username(username)
+        self.user_username[user_idx] = username_idx
+        seq = self.num_adds
+        self.num_adds += 1
+
+        post_idx = self._post_index.get(post_id)
+        if post_idx is None:
+            self._post_index[post_id] = len(self.post_ids)
+            self.post_ids.append(post_id)
+            self.post_user.append(user_idx)
+            self.post_username.append(username_idx)
+            self.post_timestamp.append(timestamp)
+            self.post_reshares.append(num_reshares)
+            self.post_seq.append(seq)
+            if self.post_urls is not None:
+                self.post_urls.append(post_url)
+            if self.post_profile_image is not None:
+                self.post_profile_image.append(
+                    self._intern_profile_image_url(profile_image_url)
+                )
+            return
+
+        self.post_user[post_idx] = user_idx
+        self.post_username[post_idx] = username_idx
+        self.post_timestamp[post_idx] = timestamp
+        self.post_seq[post_idx] = seq
+        if self.reshare_policy == "last" or num_reshares > self.post_reshares[post_idx]:
+            self.post_reshares[post_idx] = num_reshares
+        if self.post_urls is not None:
+            self.post_urls[post_idx] = post_url
+        if self.post_profile_image is not None:
+            self.post_profile_image[post_idx] = self._intern_profile_image_url(
+                profile_image_url
+            )
+
+    def merge(self, other):
+        """
+        Merge another store into this one, in place.
+
+        `other` is treated as holding data that was added *after* the data in this
+        store (e.g., the next file or chunk of a file). The result is therefore
+        identical to adding all of `other`'s posts to this store in the order they
+        were originally added: reshare counts follow `reshare_policy` and all
+        other attributes, including each user's username, take `other`'s values.
+
+        Merging is associative, so partial stores built in parallel can be reduced
+        in any grouping as long as their order is preserved.
+
+        Parameters:
+            - other (InternedPostStore): the store to merge into this one. It must
+                use the same `reshare_policy` and `url_template`.
+
+        Returns:
+            - self (InternedPostStore): this store, to allow chaining
+        """
+        if not isinstance(other, InternedPostStore):
+            raise TypeError("`other` must be an InternedPostStore!")
+        if (
+            other.reshare_policy != self.reshare_policy
+            or other.url_template != self.url_template
+            or (other.post_profile_image is None)
+            != (self.post_profile_image is None)
+        ):
+            raise ValueError(
+                "Stores must share the same `reshare_policy`, `url_template` and "
+                "profile image tracking!"
+            )
+
+        # Map the other store's usernames and users to indices in this store
+        username_map = [self._intern_username(name) for name in other.usernames]
+        user_map = [self._intern_user(user_id) for user_id in other.user_ids]
+        profile_image_map = [
+            self._intern_profile_image_url(url) for url in other.profile_image_urls
+        ]
+
+        post_urls = other.post_urls
+        post_profile_image = other.post_profile_image
+        keep_max = self.reshare_policy == "max"
+        seq_offset = self.num_adds
+        for other_idx, post_id in enumerate(other.post_ids):
+            user_idx = user_map[other.post_user[other_idx]]
+            username_idx = username_map[other.post_username[other_idx]]
+            num_reshares = other.post_reshares[other_idx]
+            seq = other.post_seq[other_idx] + seq_offset
+
+            post_idx = self._post_index.get(post_id)
+            if post_idx is None:
+                self._post_index[post_id] = len(self.post_ids)
+                self.post_ids.append(post_id)
+                self.post_user.append(user_idx)
+                self.post_username.append(username_idx)
+                self.post_timestamp.append(other.post_timestamp[other_idx])
+                self.post_reshares.append(num_reshares)
+                self.post_seq.append(seq)
+                if post_urls is not None:
+                    self.post_urls.append(post_urls[other_idx])
+                if post_profile_image is not None:
+                    self.post_profile_image.append(
+                        profile_image_map[post_profile_image[other_idx]]
+                    )
+                continue
+
+            self.post_user[post_idx] = user_idx
+            self.post_username[post_idx] = username_idx
+            self.post_timestamp[post_idx] = other.post_timestamp[other_idx]
+            self.post_seq[post_idx] = seq
+            if not keep_max or num_reshares > self.post_reshares[post_idx]:
+                self.post_reshares[post_idx] = num_reshares
+            if post_urls is not None:
+                self.post_urls[post_idx] = post_urls[other_idx]
+            if post_profile_image is not None:
+                self.post_profile_image[post_idx] = profile_image_map[
+                    post_profile_image[other_idx]
+                ]
+
+        # The latest username of every user in `other` wins
+        for other_user_idx, user_idx in enumerate(user_map):
+            self.user_username[user_idx] = username_map[
+                other.user_username[other_user_idx]
+            ]
+        self.num_adds += other.num_adds
+
+        return self
+
+    def filter_by_timestamp(self, earliest_timestamp):
+        """
+        Return a new store with only the posts sent on or after `earliest_timestamp`.
+
+        The result matches a store that was only given the posts inside the window:
+        a post's timestamp does not change between the times it is added, so each
+        post is either always or never skipped. Each user's username is taken from
+        their most recently added post that is kept, and users without any kept
+        posts are dropped.
+
+        Parameters:
+            - earliest_timestamp (int or float): the earliest timestamp to keep
+
+        Returns:
+            - store (InternedPostStore): the filtered store
+        """
+        post_timestamp = np.frombuffer(self.post_timestamp, dtype=np.int64)
+        kept_posts = np.flatnonzero(post_timestamp >= earliest_timestamp)
+
+        # Renumber users in the order they first appear in the kept posts, which is
+        # the order they would have been added in
+        post_user = np.frombuffer(self.post_user, dtype=np.int64)[kept_posts]
+        kept_users, first_post, new_post_user = np.unique(
+            post_user, return_index=True, return_inverse=True
+        )
+        user_order = np.argsort(first_post, kind="stable")
+        user_rank = np.empty_like(user_order)
+        user_rank[user_order] = np.arange(len(user_order))
+
+        post_username = np.frombuffer(self.post_username, dtype=np.int64)[kept_posts]
+        kept_usernames, new_post_username = np.unique(
+            post_username, return_inverse=True
+        )
+
+        post_urls = None
+        if self.post_urls is not None:
+            post_urls = [self.post_urls[idx] for idx in kept_posts.tolist()]
+
+        profile_image_urls = None
+        new_post_profile_image = None
+        if self.post_profile_image is not None:
+            kept_urls, new_post_profile_image = np.unique(
+                np.frombuffer(self.post_profile_image, dtype=np.int64)[kept_posts],
+                return_inverse=True,
+            )
+            profile_image_urls = [
+                self.profile_image_urls[idx] for idx in kept_urls.tolist()
+            ]
+            new_post_profile_image = new_post_profile_image.ravel()
+
+        return InternedPostStore._from_post_arrays(
+            reshare_policy=self.reshare_policy,
+            url_template=self.url_template,
+            user_ids=[self.user_ids[idx] for idx in kept_users[user_order].tolist()],
+            usernames=[self.usernames[idx] for idx in kept_usernames.tolist()],
+            post_ids=[self.post_ids[idx] for idx in kept_posts.tolist()],
+            post_user=user_rank[new_post_user.ravel()],
+            post_username=new_post_username.ravel(),
+            post_timestamp=post_timestamp[kept_posts],
+            post_reshares=np.frombuffer(self.post_reshares, dtype=np.int64)[
+                kept_posts
+            ],
+            post_seq=np.frombuffer(self.post_seq, dtype=np.int64)[kept_posts],
+            post_urls=post_urls,
+            num_adds=self.num_adds,
+            profile_image_urls=profile_image_urls,
+            post_profile_image=new_post_profile_image,
+        )
+
+    def to_arrow(self):
+        """
+        Return the store as a pyarrow Table with one row per post.
+
+        User IDs and usernames are dictionary encoded with the store's interned
+        lists, so the table (and a parquet file written from it) stays compact.
+        The reshare policy, URL template and number of adds are kept in the
+        schema metadata. See `InternedPostStore.from_arrow`.
+
+        Returns:
+            - table (pyarrow.Table): columns post_id, user_id, username,
+                timestamp, num_reshares, seq and (if stored) post_url and
+                profile_image_url
+        """
+        columns = {
+            "post_id": pa.array(self.post_ids, type=pa.string()),
+            "user_id": pa.DictionaryArray.from_arrays(
+                np.frombuffer(self.post_user, dtype=np.int64),
+                pa.array(self.user_ids, type=pa.string()),
+            ),
+            "username": pa.DictionaryArray.from_arrays(
+                np.frombuffer(self.post_username, dtype=np.int64),
+                pa.array(self.usernames, type=pa.string()),
+            ),
+            "timestamp": np.frombuffer(self.post_timestamp, dtype=np.int64),
+            "num_reshares": np.frombuffer(self.post_reshares, dtype=np.int64),
+            "seq": np.frombuffer(self.post_seq, dtype=np.int64),
+        }
+        if self.post_urls is not None:
+            columns["post_url"] = pa.array(self.post_urls, type=pa.string())
+        if self.post_profile_image is not None:
+            columns["profile_image_url"] = pa.DictionaryArray.from_arrays(
+                np.frombuffer(self.post_profile_image, dtype=np.int64),
+                pa.array(self.profile_image_urls, type=pa.string()),
+            )
+
+        metadata = {
+            "reshare_policy": self.reshare_policy,
+            "url_template": self.url_template or "",
+            "num_adds": str(self.num_adds),
+        }
+        return pa.table(columns, metadata=metadata)
+
+    @classmethod
+    def from_arrow(cls, table, copy=True):
+        """
+        Create a store from a pyarrow Table created by `InternedPostStore.to_arrow`.
+
+        Parameters:
+            - table (pyarrow.Table): the table to load
+            - copy (bool): if True (default), the table's data is copied into a
+                regular store. If False, a read-only store is returned instead:
+                its per-post arrays are numpy views of the table's buffers (e.g.,
+                of a memory-mapped IPC file, see `store_cache`) and post IDs/URLs
+                are only converted to Python strings when accessed. Posts cannot
+                be added to a read-only store, but everything needed to calculate
+                FIB indices and select top spreaders works without a copy.
+
+        Returns:
+            - store (InternedPostStore): the loaded store
+        """
+        if not isinstance(table, pa.Table):
+            raise TypeError("`table` must be a pyarrow.Table!")
+
+        metadata = {
+            key.decode(): value.decode()
+            for key, value in (table.schema.metadata or {}).items()
+        }
+        # Tables with one chunk per column (e.g., written by `to_arrow`) are used
+        # as is, so their buffers are not copied
+        if any(column.num_chunks > 1 for column in table.columns):
+            table = table.unify_dictionaries().combine_chunks()
+
+        def dictionary_column(name):
+            column = table.column(name)
+            if column.num_chunks == 0:
+                return [], np.zeros(0, dtype=np.int64)
+            chunk = column.chunk(0)
+            return (
+                chunk.dictionary.to_pylist(),
+                chunk.indices.to_numpy(zero_copy_only=False).astype(
+                    np.int64, copy=False
+                ),
+            )
+
+        user_ids, post_user = dictionary_column("user_id")
+        usernames, post_username = dictionary_column("username")
+
+        def int_column(name):
+            column = table.column(name)
+            if column.num_chunks == 0:
+                return np.zeros(0, dtype=np.int64)
+            return column.chunk(0).to_numpy(zero_copy_only=False).astype(
+                np.int64, copy=False
+            )
+
+        def string_column(name):
+            if copy:
+                return table.column(name).to_pylist()
+            return _ArrowStrings(table.column(name))
+
+        post_urls = None
+        if "post_url" in table.column_names:
+            post_urls = string_column("post_url")
+
+        profile_image_urls = None
+        post_profile_image = None
+        if "profile_image_url" in table.column_names:
+            profile_image_urls, post_profile_image = dictionary_column(
+                "profile_image_url"
+            )
+
+        return cls._from_post_arrays(
+            reshare_policy=metadata.get("reshare_policy", "max"),
+            url_template=metadata.get("url_template") or None,
+            user_ids=user_ids,
+            usernames=usernames,
+            post_ids=string_column("post_id"),
+            post_user=post_user,
+            post_username=post_username,
+            post_timestamp=int_column("timestamp"),
+            post_reshares=int_column("num_reshares"),
+            post_seq=int_column("seq"),
+            post_urls=post_urls,
+            num_adds=int(metadata.get("num_adds", table.num_rows)),
+            profile_image_urls=profile_image_urls,
+            post_profile_image=post_profile_image,
+            copy=copy,
+        )
+
+    @classmethod
+    def _from_post_arrays(
+        cls,
+        reshare_policy,
+        url_template,
+        user_ids,
+        usernames,
+        post_ids,
+        post_user,
+        post_username,
+        post_timestamp,
+        post_reshares,
+        post_seq,
+        post_urls,
+        num_adds,
+        profile_image_urls=None,
+        post_profile_image=None,
+        copy=True,
+    ):
+        """
+        Create a store from interned lists and per-post numpy arrays. Each user's
+        username is set from their post with the highest sequence number.
+        Profile images are tracked if `post_profile_image` is not None.
+
+        With copy=False, the numpy arrays are kept as they are (see `from_arrow`)
+        and the post ID lookup is not built, so the store is read-only.
+        """
+        def to_store_array(values):
+            values = np.ascontiguousarray(values, np.int64)
+            return array("q", values.tobytes()) if copy else values
+
+        store = cls(
+            reshare_policy,
+            url_template,
+            track_profile_images=post_profile_image is not None,
+        )
+        store.user_ids = user_ids
+        store.usernames = usernames
+        store.post_ids = post_ids
+        store.post_user = to_store_array(post_user)
+        store.post_username = to_store_array(post_username)
+        store.post_timestamp = to_store_array(post_timestamp)
+        store.post_reshares = to_store_array(post_reshares)
+        store.post_seq = to_store_array(post_seq)
+        if url_template is None:
+            store.post_urls = post_urls
+        if post_profile_image is not None:
+            store.profile_image_urls = profile_image_urls
+            store.post_profile_image = to_store_array(post_profile_image)
+        store.num_adds = num_adds
+        store._rebuild_indices()
+
+        latest_users, latest_posts = store._get_latest_user_posts()
+        user_username = np.full(len(user_ids), -1, dtype=np.int64)
+        user_username[latest_users] = np.frombuffer(
+            store.post_username, dtype=np.int64
+        )[latest_posts]
+        store.user_username = to_store_array(user_username)
+        return store
+
+    def __getstate__(self):
+        """
+        Drop the string -> index lookups when pickling (e.g., to send a partial
+        store between processes). They are rebuilt from the interned lists.
+        """
+        state = self.__dict__.copy()
+        del state["_user_index"], state["_post_index"], state["_username_index"]
+        del state["_profile_image_index"]
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore a pickled store and rebuild its string -> index lookups.
+        """
+        self.__dict__.update(state)
+        self._rebuild_indices()
+
+    def _rebuild_indices(self):
+        """Rebuild the string -> index lookups from the interned lists."""
+        self._user_index = {user_id: idx for idx, user_id in enumerate(self.user_ids)}
+        # Read-only stores (see `from_arrow`) never look up posts by ID
+        self._post_index = None
+        if isinstance(self.post_ids, list):
+            self._post_index = {
+                post_id: idx for idx, post_id in enumerate(self.post_ids)
+            }
+        self._username_index = {
+            username: idx for idx, username in enumerate(self.usernames)
+        }
+        self._profile_image_index = {
+            url: idx for idx, url in enumerate(self.profile_image_urls)
+        }
+
+    def _get_latest_user_posts(self):
+        """
+        Return the index of each user with posts and of their most recently added
+        post (the one with the highest sequence number), as two numpy arrays.
+        """
+        # Sort posts by user, then sequence number, and take each user's last post
+        post_user = np.frombuffer(self.post_user, dtype=np.int64)
+        post_seq = np.frombuffer(self.post_seq, dtype=np.int64)
+        latest_order = np.lexsort((post_seq, post_user))
+        is_latest = np.ones(len(latest_order), dtype=bool)
+        is_latest[:-1] = post_user[latest_order[1:]] != post_user[latest_order[:-1]]
+        latest_posts = latest_order[is_latest]
+        return post_user[latest_posts], latest_posts
+
+    def get_latest_profile_image_urls(self):
+        """
+        Return the latest profile image URL of each user, i.e. the one attached to
+        their most recently added post.
+
+        Returns:
+            - user_ids (list[str]): IDs of all users with posts
+            - profile_image_urls (list[str]): the latest profile image URL of each
+                user in `user_ids` (None if it was not provided)
+        """
+        if self.post_profile_image is None:
+            raise ValueError("This store does not track profile images!")
+
+        latest_users, latest_posts = self._get_latest_user_posts()
+        post_profile_image = np.frombuffer(self.post_profile_image, dtype=np.int64)
+        return (
+            [self.user_ids[idx] for idx in latest_users.tolist()],
+            [
+                self.profile_image_urls[idx]
+                for idx in post_profile_image[latest_posts].tolist()
+            ],
+        )
+
+    def get_user_index(self, user_id):
+        """Return the integer index of `user_id` (KeyError if not present)."""
+        return self._user_index[user_id]
+
+    def get_username(self, user_idx):
+        """Return the latest username of the user at index `user_idx`."""
+        return self.usernames[self.user_username[user_idx]]
+
+    def get_post_url(self, post_idx):
+        """Return the URL of the post at index `post_idx`."""
+        if self.post_urls is not None:
+            return self.post_urls[post_idx]
+        return self.url_template.format(
+            username=self.usernames[self.post_username[post_idx]],
+            post_id=self.post_ids[post_idx],
+        )
+
+    def get_user_post_offsets(self):
+        """
+        Group post indices by user (CSR layout).
+
+        Returns:
+            - post_order (numpy.ndarray): post indices sorted by user index. Posts
+                of user `i` are post_order[offsets[i]:offsets[i + 1]]
+            - offsets (numpy.ndarray): offsets of length `num_users + 1`
+        """
+        post_user = np.frombuffer(self.post_user, dtype=np.int64)
+        post_order = np.argsort(post_user, kind="stable")
+        offsets = np.zeros(self.num_users + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(post_user, minlength=self.num_users), out=offsets[1:]
+        )
+        return post_order, offsets
+
+    def get_post_reshares(self):
+        """
+        Return the reshare counts of all posts as a numpy array. This is a view of
+        the store's data (no copy), so no posts can be added while it is alive.
+        """
+        return np.frombuffer(self.post_reshares, dtype=np.int64)
+
+    def __repr__(self):
+        """
+        Define the representation of the object.
+        """
+        return (
+            f"<{self.__class__.__name__}() object with {self.num_posts:,} posts "
+            f"from {self.num_users:,} users>"
+        )
+
+
+class _ArrowStrings:
+    """
+    A read-only, list-like view of a pyarrow string column. Items are converted
+    to Python strings only when accessed.
+    """
+
+    def __init__(self, column):
+        self._column = column
+
+    def __len__(self):
+        return len(self._column)
+
+    def __getitem__(self, idx):
+        return self._column[int(idx)].as_py()
+
+    def __iter__(self):
+        for chunk in self._column.iterchunks():
+            yield from chunk.to_pylist()
+
+
+def merge_partial_stores(partial_stores):
+    """
+    Reduce an ordered iterable of partial stores into a single store.
+
+    Stores are merged in the order provided, so the result is identical to adding
+    all posts to one store in that order. The first store is reused (and modified)
+    as the output.
+
+    Parameters:
+    -----------
+    - partial_stores (iterable[InternedPostStore]) : partial stores, e.g. one per
+        file or chunk of a file, in the order their data was read
+
+    Returns:
+    -----------
+    - store (InternedPostStore or None) : the merged store, or None if
+        `partial_stores` was empty
+    """
+    store = None
+    for partial_store in partial_stores:
+        store = partial_store if store is None else store.merge(partial_store)
+    return store
@@ -0,0 +1,82 @@
+"""
+Functions for decoding raw new-line delimited JSON posts.
+
+Lines are passed in as raw bytes. If the optional `orjson` package is installed
+it is used as a (much faster) backend that parses the bytes directly, without a
+`line.decode()` copy. Otherwise the standard library `json` module is used.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AVAILABLE_BACKENDS = ["json"] if orjson is None else ["orjson", "json"]
+
+# The first available backend is the fastest one
+_backend = AVAILABLE_BACKENDS[0]
+
+
+def get_json_backend():
+    """
+    Return the name of the active JSON decoding backend.
+
+    Returns:
+    -----------
+    - backend (str) : one of AVAILABLE_BACKENDS (e.g., "orjson" or "json")
+    """
+    return _backend
+
+
+def set_json_backend(backend):
+    """
+    Set the active JSON decoding backend (e.g., to benchmark or debug with the
+    standard library parser).
+
+    Parameters:
+    -----------
+    - backend (str) : one of AVAILABLE_BACKENDS
+
+    Exceptions:
+    -----------
+    - ValueError
+    """
+    global _backend
+    if backend not in AVAILABLE_BACKENDS:
+        raise ValueError(
+            f"`backend` must be one of {AVAILABLE_BACKENDS}. Currently: {backend}"
+        )
+    _backend = backend
+
+
+def decode_json_line(line):
+    """
+    Parse a single raw JSON line into a Python object.
+
+    Parameters:
+    -----------
+    - line (bytes or str) : one line of a new-line delimited JSON file. Trailing
+        whitespace (e.g., "\n") is allowed.
+
+    Returns:
+    -----------
+    - obj (dict) : the parsed object
+
+    Exceptions:
+    -----------
+    - json.JSONDecodeError
+    """
+    if _backend == "orjson":
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the standard library (e.g., integers larger
+            # than 64 bits), so fall back before giving up on the line.
+            pass
+
+    # The standard library decodes bytes itself, but with encoding detection and
+    # error handling that make it slower than a plain UTF-8 decode.
+    if isinstance(line, bytes):
+        line = line.decode()
+    return json.loads(line)
@@ -0,0 +1,81 @@
+"""
+Functions for parsing data files in parallel.
+"""
+import gzip
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def iter_line_chunks(file_path, chunk_size=100_000):
+    """
+    Yield the raw lines of a gzipped file in chunks.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzipped, new-line delimited file
+    - chunk_size (int) : the maximum number of lines in each chunk.
+        Default = 100,000
+
+    Yields:
+    -----------
+    - lines (list[bytes]) : the next chunk of raw lines (including new-lines)
+
+    Exceptions:
+    -----------
+    - TypeError, ValueError
+    """
+    if not isinstance(chunk_size, int):
+        raise TypeError("`chunk_size` must be an integer!")
+    if chunk_size < 1:
+        raise ValueError("`chunk_size` must be at least 1!")
+
+    with gzip.open(file_path, "rb") as f:
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) == chunk_size:
+                yield lines
+                lines = []
+        if lines:
+            yield lines
+
+
+def ordered_imap(func, iterable, workers, max_pending=None):
+    """
+    Apply `func` to each item of `iterable` in a pool of processes and yield the
+    results in the same order as `iterable`.
+
+    Unlike `ProcessPoolExecutor.map`, items are only pulled from `iterable` as
+    results are consumed, so at most `max_pending` items (e.g., chunks of lines)
+    are held in memory at any time.
+
+    Parameters:
+    -----------
+    - func (callable) : a picklable function that takes a single item
+    - iterable (iterable) : the items to process
+    - workers (int) : the number of processes
+    - max_pending (int) : the maximum number of submitted but not yet yielded
+        items. Default = 2 * workers
+
+    Yields:
+    -----------
+    - result : func(item) for each item, in order
+
+    Exceptions:
+    -----------
+    - TypeError
+    """
+    if not isinstance(workers, int):
+        raise TypeError("`workers` must be an integer!")
+    if max_pending is None:
+        max_pending = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
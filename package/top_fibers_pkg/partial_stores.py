@@ -0,0 +1,166 @@
+"""
+Functions for persisting the partial store of each raw data file.
+
+The FIB scripts consider a rolling window of months (e.g., the last three), so
+each raw monthly file is parsed in several consecutive runs. Saving the store of
+each file (built without a time window) lets later runs load it instead of
+parsing the file again. The time window is applied after the partial stores are
+merged (see `InternedPostStore.filter_by_timestamp`), which is also why re-runs
+with a different window length do not need to parse anything.
+
+A partial store is saved as a parquet file named after its raw data file. The
+raw file's size and modification time are saved with it, and the partial store
+is ignored if the raw file has changed since (e.g., the current month's file
+gained new data).
+"""
+import os
+
+import pyarrow.parquet as pq
+
+from .interned_store import InternedPostStore
+
+# Bump this if the saved format changes, so that old partial stores are ignored
+PARTIAL_STORE_VERSION = "2"
+PARTIAL_STORE_SUFFIX = ".partial_store.parquet"
+
+
+def get_partial_store_path(cache_dir, data_file):
+    """
+    Return the path of the partial store of `data_file`.
+
+    Parameters:
+    -----------
+    - cache_dir (str) : directory where partial stores are saved
+    - data_file (str) : path to a raw data file (symbolic links are resolved)
+
+    Returns:
+    -----------
+    - path (str) : full path to the partial store's parquet file
+    """
+    basename = os.path.basename(os.path.realpath(data_file))
+    return os.path.join(cache_dir, f"{basename}{PARTIAL_STORE_SUFFIX}")
+
+
+def _get_source_signature(data_file):
+    """Return the size and modification time of `data_file` as strings."""
+    file_stat = os.stat(data_file)
+    return {
+        "partial_store_version": PARTIAL_STORE_VERSION,
+        "source_size": str(file_stat.st_size),
+        "source_mtime_ns": str(file_stat.st_mtime_ns),
+    }
+
+
+def save_partial_store(store, cache_dir, data_file):
+    """
+    Save the partial store of `data_file` to `cache_dir`.
+
+    The file is written to a temporary path first and then renamed, so an
+    interrupted run never leaves a truncated partial store behind.
+
+    Parameters:
+    -----------
+    - store (InternedPostStore) : the store built from all posts in `data_file`
+    - cache_dir (str) : directory where partial stores are saved. It is created
+        if it does not exist.
+    - data_file (str) : path to the raw data file `store` was built from
+
+    Returns:
+    -----------
+    - path (str) : full path to the saved parquet file
+
+    Exceptions:
+    -----------
+    - TypeError
+    """
+    if not isinstance(store, InternedPostStore):
+        raise TypeError("`store` must be an InternedPostStore!")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = get_partial_store_path(cache_dir, data_file)
+
+    table = store.to_arrow()
+    metadata = dict(table.schema.metadata)
+    signature = _get_source_signature(data_file)
+    metadata.update({key.encode(): value.encode() for key, value in signature.items()})
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_partial_store(cache_dir, data_file):
+    """
+    Load the partial store of `data_file` from `cache_dir`.
+
+    Parameters:
+    -----------
+    - cache_dir (str) : directory where partial stores are saved
+    - data_file (str) : path to a raw data file
+
+    Returns:
+    -----------
+    - store (InternedPostStore or None) : the saved store, or None if there is no
+        saved store or `data_file` has changed since it was saved
+    """
+    path = get_partial_store_path(cache_dir, data_file)
+    if not os.path.exists(path):
+        return None
+
+    metadata = {
+        key.decode(): value.decode()
+        for key, value in (pq.read_schema(path).metadata or {}).items()
+    }
+    signature = _get_source_signature(data_file)
+    if any(metadata.get(key) != value for key, value in signature.items()):
+        return None
+
+    return InternedPostStore.from_arrow(pq.read_table(path))
+
+
+def get_partial_stores(data_files, cache_dir, parse_files, logger=None):
+    """
+    Return the partial store of each data file, only parsing files that do not
+    have an up-to-date saved partial store. Newly parsed stores are saved.
+
+    Parameters:
+    -----------
+    - data_files (list) : list of full paths to raw data files
+    - cache_dir (str) : directory where partial stores are saved
+    - parse_files (callable) : parse_files(files) must return an iterable with
+        the partial store of each file in `files`, in order. Stores must be
+        built from all posts (i.e., without a time window).
+    - logger : logging object. Default = None (no logging)
+
+    Returns:
+    -----------
+    - partial_stores (list[InternedPostStore]) : one store per data file, in the
+        order of `data_files`
+
+    Exceptions:
+    -----------
+    - TypeError
+    """
+    if not isinstance(data_files, list):
+        raise TypeError("`data_files` must be a list!")
+    if not isinstance(cache_dir, str):
+        raise TypeError("`cache_dir` must be a string!")
+
+    partial_stores = [load_partial_store(cache_dir, file) for file in data_files]
+    new_positions = [idx for idx, store in enumerate(partial_stores) if store is None]
+    if logger is not None:
+        logger.info(
+            f"Loaded {len(data_files) - len(new_positions)} saved partial stores, "
+            f"parsing {len(new_positions)} files..."
+        )
+
+    new_files = [data_files[idx] for idx in new_positions]
+    for idx, store in zip(new_positions, parse_files(new_files)):
+        path = save_partial_store(store, cache_dir, data_files[idx])
+        if logger is not None:
+            logger.info(f"\t- Saved partial store: {path}")
+        partial_stores[idx] = store
+
+    return partial_stores
@@ -0,0 +1,337 @@
+"""
+Functions for converting raw data files into columnar "post stores".
+
+Raw data files are new-line delimited JSON, so every script that reads them has
+to decompress and parse every full post object just to use a handful of fields.
+A post store is a parquet file with only those fields (already projected and
+parsed, e.g. timestamps are epoch seconds) that is written once per raw file,
+after the raw file is downloaded/moved into place. It is saved next to the raw
+file as {raw_file}.posts.parquet.
+
+Scripts then read only the columns they need and only the row groups that can
+contain posts on or after the earliest date of their time window (raw files are
+roughly in chronological order, so the row group statistics skip most of the
+data outside the window). Like the gzip index sidecars (see `seekable_gzip`), the
+raw file's size and modification time are saved with its post store, and the
+post store is ignored if the raw file has changed since.
+
+Twitter post stores have one row per raw line (i.e., per base tweet), with the
+columns of the base tweet followed by the same columns of its retweeted ("rt_")
+and quoted ("qt_") tweets (null if not present). CrowdTangle post stores have
+one row per post with a valid time.
+"""
+import math
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .data_model import parse_crowdtangle_timestamp, parse_twitter_v1_timestamp
+from .projection import (
+    FieldProjector,
+    CROWDTANGLE_FIB_FIELDS,
+    CROWDTANGLE_REQUIRED_KEYS,
+    TWITTER_V1_REQUIRED_KEYS,
+)
+from .seekable_gzip import get_line_shards, iter_shard_lines
+
+# Bump this if the saved format changes, so that old post stores are ignored
+POST_STORE_VERSION = "1"
+POST_STORE_SUFFIX = ".posts.parquet"
+PLATFORMS = ["twitter", "facebook"]
+
+# Number of raw lines converted (and written as one row group) at a time
+BATCH_NUM_LINES = 2**17
+
+# Columns of each tweet, with the raw field path each one is projected from
+_TWEET_COLUMNS = [
+    ("post_id", pa.string(), ["id_str"]),
+    ("user_id", pa.string(), ["user", "id_str"]),
+    ("username", pa.string(), ["user", "screen_name"]),
+    ("timestamp", pa.int64(), ["created_at"]),
+    ("num_reshares", pa.int64(), ["retweet_count"]),
+    ("profile_image_url", pa.string(), ["user", "profile_image_url"]),
+]
+_EMBEDDED_TWEETS = [("", []), ("rt_", ["retweeted_status"]), ("qt_", ["quoted_status"])]
+
+TWITTER_POST_STORE_SCHEMA = pa.schema(
+    [
+        pa.field(f"{prefix}{name}", data_type)
+        for prefix, _ in _EMBEDDED_TWEETS
+        for name, data_type, _ in _TWEET_COLUMNS
+    ]
+)
+
+# Columns needed to calculate FIB indices (and index profile images), in the order
+# of `projection.TWITTER_V1_TWEET_FIELDS`, for the base tweet, then the retweeted
+# tweet, then the quoted tweet
+TWITTER_FIB_COLUMNS = [
+    f"{prefix}{name}"
+    for prefix, _ in _EMBEDDED_TWEETS
+    for name, _, _ in _TWEET_COLUMNS
+]
+
+CROWDTANGLE_POST_STORE_SCHEMA = pa.schema(
+    [
+        pa.field("post_id", pa.string()),
+        pa.field("user_id", pa.string()),
+        pa.field("username", pa.string()),
+        pa.field("timestamp", pa.int64()),
+        pa.field("num_reshares", pa.int64()),
+        pa.field("post_url", pa.string()),
+        pa.field("profile_image_url", pa.string()),
+    ]
+)
+
+# Columns needed to calculate FIB indices, in the order of `add_post` arguments
+CROWDTANGLE_FIB_COLUMNS = [
+    "post_id",
+    "user_id",
+    "username",
+    "timestamp",
+    "num_reshares",
+    "post_url",
+]
+
+
+def get_post_store_path(data_file):
+    """
+    Return the path of the post store of `data_file`. Symbolic links are
+    resolved, so post stores are saved next to the raw file itself.
+
+    Parameters:
+    -----------
+    - data_file (str) : path to a raw data file
+
+    Returns:
+    -----------
+    - path (str) : full path to the post store's parquet file
+    """
+    return f"{os.path.realpath(data_file)}{POST_STORE_SUFFIX}"
+
+
+def _get_source_signature(data_file):
+    """Return the size and modification time of `data_file` as strings."""
+    file_stat = os.stat(data_file)
+    return {
+        "post_store_version": POST_STORE_VERSION,
+        "source_size": str(file_stat.st_size),
+        "source_mtime_ns": str(file_stat.st_mtime_ns),
+    }
+
+
+def has_post_store(data_file):
+    """
+    Return True if `data_file` has an up-to-date post store, otherwise False.
+
+    Parameters:
+    -----------
+    - data_file (str) : path to a raw data file
+
+    Returns:
+    -----------
+    - (bool)
+    """
+    path = get_post_store_path(data_file)
+    if not os.path.exists(path):
+        return False
+
+    metadata = {
+        key.decode(): value.decode()
+        for key, value in (pq.read_schema(path).metadata or {}).items()
+    }
+    signature = _get_source_signature(data_file)
+    return all(metadata.get(key) == value for key, value in signature.items())
+
+
+def _iter_twitter_rows(lines):
+    """
+    Yield one post store row (list) per valid tweet in `lines`, in the order of
+    TWITTER_POST_STORE_SCHEMA.
+    """
+    field_paths = [
+        path + field_path
+        for _, path in _EMBEDDED_TWEETS
+        for _, _, field_path in _TWEET_COLUMNS
+    ]
+    projector = FieldProjector(field_paths, required_keys=TWITTER_V1_REQUIRED_KEYS)
+    timestamp_idxs = [
+        idx for idx, path in enumerate(field_paths) if path[-1] == "created_at"
+    ]
+
+    for line in lines:
+        fields = projector.project_line(line)
+        if fields is None:
+            continue
+        row = list(fields)
+        for idx in timestamp_idxs:
+            row[idx] = parse_twitter_v1_timestamp(row[idx])
+        yield row
+
+
+def _iter_crowdtangle_rows(lines):
+    """
+    Yield one post store row (tuple) per valid post in `lines`, in the order of
+    CROWDTANGLE_POST_STORE_SCHEMA. Posts without a valid time are skipped.
+    """
+    projector = FieldProjector(
+        CROWDTANGLE_FIB_FIELDS + [["account", "profileImage"]],
+        required_keys=CROWDTANGLE_REQUIRED_KEYS,
+    )
+
+    for line in lines:
+        fields = projector.project_line(line)
+        if fields is None:
+            continue
+
+        (
+            post_id,
+            user_id,
+            username,
+            account_name,
+            created_at,
+            reshare_count,
+            post_url,
+            profile_image_url,
+        ) = fields
+
+        timestamp = parse_crowdtangle_timestamp(created_at)
+        if timestamp is None:
+            continue
+
+        # Same handling as the FIB script: IDs may be numeric, accounts like
+        # groups and pages may only have a "name", share counts may be missing
+        if username in [None, ""]:
+            username = account_name
+        if reshare_count is None:
+            reshare_count = 0
+
+        yield (
+            str(post_id),
+            str(user_id),
+            username,
+            timestamp,
+            reshare_count,
+            post_url,
+            profile_image_url,
+        )
+
+
+def convert_to_post_store(data_file, platform):
+    """
+    Convert a raw data file into its post store, written next to it.
+
+    The file is written to a temporary path first and then renamed, so an
+    interrupted conversion never leaves a truncated post store behind.
+
+    Parameters:
+    -----------
+    - data_file (str) : path to a raw data file (new-line delimited JSON, gzip
+        compressed)
+    - platform (str) : one of PLATFORMS
+
+    Returns:
+    -----------
+    - path (str) : full path to the saved post store
+
+    Exceptions:
+    -----------
+    - TypeError, ValueError
+    """
+    if not isinstance(data_file, str):
+        raise TypeError("`data_file` must be a string!")
+    if platform not in PLATFORMS:
+        raise ValueError(
+            f"`platform` must be one of {PLATFORMS}. Currently: {platform}"
+        )
+
+    if platform == "twitter":
+        schema = TWITTER_POST_STORE_SCHEMA
+        iter_rows = _iter_twitter_rows
+    else:
+        schema = CROWDTANGLE_POST_STORE_SCHEMA
+        iter_rows = _iter_crowdtangle_rows
+
+    signature = _get_source_signature(data_file)
+    schema = schema.with_metadata(
+        {key.encode(): value.encode() for key, value in signature.items()}
+    )
+
+    path = get_post_store_path(data_file)
+    tmp_path = f"{path}.tmp"
+    with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+        batch = []
+        for row in iter_rows(iter_shard_lines(data_file)):
+            batch.append(row)
+            if len(batch) == BATCH_NUM_LINES:
+                writer.write_table(_rows_to_table(batch, schema))
+                batch = []
+        if batch:
+            writer.write_table(_rows_to_table(batch, schema))
+    os.replace(tmp_path, path)
+    return path
+
+
+def _rows_to_table(rows, schema):
+    """Convert a (non-empty) list of row tuples into a table with `schema`."""
+    columns = zip(*rows)
+    return pa.Table.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+def load_post_store(data_file, columns=None, earliest_date_tstamp=None):
+    """
+    Load the post store of `data_file`, if it has an up-to-date one.
+
+    Only the requested columns are read and, with an `earliest_date_tstamp`, only
+    rows whose (base post's) timestamp is null or on/after that date. Row groups
+    whose statistics show no such rows are not read at all.
+
+    Parameters:
+    -----------
+    - data_file (str) : path to a raw data file
+    - columns (list[str]) : the columns to read. Default = None (all columns)
+    - earliest_date_tstamp (timestamp) : the earliest date to keep. Default =
+        None (keep all rows)
+
+    Returns:
+    -----------
+    - table (pyarrow.Table or None) : the rows of the post store, in the order of
+        the raw file, or None if `data_file` has no up-to-date post store
+    """
+    if not has_post_store(data_file):
+        return None
+
+    row_filter = None
+    if earliest_date_tstamp is not None and earliest_date_tstamp > -math.inf:
+        # Timestamps are whole seconds, so compare to an integer (arrow does not
+        # compare int64 columns to floats that large)
+        timestamp = ds.field("timestamp")
+        earliest = math.ceil(earliest_date_tstamp)
+        row_filter = (timestamp >= earliest) | ~timestamp.is_valid()
+
+    dataset = ds.dataset(get_post_store_path(data_file), format="parquet")
+    return dataset.to_table(columns=columns, filter=row_filter)
+
+
+def get_file_shards(data_file, num_shards):
+    """
+    Split `data_file` into shards (see `seekable_gzip.get_line_shards`) that can
+    be read by separate workers. A file with an up-to-date post store is always
+    read from it, as a single shard.
+
+    Parameters:
+    -----------
+    - data_file (str) : path to a raw data file
+    - num_shards (int) : the maximum number of shards
+
+    Returns:
+    -----------
+    - shards (list[tuple]) : (start, end) uncompressed byte offsets of each shard
+    """
+    if has_post_store(data_file):
+        return [(0, None)]
+    return get_line_shards(data_file, num_shards)
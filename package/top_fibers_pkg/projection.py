@@ -0,0 +1,165 @@
+"""
+Extract a fixed set of fields from raw posts without building post objects.
+
+The data model classes (e.g., `Tweet_v1`) are convenient but costly in the hot
+loop of scripts that read every line of every raw file: each post is wrapped in
+(nested) objects and every getter walks the dictionary with `get_dict_val`. A
+`FieldProjector` is instead given the list of field paths once, shares lookups
+for common prefixes (e.g., "user"), and returns one flat tuple per post.
+"""
+from .json_decoding import decode_json_line
+
+# Fields of a Twitter V1 tweet object needed to calculate FIB indices (and to
+# index the latest profile image of each user)
+TWITTER_V1_TWEET_FIELDS = [
+    ["id_str"],
+    ["user", "id_str"],
+    ["user", "screen_name"],
+    ["created_at"],
+    ["retweet_count"],
+    ["user", "profile_image_url"],
+]
+
+# The above fields for the base tweet, its retweeted tweet and its quoted tweet.
+# Fields of embedded tweets are None if the tweet is not a retweet/quote.
+TWITTER_V1_FIB_FIELDS = (
+    TWITTER_V1_TWEET_FIELDS
+    + [["retweeted_status"] + path for path in TWITTER_V1_TWEET_FIELDS]
+    + [["quoted_status"] + path for path in TWITTER_V1_TWEET_FIELDS]
+)
+
+# Top-level keys every valid tweet has (see `Tweet_v1.is_valid`)
+TWITTER_V1_REQUIRED_KEYS = ["id_str", "user", "text", "created_at"]
+
+# Fields of a CrowdTangle post object needed to calculate FIB indices
+CROWDTANGLE_FIB_FIELDS = [
+    ["platformId"],
+    ["account", "platformId"],
+    ["account", "handle"],
+    ["account", "name"],
+    ["date"],
+    ["statistics", "actual", "shareCount"],
+    ["postUrl"],
+]
+
+# Top-level keys every valid CrowdTangle post has (see `FbIgPost.is_valid`)
+CROWDTANGLE_REQUIRED_KEYS = ["id"]
+
+
+class FieldProjector:
+    """
+    Project raw post dictionaries onto a fixed list of field paths.
+
+    Each path is a list of keys, from left to right indicating another nested
+    level of the dictionary (just like `get_dict_val`). If a path is not present
+    (or goes too deep) its value is None.
+
+    Example:
+    projector = FieldProjector([["id_str"], ["user", "id_str"], ["user", "name"]])
+    projector.project({"id_str": "1", "user": {"id_str": "2"}})
+    >>> ("1", "2", None)
+    """
+
+    def __init__(self, field_paths, required_keys=None):
+        """
+        Build a single projection function for the field paths.
+
+        Parameters:
+            - field_paths (list[list[str]]): the paths of the fields to extract
+            - required_keys (list[str]): top-level keys that must be present in a
+                post object for it to be valid. Invalid posts are projected to None.
+                Default: None (all posts are valid)
+        """
+        if not isinstance(field_paths, list) or not all(
+            isinstance(path, list)
+            and len(path) > 0
+            and all(isinstance(key, str) for key in path)
+            for path in field_paths
+        ):
+            raise TypeError("`field_paths` must be a list of non-empty lists of strings!")
+        if required_keys is not None and not (
+            isinstance(required_keys, list)
+            and all(isinstance(key, str) for key in required_keys)
+        ):
+            raise TypeError("`required_keys` must be a list of strings or None!")
+
+        self.field_paths = field_paths
+        self.required_keys = required_keys or []
+        # project(post_object) -> tuple of one value per field path, in order. None
+        # if `post_object` is not a dictionary or is missing a required key.
+        self.project = _build_projection(field_paths, self.required_keys)
+
+    def project_line(self, line):
+        """
+        Decode a raw JSON line and return the values of all field paths.
+
+        Parameters:
+            - line (bytes or str): one line of a new-line delimited JSON file
+
+        Returns:
+            - values (tuple or None): one value per field path, in order. None if
+                the line is not a dictionary or is missing a required key.
+        """
+        return self.project(decode_json_line(line))
+
+    def __repr__(self):
+        """
+        Define the representation of the object.
+        """
+        return f"<{self.__class__.__name__}() object with {len(self.field_paths)} fields>"
+
+
+def _build_projection(field_paths, required_keys):
+    """
+    Return a function that projects a post object onto `field_paths`.
+
+    Every prefix shared by several paths (e.g., ["retweeted_status", "user"]) is
+    looked up once per post, and replaced by an empty dictionary if it is missing
+    or not a dictionary. Each field is then a single `.get()` on its prefix.
+
+    Parameters:
+    -----------
+    - field_paths (list[list[str]]) : the paths of the fields to extract
+    - required_keys (list[str]) : top-level keys that must be present
+
+    Returns:
+    -----------
+    - project (function) : project(post_object) -> tuple or None
+    """
+    # Prefix lookups as (parent prefix index, key), in the order they are needed.
+    # Index 0 is the post object itself.
+    prefix_indices = {(): 0}
+    prefix_lookups = []
+    field_lookups = []
+    for path in field_paths:
+        for depth in range(1, len(path)):
+            prefix = tuple(path[:depth])
+            if prefix not in prefix_indices:
+                prefix_indices[prefix] = len(prefix_indices)
+                prefix_lookups.append((prefix_indices[prefix[:-1]], prefix[-1]))
+        field_lookups.append((prefix_indices[tuple(path[:-1])], path[-1]))
+
+    required_keys = tuple(required_keys)
+    prefix_lookups = tuple(prefix_lookups)
+    field_lookups = tuple(field_lookups)
+
+    def project(post_object):
+        if post_object.__class__ is not dict:
+            return None
+        for key in required_keys:
+            if key not in post_object:
+                return None
+
+        levels = [post_object]
+        for parent_idx, key in prefix_lookups:
+            level = levels[parent_idx].get(key)
+            if level.__class__ is not dict:
+                level = _EMPTY
+            levels.append(level)
+        return tuple([levels[level_idx].get(key) for level_idx, key in field_lookups])
+
+    return project
+
+
+# Stand-in for missing nested levels. Never modified.
+_EMPTY = dict()
@@ -0,0 +1,348 @@
+"""
+Read disjoint, line-aligned byte ranges ("shards") of a single gzip file.
+
+Raw data files are single gzip streams, so normally they can only be read from
+start to finish by one decompressor. If the optional `indexed_gzip` package is
+installed, a checkpoint index of the deflate stream is built once per file (one
+full pass) and saved next to it:
+    - {file}.gzidx      : the `indexed_gzip` seek point index
+    - {file}.gzidx.json : a sidecar with the file's size and modification time
+        (to detect changes), its uncompressed size, number of lines and the
+        uncompressed offsets of line starts roughly every CHECKPOINT_SIZE bytes
+
+Workers can then each seek to the start of their own shard and decompress and
+parse only that range of the file. Without `indexed_gzip`, every file is a
+single shard that is read with `gzip.open`.
+"""
+import gzip
+import json
+import os
+import zlib
+
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+HAS_INDEXED_GZIP = indexed_gzip is not None
+
+# Bump this if the sidecar format changes, so that old indices are rebuilt
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".gzidx"
+SIDECAR_SUFFIX = ".gzidx.json"
+
+# Compressed bytes between seek points in the deflate stream. Each seek point
+# stores a 32 KiB window, so this keeps the index small even for huge files,
+# while a worker never decompresses more than this before reaching its shard.
+INDEX_SPACING = 8 * 2**20
+
+# Uncompressed bytes between recorded line starts (i.e., possible shard bounds)
+CHECKPOINT_SIZE = 64 * 2**20
+
+READ_SIZE = 4 * 2**20
+
+# Maximum number of uncompressed bytes produced at a time when counting lines
+MAX_BLOCK_SIZE = 16 * 2**20
+
+# zlib window bits for decoding a gzip header and trailer (RFC 1952)
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+
+def get_index_paths(file_path):
+    """
+    Return the paths of the index and sidecar files of `file_path`. Symbolic
+    links are resolved, so indices are saved next to the raw file itself.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+
+    Returns:
+    -----------
+    - (index_path, sidecar_path) (tuple[str, str])
+    """
+    real_path = os.path.realpath(file_path)
+    return f"{real_path}{INDEX_SUFFIX}", f"{real_path}{SIDECAR_SUFFIX}"
+
+
+def _get_source_signature(file_path):
+    """Return the size and modification time of `file_path`."""
+    file_stat = os.stat(file_path)
+    return {
+        "version": INDEX_VERSION,
+        "source_size": file_stat.st_size,
+        "source_mtime_ns": file_stat.st_mtime_ns,
+    }
+
+
+def load_gzip_index(file_path):
+    """
+    Load the sidecar of `file_path`'s index, if it exists and is up to date.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+
+    Returns:
+    -----------
+    - sidecar (dict or None) : the sidecar (see module docstring), or None if
+        the index has not been built or `file_path` has changed since
+    """
+    index_path, sidecar_path = get_index_paths(file_path)
+    if not (os.path.exists(index_path) and os.path.exists(sidecar_path)):
+        return None
+
+    try:
+        with open(sidecar_path, "r") as f:
+            sidecar = json.load(f)
+    except ValueError:
+        return None
+
+    signature = _get_source_signature(file_path)
+    if any(sidecar.get(key) != value for key, value in signature.items()):
+        return None
+    return sidecar
+
+
+def build_gzip_index(file_path, checkpoint_size=CHECKPOINT_SIZE):
+    """
+    Build the index of `file_path` with a single pass through the file, and save
+    it (and its sidecar) next to the file.
+
+    If the index cannot be saved (e.g., the raw data directory is read-only), it
+    is simply rebuilt the next time it is needed.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+    - checkpoint_size (int) : uncompressed bytes between recorded line starts.
+        Default = CHECKPOINT_SIZE
+
+    Returns:
+    -----------
+    - sidecar (dict) : the sidecar (see module docstring)
+
+    Exceptions:
+    -----------
+    - ImportError, if `indexed_gzip` is not installed
+    """
+    if not HAS_INDEXED_GZIP:
+        raise ImportError("Building a gzip index requires `indexed_gzip`!")
+
+    signature = _get_source_signature(file_path)
+    index_path, sidecar_path = get_index_paths(file_path)
+
+    line_offsets = [0]
+    next_checkpoint = checkpoint_size
+    num_lines = 0
+    position = 0
+    last_byte = b"\n"
+    with indexed_gzip.IndexedGzipFile(file_path, spacing=INDEX_SPACING) as f:
+        # Seek points are added to the index as the stream is decompressed
+        while True:
+            block = f.read(READ_SIZE)
+            if not block:
+                break
+            num_lines += block.count(b"\n")
+
+            # Record the start of the first line after each checkpoint
+            block_end = position + len(block)
+            while next_checkpoint < block_end:
+                newline_idx = block.find(b"\n", max(next_checkpoint - position, 0))
+                if newline_idx == -1:
+                    break
+                line_start = position + newline_idx + 1
+                line_offsets.append(line_start)
+                next_checkpoint = line_start + checkpoint_size
+
+            position = block_end
+            last_byte = block[-1:]
+
+        # A final line without a trailing new line is still a line
+        if last_byte != b"\n":
+            num_lines += 1
+
+        # Offsets equal to the file size are not line starts
+        line_offsets = [offset for offset in line_offsets if offset < position]
+
+        sidecar = dict(
+            signature,
+            uncompressed_size=position,
+            num_lines=num_lines,
+            line_offsets=line_offsets,
+        )
+        try:
+            f.export_index(f"{index_path}.tmp")
+            with open(f"{sidecar_path}.tmp", "w") as outfile:
+                json.dump(sidecar, outfile)
+            os.replace(f"{index_path}.tmp", index_path)
+            os.replace(f"{sidecar_path}.tmp", sidecar_path)
+        except OSError:
+            pass
+
+    return sidecar
+
+
+def get_gzip_index(file_path):
+    """
+    Return the sidecar of `file_path`'s index, building the index if needed.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+
+    Returns:
+    -----------
+    - sidecar (dict or None) : the sidecar, or None if `indexed_gzip` is not
+        installed
+    """
+    if not HAS_INDEXED_GZIP:
+        return None
+    sidecar = load_gzip_index(file_path)
+    if sidecar is None:
+        sidecar = build_gzip_index(file_path)
+    return sidecar
+
+
+def count_gzip_lines(file_path):
+    """
+    Count the lines of `file_path`, reusing its index sidecar if it is up to
+    date. A final line without a trailing new line is counted as well.
+
+    Otherwise, the file is decompressed with `zlib` into blocks of at most
+    MAX_BLOCK_SIZE bytes, and new lines are counted in each block without
+    splitting it into lines. Counting never builds (or saves) an index.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file (possibly with several members)
+
+    Returns:
+    -----------
+    - num_lines (int) : the number of lines in the file
+    """
+    sidecar = load_gzip_index(file_path)
+    if sidecar is not None:
+        return sidecar["num_lines"]
+
+    num_lines = 0
+    last_byte = b"\n"
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    buffer = bytearray(READ_SIZE)
+    with open(file_path, "rb") as f:
+        while True:
+            num_read = f.readinto(buffer)
+            if num_read == 0:
+                break
+
+            data = memoryview(buffer)[:num_read]
+            while data:
+                block = decompressor.decompress(data, MAX_BLOCK_SIZE)
+                if block:
+                    num_lines += block.count(b"\n")
+                    last_byte = block[-1:]
+
+                if decompressor.eof:
+                    # Another gzip member may follow (e.g., appended data)
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+                else:
+                    data = decompressor.unconsumed_tail
+
+        block = decompressor.flush()
+        if block:
+            num_lines += block.count(b"\n")
+            last_byte = block[-1:]
+
+    # A final line without a trailing new line is still a line
+    if last_byte != b"\n":
+        num_lines += 1
+
+    return num_lines
+
+
+def get_line_shards(file_path, num_shards):
+    """
+    Split `file_path` into at most `num_shards` line-aligned shards of similar
+    (uncompressed) size.
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+    - num_shards (int) : the maximum number of shards
+
+    Returns:
+    -----------
+    - shards (list[tuple]) : (start, end) uncompressed byte offsets of each
+        shard, in order. `end` is None for a shard that ends at the end of the
+        file. Without `indexed_gzip`, this is always [(0, None)].
+
+    Exceptions:
+    -----------
+    - TypeError
+    """
+    if not isinstance(num_shards, int):
+        raise TypeError("`num_shards` must be an integer!")
+    if num_shards <= 1 or not HAS_INDEXED_GZIP:
+        return [(0, None)]
+
+    sidecar = get_gzip_index(file_path)
+    line_offsets = sidecar["line_offsets"]
+    uncompressed_size = sidecar["uncompressed_size"]
+
+    # Use the first line start at or after each evenly spaced target
+    bounds = [0]
+    checkpoint_idx = 0
+    for shard_num in range(1, num_shards):
+        target = uncompressed_size * shard_num // num_shards
+        while (
+            checkpoint_idx < len(line_offsets)
+            and line_offsets[checkpoint_idx] < target
+        ):
+            checkpoint_idx += 1
+        if checkpoint_idx == len(line_offsets):
+            break
+        if line_offsets[checkpoint_idx] > bounds[-1]:
+            bounds.append(line_offsets[checkpoint_idx])
+
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def iter_shard_lines(file_path, start=0, end=None):
+    """
+    Yield the raw lines of `file_path` in the uncompressed byte range
+    [start, end). `start` and `end` must be line starts (see `get_line_shards`).
+
+    Parameters:
+    -----------
+    - file_path (str) : path to a gzip file
+    - start (int) : uncompressed offset of the first line. Default = 0
+    - end (int) : uncompressed offset after the last line. Default = None (read
+        until the end of the file)
+
+    Yields:
+    -----------
+    - line (bytes) : the next raw line (including its new line)
+    """
+    if start == 0 and end is None:
+        with gzip.open(file_path, "rb") as f:
+            yield from f
+        return
+
+    # Without a saved index, seeking builds the index up to `start`
+    index_path, _ = get_index_paths(file_path)
+    index_file = index_path if load_gzip_index(file_path) is not None else None
+    with indexed_gzip.IndexedGzipFile(
+        file_path, spacing=INDEX_SPACING, index_file=index_file
+    ) as f:
+        f.seek(start)
+        if end is None:
+            yield from f
+            return
+
+        position = start
+        for line in f:
+            yield line
+            position += len(line)
+            if position >= end:
+                break
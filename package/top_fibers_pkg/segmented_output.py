@@ -0,0 +1,272 @@
+"""
+Checkpointed, per-domain output for long-running collections (e.g., CrowdTangle
+posts matching each domain of the iffy list).
+
+Each domain's posts are written to their own segment file, in a directory next
+to the final output file ({output_file}.segments). Every page of posts (i.e.,
+every query) is written as a separate gzip member and, once it is complete, the
+segment is flushed to disk and the domain's checkpoint is saved next to it:
+    - {name}.jsonl.gzip      : the domain's segment
+    - {name}.checkpoint.json : the cursor of the next query (the end of the
+        period still to collect), whether the domain is completed, the number of
+        posts collected and the size of the segment at the checkpoint
+
+If the collection is interrupted, a segment may end with a partial page, written
+after its last checkpoint. Reopening the segment truncates it back to the
+checkpointed size, so a restart skips completed domains and continues the others
+from their cursors without writing any post twice.
+
+Once all domains are collected, the segments are concatenated (in the order of
+the domains) into the final output file. Concatenated gzip members are a valid
+gzip file, so segments are copied as they are, without recompressing them.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+SEGMENTS_SUFFIX = ".segments"
+SEGMENT_SUFFIX = ".jsonl.gzip"
+CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+# Bump this if the checkpoint format changes, so that old checkpoints are ignored
+CHECKPOINT_VERSION = 1
+
+# Characters kept in segment file names (others are replaced by "_")
+_UNSAFE_CHARS_REGEX = re.compile(r"[^A-Za-z0-9.-]")
+
+
+def _write_json(data, path):
+    """Write `data` to `path` as JSON, atomically."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class DomainSegment:
+    """
+    The segment file and checkpoint of a single domain.
+
+    Posts are written with `write_post` and only kept once the page they belong
+    to is committed with `commit_page`.
+    """
+
+    def __init__(self, segments_dir, domain, compress_level=6):
+        """
+        Open the segment of `domain`, restoring its last checkpoint (if any).
+
+        Parameters:
+            - segments_dir (str): the directory of the segments
+            - domain (str): the domain
+            - compress_level (int): gzip compression level (1-9). Default: 6
+        """
+        self.domain = domain
+        self.compress_level = compress_level
+
+        # Domains may include a path (e.g., "stormfront.org/forum"), so they are
+        # cleaned up and a short hash keeps names unique
+        domain_hash = hashlib.sha1(domain.encode("utf-8")).hexdigest()[:10]
+        name = f"{_UNSAFE_CHARS_REGEX.sub('_', domain)}__{domain_hash}"
+        self.segment_path = os.path.join(segments_dir, f"{name}{SEGMENT_SUFFIX}")
+        self.checkpoint_path = os.path.join(segments_dir, f"{name}{CHECKPOINT_SUFFIX}")
+
+        self.cursor = None
+        self.completed = False
+        self.num_posts = 0
+        self.segment_size = 0
+        self._load_checkpoint()
+
+        # Drop anything written after the last checkpoint (e.g., a partial page)
+        if not os.path.exists(self.segment_path):
+            open(self.segment_path, "wb").close()
+        self._file = open(self.segment_path, "r+b")
+        self._file.truncate(self.segment_size)
+        self._file.seek(self.segment_size)
+        self._page = None
+        self._page_num_posts = 0
+
+    def _load_checkpoint(self):
+        """Restore the last checkpoint, unless it is missing or invalid."""
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            return
+        if checkpoint.get("domain") != self.domain:
+            return
+        # The segment must hold (at least) all checkpointed posts
+        if not os.path.exists(self.segment_path):
+            return
+        if os.path.getsize(self.segment_path) < checkpoint["segment_size"]:
+            return
+
+        self.cursor = checkpoint["cursor"]
+        self.completed = checkpoint["completed"]
+        self.num_posts = checkpoint["num_posts"]
+        self.segment_size = checkpoint["segment_size"]
+
+    def _save_checkpoint(self):
+        """Save the current checkpoint."""
+        _write_json(
+            {
+                "version": CHECKPOINT_VERSION,
+                "domain": self.domain,
+                "cursor": self.cursor,
+                "completed": self.completed,
+                "num_posts": self.num_posts,
+                "segment_size": self.segment_size,
+            },
+            self.checkpoint_path,
+        )
+
+    def write_post(self, post_json):
+        """
+        Write the JSON text of one post (on a single line) to the current page.
+
+        Parameters:
+            - post_json (str): the post's JSON text
+        """
+        if self._page is None:
+            self._page = gzip.GzipFile(
+                fileobj=self._file, mode="wb", compresslevel=self.compress_level
+            )
+        self._page.write(f"{post_json}\n".encode(encoding="utf-8"))
+        self._page_num_posts += 1
+
+    def commit_page(self, cursor):
+        """
+        Keep the posts of the current page and checkpoint the domain.
+
+        Parameters:
+            - cursor (str): where the next query should continue from (the end of
+                the period still to collect)
+        """
+        if self._page is not None:
+            # Closing the gzip member writes its trailer (not the segment file)
+            self._page.close()
+            self._page = None
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        self.cursor = cursor
+        self.num_posts += self._page_num_posts
+        self.segment_size = self._file.tell()
+        self._page_num_posts = 0
+        self._save_checkpoint()
+
+    def mark_completed(self):
+        """Checkpoint the domain as completed."""
+        self.completed = True
+        self._save_checkpoint()
+
+    def close(self):
+        """Close the segment file. Posts that were not committed are dropped."""
+        if self._page is not None:
+            self._page.close()
+            self._page = None
+            self._file.truncate(self.segment_size)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SegmentedOutput:
+    """
+    Per-domain segments of an output file (see the module docstring).
+
+    Example:
+    output = SegmentedOutput(output_file_path, domains)
+    for domain in output.get_incomplete_domains():
+        with output.open_segment(domain) as segment:
+            ...
+    output.concatenate()
+    """
+
+    def __init__(self, output_path, domains, compress_level=6):
+        """
+        Create the segments directory (if needed).
+
+        Parameters:
+            - output_path (str): path of the final output file
+            - domains (list[str]): the (unique) domains, in the order of the
+                output file
+            - compress_level (int): gzip compression level (1-9). Default: 6
+
+        Exceptions:
+            - TypeError, ValueError
+        """
+        if not isinstance(output_path, str):
+            raise TypeError("`output_path` must be a string!")
+        if not isinstance(domains, list):
+            raise TypeError("`domains` must be a list!")
+        if len(set(domains)) != len(domains):
+            raise ValueError("`domains` must not include duplicates!")
+
+        self.output_path = output_path
+        self.domains = domains
+        self.compress_level = compress_level
+        self.segments_dir = f"{output_path}{SEGMENTS_SUFFIX}"
+        os.makedirs(self.segments_dir, exist_ok=True)
+
+    def open_segment(self, domain):
+        """
+        Open the segment of `domain` (see `DomainSegment`).
+
+        Parameters:
+            - domain (str): the domain
+
+        Returns:
+            - segment (DomainSegment)
+        """
+        return DomainSegment(self.segments_dir, domain, self.compress_level)
+
+    def get_incomplete_domains(self):
+        """
+        Return the domains that are not completed, in order.
+
+        Returns:
+            - domains (list[str])
+        """
+        incomplete_domains = []
+        for domain in self.domains:
+            with self.open_segment(domain) as segment:
+                if not segment.completed:
+                    incomplete_domains.append(domain)
+        return incomplete_domains
+
+    def concatenate(self, remove_segments=True):
+        """
+        Concatenate the (checkpointed part of the) segments, in the order of the
+        domains, into the output file.
+
+        Parameters:
+            - remove_segments (bool): remove the segments directory afterwards.
+                Default: True
+
+        Returns:
+            - num_posts (int): the number of posts in the output file
+        """
+        num_posts = 0
+        tmp_path = f"{self.output_path}.tmp"
+        with open(tmp_path, "wb") as outfile:
+            for domain in self.domains:
+                # Opening the segment truncates it to its checkpointed size
+                with self.open_segment(domain) as segment:
+                    num_posts += segment.num_posts
+                with open(segment.segment_path, "rb") as infile:
+                    shutil.copyfileobj(infile, outfile)
+        os.replace(tmp_path, self.output_path)
+
+        if remove_segments:
+            shutil.rmtree(self.segments_dir)
+        return num_posts
@@ -0,0 +1,134 @@
+"""
+Functions for caching the store of all posts used in one FIB calculation.
+
+Everything downstream of data extraction in the FIB scripts (FIB indices, top
+spreader selection and the top spreader posts frame) only needs the store of the
+posts inside the time window. Saving that store lets a crashed run, or a re-run
+with different NUM_SPREADERS/SPREADER_TYPE settings, skip data extraction
+entirely.
+
+The store is saved as an Arrow IPC file (see `InternedPostStore.to_arrow`), named
+after a hash of the input files (their paths, sizes and modification times, in
+order) and the earliest date of the time window. Loading memory-maps the file and
+returns a read-only store whose per-post arrays are views of the mapped buffers,
+so nothing is parsed or copied up front.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import pyarrow as pa
+
+from .interned_store import InternedPostStore
+
+# Bump this if the saved format (or the data extracted into stores) changes, so
+# that old cached stores are ignored
+STORE_CACHE_VERSION = "2"
+STORE_CACHE_SUFFIX = ".fib_store.arrow"
+
+# Number of cached stores kept in a cache directory (the most recently saved)
+MAX_CACHED_STORES = 3
+
+
+def get_store_cache_path(cache_dir, data_files, earliest_date_tstamp):
+    """
+    Return the path of the cached store of `data_files` and the time window
+    starting at `earliest_date_tstamp`.
+
+    Parameters:
+    -----------
+    - cache_dir (str) : directory where cached stores are saved
+    - data_files (list) : list of full paths to raw data files, in the order
+        they are parsed (symbolic links are resolved)
+    - earliest_date_tstamp (timestamp) : the earliest date of the time window
+
+    Returns:
+    -----------
+    - path (str) : full path to the cached store's Arrow IPC file
+    """
+    signature = [STORE_CACHE_VERSION, earliest_date_tstamp]
+    for file in data_files:
+        file_stat = os.stat(file)
+        signature.append(
+            [os.path.realpath(file), file_stat.st_size, file_stat.st_mtime_ns]
+        )
+    key = hashlib.sha256(json.dumps(signature).encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}{STORE_CACHE_SUFFIX}")
+
+
+def save_store_cache(store, cache_dir, data_files, earliest_date_tstamp):
+    """
+    Save the store of `data_files` and the time window starting at
+    `earliest_date_tstamp` to `cache_dir`. Only the MAX_CACHED_STORES most
+    recently saved stores are kept.
+
+    The file is written to a temporary path first and then renamed, so an
+    interrupted run never leaves a truncated cached store behind.
+
+    Parameters:
+    -----------
+    - store (InternedPostStore) : the store of all posts in the time window
+    - cache_dir (str) : directory where cached stores are saved. It is created
+        if it does not exist.
+    - data_files (list) : list of full paths to the raw data files `store` was
+        built from, in the order they were parsed
+    - earliest_date_tstamp (timestamp) : the earliest date of the time window
+
+    Returns:
+    -----------
+    - path (str) : full path to the saved file
+
+    Exceptions:
+    -----------
+    - TypeError
+    """
+    if not isinstance(store, InternedPostStore):
+        raise TypeError("`store` must be an InternedPostStore!")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = get_store_cache_path(cache_dir, data_files, earliest_date_tstamp)
+
+    table = store.to_arrow()
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    # Drop the oldest cached stores (e.g., those of previous months)
+    cached_paths = sorted(
+        glob.glob(os.path.join(cache_dir, f"*{STORE_CACHE_SUFFIX}")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for old_path in cached_paths[MAX_CACHED_STORES:]:
+        os.remove(old_path)
+
+    return path
+
+
+def load_store_cache(cache_dir, data_files, earliest_date_tstamp):
+    """
+    Load the cached store of `data_files` and the time window starting at
+    `earliest_date_tstamp` from `cache_dir`, without copying its data.
+
+    Parameters:
+    -----------
+    - cache_dir (str) : directory where cached stores are saved
+    - data_files (list) : list of full paths to raw data files, in the order
+        they are parsed
+    - earliest_date_tstamp (timestamp) : the earliest date of the time window
+
+    Returns:
+    -----------
+    - store (InternedPostStore or None) : a read-only store (see
+        `InternedPostStore.from_arrow`), or None if there is no cached store for
+        these files (or any of them changed since it was saved) and window
+    """
+    path = get_store_cache_path(cache_dir, data_files, earliest_date_tstamp)
+    if not os.path.exists(path):
+        return None
+
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return InternedPostStore.from_arrow(table, copy=False)
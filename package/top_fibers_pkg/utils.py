@@ -144,6 +144,31 @@ def parse_cl_args_fib(script_purpose="", logger=None):
         help="The number of months to consider (e.g., input 3 to consider three months)",
         required=True,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="Number of workers",
+        help=(
+            "The number of processes used to parse data files in parallel. "
+            "Default = 1 (parse files one after another in this process)"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-c",
+        "--cache-dir",
+        metavar="Partial store directory",
+        help=(
+            "Full path to a directory where the parsed data of each raw file is "
+            "saved and loaded from, so only new or changed files are parsed. "
+            "The data of the whole time window is cached there as well, so re-runs "
+            "with the same files and window skip data extraction. "
+            "E.g.: /home/data/apps/topfibers/repo/data/derived/partial_stores/twitter. "
+            "Default = None (parse all files)"
+        ),
+        default=None,
+    )
 
     # Read parsed arguments from the command line into "args"
     args = parser.parse_args()
@@ -214,6 +239,25 @@ def parse_cl_args_ct_dl(script_purpose="", logger=None):
         help="The number of months that you'd like to download (works backwards from --last-month)",
         required=True,
     )
+    parser.add_argument(
+        "-c",
+        "--concurrent-domains",
+        metavar="Concurrent domains",
+        help="The number of domains searched at the same time. Default = 4",
+        type=int,
+        default=4,
+    )
+    parser.add_argument(
+        "-r",
+        "--calls-per-minute",
+        metavar="Calls per minute",
+        help=(
+            "The maximum number of CrowdTangle API calls per minute, across all "
+            "domains. Default = 7.5 (one call every 8 seconds)"
+        ),
+        type=float,
+        default=7.5,
+    )
 
     # Read parsed arguments from the command line into "args"
     args = parser.parse_args()
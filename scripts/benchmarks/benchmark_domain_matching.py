@@ -0,0 +1,164 @@
+"""
+Purpose:
+    Benchmark the compiled domain matcher (top_fibers_pkg.domains.DomainMatcher)
+    against the approach previously used by parse_raw_files.get_tweets: `urlparse`
+    every URL, keep the last two labels of its host and check them against a set
+    of domains.
+
+    A synthetic list of domains is generated (including domains under multi-label
+    suffixes like "co.uk", listed subdomains and domains listed with a path),
+    along with URLs on those domains, their subdomains and unlisted domains. As on
+    Twitter, a small number of hosts make up most URLs.
+
+Inputs:
+    -n / --num-urls: number of synthetic URLs to generate (default: 2,000,000)
+    -d / --domains-dir: match against the latest iffy list in this directory
+        instead of a synthetic list (optional)
+    -s / --seed: random seed (default: 42)
+
+Outputs:
+    Timing results and the number of URLs the two approaches disagree on printed
+    to the console.
+"""
+import argparse
+import random
+import time
+
+from urllib.parse import urlparse
+
+from top_fibers_pkg.domains import DomainMatcher, load_domains
+
+SCRIPT_PURPOSE = "Benchmark the compiled domain matcher on synthetic URLs."
+SUFFIXES = ["com", "org", "net", "news", "co.uk", "com.au", "co.nz"]
+SUBDOMAINS = ["www", "m", "amp", "news", "en", "de"]
+NUM_DOMAINS = 700
+NUM_UNLISTED_DOMAINS = 20_000
+
+
+def parse_cl_args(script_purpose=""):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+
+    Returns
+    --------------
+    - args (argparse.Namespace) : the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description=script_purpose)
+    parser.add_argument(
+        "-n",
+        "--num-urls",
+        metavar="Number of URLs",
+        help="Number of synthetic URLs to generate",
+        type=int,
+        default=2_000_000,
+    )
+    parser.add_argument(
+        "-d",
+        "--domains-dir",
+        metavar="Domains dir",
+        help="Match against the latest iffy list in this directory",
+        default=None,
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        metavar="Seed",
+        help="Random seed",
+        type=int,
+        default=42,
+    )
+    return parser.parse_args()
+
+
+def make_domains(rng):
+    """Return a synthetic list of domains, cleaned like `load_domains` output."""
+    domains = []
+    for num in range(NUM_DOMAINS):
+        domain = f"iffy{num}.{rng.choice(SUFFIXES)}"
+        roll = rng.random()
+        if roll < 0.05:
+            domain = f"{rng.choice(SUBDOMAINS[1:])}.{domain}"
+        elif roll < 0.1:
+            domain = f"{domain}/section{num}"
+        domains.append(domain)
+    return domains
+
+
+def make_urls(rng, domains, num_urls):
+    """
+    Return `num_urls` synthetic URLs: about a third on listed domains (or their
+    subdomains) and the rest on unlisted domains, some under the same suffixes.
+    """
+    listed_hosts = []
+    for domain in domains:
+        host, _, path = domain.partition("/")
+        listed_hosts.append((host, f"/{path}" if path else ""))
+        listed_hosts.append((f"{rng.choice(SUBDOMAINS)}.{host}", ""))
+    unlisted_hosts = [
+        (f"{rng.choice(SUBDOMAINS)}.site{num}.{rng.choice(SUFFIXES)}", "")
+        for num in range(NUM_UNLISTED_DOMAINS)
+    ]
+
+    urls = []
+    for _ in range(num_urls):
+        hosts = listed_hosts if rng.random() < 0.33 else unlisted_hosts
+        # Skewed towards the first hosts, so that some hosts are very common
+        host, path = hosts[int(len(hosts) * rng.random() ** 3)]
+        urls.append(f"https://{host}{path}/{rng.randrange(10**6)}?utm_source=tw")
+    return urls
+
+
+def get_base_domain(url):
+    """Return the last two labels of the URL's host (the previous approach)."""
+    parsed_url = urlparse(url)
+    domain_parts = parsed_url.netloc.split(".")
+    base_domain = ".".join(domain_parts[-2:])
+    return base_domain
+
+
+if __name__ == "__main__":
+    args = parse_cl_args(SCRIPT_PURPOSE)
+    rng = random.Random(args.seed)
+
+    if args.domains_dir is None:
+        domains = make_domains(rng)
+    else:
+        domains = load_domains(args.domains_dir)
+    print(f"Number of domains: {len(domains):,}")
+
+    print(f"Generating {args.num_urls:,} synthetic URLs...")
+    urls = make_urls(rng, domains, args.num_urls)
+
+    print("Timing urlparse + last two labels + set lookup...")
+    start = time.perf_counter()
+    domains_set = set(domains)
+    baseline_matches = [get_base_domain(url) in domains_set for url in urls]
+    baseline_time = time.perf_counter() - start
+    print(
+        f"\t- {baseline_time:.2f} seconds "
+        f"({args.num_urls / baseline_time:,.0f} URLs/s)"
+    )
+
+    print("Timing DomainMatcher (including compiling the list)...")
+    start = time.perf_counter()
+    domain_matcher = DomainMatcher(domains)
+    matcher_matches = [domain_matcher.matches(url) for url in urls]
+    matcher_time = time.perf_counter() - start
+    print(
+        f"\t- {matcher_time:.2f} seconds ({args.num_urls / matcher_time:,.0f} URLs/s), "
+        f"speed up: {baseline_time / matcher_time:.1f}x"
+    )
+
+    num_matches = sum(matcher_matches)
+    num_disagreements = sum(
+        baseline != matcher
+        for baseline, matcher in zip(baseline_matches, matcher_matches)
+    )
+    print(f"URLs matched by DomainMatcher: {num_matches:,}")
+    print(f"URLs the two approaches disagree on: {num_disagreements:,}")
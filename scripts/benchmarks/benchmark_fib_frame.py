@@ -0,0 +1,150 @@
+"""
+Purpose:
+    Benchmark the fused FIB frame aggregator (fib_helpers.create_fib_frame_fused)
+    against the three-pass approach (create_userid_total_reshares,
+    create_userid_reshare_lists and create_fib_frame) the FIB scripts used to run.
+
+    Both time and peak traced memory (tracemalloc) are reported, and the two
+    resulting frames are checked to be identical.
+
+Inputs:
+    -u / --num-users: number of synthetic users to generate (default: 500,000)
+    -s / --seed: random seed (default: 42)
+
+Outputs:
+    Timing and memory results printed to the console.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from top_fibers_pkg.fib_helpers import (
+    create_userid_total_reshares,
+    create_userid_reshare_lists,
+    create_fib_frame,
+    create_fib_frame_fused,
+)
+
+SCRIPT_PURPOSE = "Benchmark the fused FIB frame aggregator against the three-pass approach."
+
+
+def parse_cl_args(script_purpose=""):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+
+    Returns
+    --------------
+    - args (argparse.Namespace) : the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description=script_purpose)
+    parser.add_argument(
+        "-u",
+        "--num-users",
+        metavar="Number of users",
+        help="Number of synthetic users to generate",
+        type=int,
+        default=500_000,
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        metavar="Seed",
+        help="Random seed",
+        type=int,
+        default=42,
+    )
+    return parser.parse_args()
+
+
+def make_synthetic_dicts(num_users, seed):
+    """
+    Create synthetic inputs shaped like the output of `extract_data_from_files`.
+
+    Parameters:
+    -----------
+    - num_users (int) : number of users to generate
+    - seed (int) : random seed
+
+    Returns:
+    -----------
+    - postid_num_reshares (dict) : {post_id_str : number of reshares in data}
+    - userid_postids (dict) : {userid_x : set([postids sent by userid_x])}
+    - userid_username (dict) : {userid : username}
+    """
+    rng = np.random.default_rng(seed)
+    posts_per_user = rng.zipf(2.0, size=num_users).clip(max=5_000).tolist()
+    rt_counts = (rng.pareto(1.2, size=sum(posts_per_user)) * 3).astype(int).tolist()
+
+    postid_num_reshares = dict()
+    userid_postids = dict()
+    userid_username = dict()
+    post_num = 0
+    for user_num, num_posts in enumerate(posts_per_user):
+        user_id = str(10**12 + user_num)
+        post_ids = set()
+        for _ in range(num_posts):
+            post_id = str(10**18 + post_num)
+            postid_num_reshares[post_id] = rt_counts[post_num]
+            post_ids.add(post_id)
+            post_num += 1
+        userid_postids[user_id] = post_ids
+        userid_username[user_id] = f"user_{user_num}"
+    return postid_num_reshares, userid_postids, userid_username
+
+
+def three_pass(postid_num_reshares, userid_postids, userid_username):
+    """Create the FIB frame the way the FIB scripts used to."""
+    userid_total_reshares = create_userid_total_reshares(
+        postid_num_reshares, userid_postids
+    )
+    userid_reshare_lists = create_userid_reshare_lists(
+        postid_num_reshares, userid_postids
+    )
+    return create_fib_frame(
+        userid_reshare_lists, userid_username, userid_total_reshares
+    )
+
+
+def measure(func, *args):
+    """Return the result of func(*args), its run time and peak traced memory."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    run_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, run_time, peak
+
+
+if __name__ == "__main__":
+    args = parse_cl_args(SCRIPT_PURPOSE)
+
+    print(f"Generating {args.num_users:,} synthetic users...")
+    inputs = make_synthetic_dicts(args.num_users, args.seed)
+    print(f"\t- Total posts: {len(inputs[0]):,}")
+
+    print("Measuring three-pass approach...")
+    old_frame, old_time, old_peak = measure(three_pass, *inputs)
+    print(f"\t- {old_time:.2f} seconds, peak memory {old_peak / 2**20:,.1f} MiB")
+
+    print("Measuring fused aggregator...")
+    new_frame, new_time, new_peak = measure(create_fib_frame_fused, *inputs)
+    print(f"\t- {new_time:.2f} seconds, peak memory {new_peak / 2**20:,.1f} MiB")
+
+    pd.testing.assert_frame_equal(
+        old_frame.sort_values("user_id").reset_index(drop=True),
+        new_frame.sort_values("user_id").reset_index(drop=True),
+        check_dtype=False,
+    )
+    print("Results are identical.")
+    print(f"Speed up: {old_time / new_time:.1f}x")
+    print(f"Peak memory reduction: {old_peak / new_peak:.1f}x")
@@ -0,0 +1,112 @@
+"""
+Purpose:
+    Benchmark the batch FIB-index engine (fib_helpers.calc_fib_indices_batch)
+    against the per-user loop over fib_helpers.calc_fib_index that the FIB scripts
+    have historically used.
+
+    Synthetic users are generated with a heavy-tailed number of posts and
+    heavy-tailed reshare counts, roughly mimicking a three-month Twitter window.
+    Both approaches are checked to return exactly the same FIB indices.
+
+Inputs:
+    -u / --num-users: number of synthetic users to generate (default: 1,000,000)
+    -s / --seed: random seed (default: 42)
+
+Outputs:
+    Timing results printed to the console.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from top_fibers_pkg.fib_helpers import calc_fib_index, calc_fib_indices_batch
+
+SCRIPT_PURPOSE = "Benchmark the batch FIB-index engine against the per-user loop."
+
+
+def parse_cl_args(script_purpose=""):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+
+    Returns
+    --------------
+    - args (argparse.Namespace) : the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description=script_purpose)
+    parser.add_argument(
+        "-u",
+        "--num-users",
+        metavar="Number of users",
+        help="Number of synthetic users to generate",
+        type=int,
+        default=1_000_000,
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        metavar="Seed",
+        help="Random seed",
+        type=int,
+        default=42,
+    )
+    return parser.parse_args()
+
+
+def make_synthetic_counts(num_users, seed):
+    """
+    Create synthetic reshare counts in CSR layout.
+
+    Parameters:
+    -----------
+    - num_users (int) : number of users to generate
+    - seed (int) : random seed
+
+    Returns:
+    -----------
+    - rt_counts (numpy.ndarray) : flat array of reshare counts for all users
+    - offsets (numpy.ndarray) : offsets marking each user's segment of `rt_counts`
+    """
+    rng = np.random.default_rng(seed)
+    posts_per_user = rng.zipf(2.0, size=num_users).clip(max=5_000)
+    offsets = np.zeros(num_users + 1, dtype=np.int64)
+    np.cumsum(posts_per_user, out=offsets[1:])
+    rt_counts = (rng.pareto(1.2, size=offsets[-1]) * 3).astype(np.int64)
+    return rt_counts, offsets
+
+
+if __name__ == "__main__":
+    args = parse_cl_args(SCRIPT_PURPOSE)
+
+    print(f"Generating {args.num_users:,} synthetic users...")
+    rt_counts, offsets = make_synthetic_counts(args.num_users, args.seed)
+    print(f"\t- Total posts: {len(rt_counts):,}")
+
+    # The per-user loop works on Python lists, just like the FIB scripts
+    rt_lists = [
+        rt_counts[start:end].tolist() for start, end in zip(offsets[:-1], offsets[1:])
+    ]
+
+    print("Timing per-user loop (calc_fib_index)...")
+    start = time.perf_counter()
+    loop_results = [calc_fib_index(rt_list) for rt_list in rt_lists]
+    loop_time = time.perf_counter() - start
+    print(f"\t- {loop_time:.2f} seconds")
+
+    print("Timing batch engine (calc_fib_indices_batch)...")
+    start = time.perf_counter()
+    batch_results = calc_fib_indices_batch(rt_counts, offsets)
+    batch_time = time.perf_counter() - start
+    print(f"\t- {batch_time:.2f} seconds")
+
+    if not np.array_equal(np.asarray(loop_results), batch_results):
+        raise ValueError("Batch FIB indices do not match the per-user loop!")
+
+    print("Results are identical.")
+    print(f"Speed up: {loop_time / batch_time:.1f}x")
@@ -0,0 +1,181 @@
+"""
+Purpose:
+    Benchmark the JSON decoding backends available in top_fibers_pkg.json_decoding
+    against the `json.loads(line.decode())` pattern previously used by every
+    script that reads raw posts.
+
+    A synthetic corpus shaped like Decahose (Twitter V1) lines is generated in
+    memory: full user objects, entities, and nested retweeted/quoted statuses.
+
+Inputs:
+    -n / --num-lines: number of synthetic lines to generate (default: 100,000)
+    -s / --seed: random seed (default: 42)
+
+Outputs:
+    Timing results printed to the console.
+"""
+import argparse
+import json
+import random
+import time
+
+from top_fibers_pkg.json_decoding import (
+    AVAILABLE_BACKENDS,
+    decode_json_line,
+    get_json_backend,
+    set_json_backend,
+)
+
+SCRIPT_PURPOSE = "Benchmark JSON decoding backends on a synthetic Decahose corpus."
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def parse_cl_args(script_purpose=""):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+
+    Returns
+    --------------
+    - args (argparse.Namespace) : the parsed arguments
+    """
+    parser = argparse.ArgumentParser(description=script_purpose)
+    parser.add_argument(
+        "-n",
+        "--num-lines",
+        metavar="Number of lines",
+        help="Number of synthetic lines to generate",
+        type=int,
+        default=100_000,
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        metavar="Seed",
+        help="Random seed",
+        type=int,
+        default=42,
+    )
+    return parser.parse_args()
+
+
+def make_user(rng):
+    """Return a synthetic V1 user object."""
+    user_num = rng.randrange(10**9)
+    return {
+        "id": user_num,
+        "id_str": str(user_num),
+        "name": f"User Name {user_num} ✨",
+        "screen_name": f"user_{user_num}",
+        "location": rng.choice(["", "Bloomington, IN", "Earth", None]),
+        "url": None,
+        "description": "Just a synthetic account tweeting about things " * 2,
+        "protected": False,
+        "verified": rng.random() < 0.01,
+        "followers_count": rng.randrange(10**6),
+        "friends_count": rng.randrange(10**4),
+        "listed_count": rng.randrange(10**3),
+        "favourites_count": rng.randrange(10**5),
+        "statuses_count": rng.randrange(10**5),
+        "created_at": "Wed Oct 10 20:19:24 +0000 2018",
+        "geo_enabled": False,
+        "lang": None,
+        "profile_background_color": "F5F8FA",
+        "profile_image_url": f"http://pbs.twimg.com/profile_images/{user_num}/x_normal.jpg",
+        "profile_image_url_https": f"https://pbs.twimg.com/profile_images/{user_num}/x_normal.jpg",
+        "default_profile": True,
+        "default_profile_image": False,
+    }
+
+
+def make_tweet(rng, depth=0):
+    """Return a synthetic V1 tweet object, possibly with nested statuses."""
+    tweet_num = rng.randrange(10**18, 10**19)
+    tweet = {
+        "created_at": (
+            f"{rng.choice(DAYS)} {rng.choice(MONTHS)} {rng.randrange(1, 29):02d} "
+            f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d} "
+            "+0000 2023"
+        ),
+        "id": tweet_num,
+        "id_str": str(tweet_num),
+        "text": "Some text with a link https://t.co/abcdefg and #hashtag " * 2,
+        "source": '<a href="http://twitter.com/download/iphone">Twitter for iPhone</a>',
+        "truncated": False,
+        "in_reply_to_status_id": None,
+        "user": make_user(rng),
+        "geo": None,
+        "coordinates": None,
+        "place": None,
+        "is_quote_status": False,
+        "quote_count": rng.randrange(100),
+        "reply_count": rng.randrange(100),
+        "retweet_count": rng.randrange(10**4),
+        "favorite_count": rng.randrange(10**4),
+        "entities": {
+            "hashtags": [{"text": "hashtag", "indices": [60, 68]}],
+            "urls": [
+                {
+                    "url": "https://t.co/abcdefg",
+                    "expanded_url": f"https://www.example{rng.randrange(100)}.com/a/b",
+                    "display_url": "example.com/a/b",
+                    "indices": [23, 46],
+                }
+            ],
+            "user_mentions": [],
+            "symbols": [],
+        },
+        "favorited": False,
+        "retweeted": False,
+        "filter_level": "low",
+        "lang": "en",
+        "timestamp_ms": str(rng.randrange(10**12, 10**13)),
+    }
+    if depth == 0:
+        roll = rng.random()
+        if roll < 0.6:
+            tweet["retweeted_status"] = make_tweet(rng, depth + 1)
+        if 0.5 < roll < 0.7:
+            tweet["quoted_status"] = make_tweet(rng, depth + 1)
+    return tweet
+
+
+def time_decoding(lines, decode):
+    """Return the number of seconds it takes to decode all lines."""
+    start = time.perf_counter()
+    for line in lines:
+        decode(line)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parse_cl_args(SCRIPT_PURPOSE)
+    rng = random.Random(args.seed)
+
+    print(f"Generating {args.num_lines:,} synthetic Decahose lines...")
+    lines = [
+        f"{json.dumps(make_tweet(rng))}\n".encode("utf-8")
+        for _ in range(args.num_lines)
+    ]
+    num_mb = sum(len(line) for line in lines) / 2**20
+    print(f"\t- Corpus size: {num_mb:,.1f} MiB")
+    print(f"Default backend: {get_json_backend()}")
+
+    print("Timing json.loads(line.decode())...")
+    baseline_time = time_decoding(lines, lambda line: json.loads(line.decode()))
+    print(f"\t- {baseline_time:.2f} seconds ({num_mb / baseline_time:,.1f} MiB/s)")
+
+    for backend in AVAILABLE_BACKENDS:
+        set_json_backend(backend)
+        print(f"Timing decode_json_line with backend '{backend}'...")
+        backend_time = time_decoding(lines, decode_json_line)
+        print(
+            f"\t- {backend_time:.2f} seconds ({num_mb / backend_time:,.1f} MiB/s), "
+            f"speed up: {baseline_time / backend_time:.1f}x"
+        )
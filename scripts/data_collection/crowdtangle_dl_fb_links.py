@@ -3,10 +3,18 @@ Purpose:
     Download Facebook posts from CrowdTangle based on a list of links.
     NOTE:
         - Requires a CrowdTangle API token
-        - The data pulled is dictated by the constant variables at the top of the script.
-        Particularly important are:
-            - NUMBER_OF_MONTHS_TO_PULL
-            - OFFSET
+        - The data pulled is dictated by the command line arguments.
+        - Several domains are searched at the same time, under one rate limit shared
+            by all of them (see top_fibers_pkg.crowdtangle_collector).
+        - Posts are written as each response is streamed in, so large responses
+            are never held in memory.
+        - Each domain's posts are written to its own segment, checkpointed after
+            every query, in the {output_file}.segments directory. If the script
+            is interrupted, running it again (for the same period) skips the
+            completed domains and continues the others from their checkpoints.
+            Once done, the segments are concatenated (in the order of the
+            domains) into the output file and removed. Segments of domains that
+            could not be completed are kept, so that a later run continues them.
 
 Inputs:
     Those loaded by top_fibers_pkg.utils.parse_cl_args_ct_dl
@@ -26,14 +34,14 @@ Author:
 """
 import datetime
 import glob
-import gzip
-import json
 import os
-import time
 
 from top_fibers_pkg.dates import get_start_and_end_dates
-from top_fibers_pkg.crowdtangle_helpers import ct_get_search_posts
-from top_fibers_pkg.utils import parse_cl_args_ct_dl, load_lines, get_logger
+from top_fibers_pkg.crowdtangle_collector import collect_posts
+from top_fibers_pkg.crowdtangle_helpers import CrowdTangleClient
+from top_fibers_pkg.domains import load_domains
+from top_fibers_pkg.segmented_output import SegmentedOutput
+from top_fibers_pkg.utils import parse_cl_args_ct_dl, get_logger
 
 SCRIPT_PURPOSE = "Download Facebook posts from CrowdTangle based on a list of links."
 REPO_ROOT = "/home/data/apps/topfibers/repo"
@@ -41,20 +49,6 @@ LOG_DIR = "./logs"
 LOG_FNAME = "top_fibers_fb_link_dl.log"
 SUCCESS_FNAME = "success.log"
 
-NUMBER_OF_POSTS_PER_CALL = 10_000
-
-# Number of seconds to wait before every query, regardless of success or error
-WAIT_BTWN_POSTS = 8
-
-# Base number of seconds to wait after encountering an error, raised to the number of try counts
-WAIT_BTWN_ERROR_BASE = 2
-
-# Maximum number of times to retry (*consecutive* failures) for a single domain
-MAX_ATTEMPTS = 5
-
-# Maximum number of times to retry (*consecutive* failures) for domains that return no posts
-MAX_EMPTY_ATTEMPTS = 2
-
 if __name__ == "__main__":
     script_name = os.path.basename(__file__)
     logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name)
@@ -66,18 +60,16 @@ if __name__ == "__main__":
     output_dir = args.out_dir
     last_month = args.last_month
     num_months = int(args.num_months)
+    concurrent_domains = args.concurrent_domains
+    calls_per_minute = args.calls_per_minute
 
     logger.info(f"Domains dir: {domains_dir}")
     all_domains_files = sorted(glob.glob(os.path.join(domains_dir, "*iffy_list.txt")))
-    latest_domains_filepath = all_domains_files[-1]
-    logger.info(f"Domains file: {latest_domains_filepath}")
+    logger.info(f"Domains file: {all_domains_files[-1]}")
 
-    # Load domains to match in below query and clean up
-    domains = load_lines(latest_domains_filepath)
-    domains = [domain.replace("https://", "") for domain in domains]
-    domains = [domain.replace("http://", "") for domain in domains]
-    domains = [domain.replace("www.", "") for domain in domains]
-    domains = [domain.rstrip("/*") for domain in domains]
+    # Load domains to match in below query, cleaned up (each one has its own
+    # segment, so duplicates are dropped)
+    domains = list(dict.fromkeys(load_domains(domains_dir)))
 
     # Load CrowdTangle token
     ct_token = os.environ.get("TOP_FIBERS_TOKEN")
@@ -113,164 +105,39 @@ if __name__ == "__main__":
 
     logger.info(f"Output file : {output_file_path}")
 
-    # Open file here so we don't have to hold data in memory
-    with gzip.open(output_file_path, "wb") as f:
-        # Iterate through each site
-        for idx, domain in enumerate(domains, start=1):
-            logger.info(
-                f"Collect posts matching domain {idx} of {len(domains)}: {domain}"
-            )
-
-            total_posts = 0
-            try_count = 0
-            query_count = 0
-            max_attempts = MAX_ATTEMPTS
-            zero_post_count = 0
-            max_empty_attempts = MAX_EMPTY_ATTEMPTS
-
-            start = start_date
-            end = end_date
-            while True:
-                try:
-                    # count = 10000 only if you request it, otherwise it's 100
-                    # NOTE: This is more than the function says is allowed because we requested
-                    # increased API limits from CrowdTangle folks.
-                    time.sleep(WAIT_BTWN_POSTS)
-                    response = ct_get_search_posts(
-                        count=NUMBER_OF_POSTS_PER_CALL,
-                        start_time=start,
-                        end_time=end,
-                        include_history=None,
-                        sort_by="date",
-                        types=None,
-                        search_term=domain,
-                        account_types=None,
-                        min_interactions=0,
-                        offset=0,
-                        api_token=ct_token,
-                        platforms="facebook",
-                        lang=None,
-                    )
-                    response_json = response.json()
-
-                    # Returns a list of dictionaries where each dict represents one post.
-                    # We sort by `date` so the MOST RECENT post will be at the first index.
-                    posts = response_json["result"]["posts"]
-
-                    # If we get no results, we try a few more times and then break the loop
-                    num_posts = len(posts)
-
-                except Exception as e:  # 6 calls/minute limit if you request them
-                    logger.exception(e)
-                    try:
-                        logger.info(f"FB message: {response_json['message']}")
-                    except:
-                        pass
-
-                    # Handle the retries...
-                    try_count += 1
-                    logger.info(f"There are {max_attempts-try_count} tries left.")
-                    if (max_attempts - try_count) <= 0:
-                        logger.info("Breaking out of loop!")
-                        break
-                    else:
-                        wait_time = WAIT_BTWN_ERROR_BASE**try_count
-                        if wait_time > 60:
-                            wait_time = wait_time / 60
-                            logger.info(f"Waiting {wait_time} minutes...")
-                        else:
-                            logger.info(f"Waiting {wait_time} seconds...")
-                        time.sleep(wait_time)
-                        logger.info(f"Retrying...")
-                        continue
-
-                else:
-                    # Returned CT results successfully, with zero posts
-                    if num_posts == 0:
-                        logger.info("Zero posts were returned.")
-                        try_count += 1
-                        zero_post_count += 1
-                        logger.info(
-                            f"Empty retries remaining: {max_empty_attempts-try_count}"
-                        )
-                        logger.info(
-                            f"Total retries remaining: {max_attempts-try_count}"
-                        )
-                        if zero_post_count >= MAX_EMPTY_ATTEMPTS:
-                            logger.info(
-                                "Two consecutive queries with no posts. "
-                                "Breaking out of loop!"
-                            )
-                            break
-
-                        elif (max_attempts - try_count) <= 0:
-                            logger.info("Breaking out of loop!")
-                            break
-                        else:
-                            wait_time = WAIT_BTWN_ERROR_BASE**try_count
-                            if wait_time > 60:
-                                wait_time = wait_time / 60
-                                logger.info(f"Waiting {wait_time} minutes...")
-                            else:
-                                logger.info(f"Waiting {wait_time} seconds...")
-                            time.sleep(wait_time)
-                            logger.info(f"Retrying...")
-                            continue
-
-                    # Returned CT results successfully, with new posts
-                    else:
-                        # Reset the retry count to zero
-                        try_count = 0
-                        zero_post_count = 0
-
-                        most_recent_date_str = posts[0]["date"]
-                        oldest_date_str = posts[-1]["date"]
-                        logger.info(
-                            f"\t|--> {oldest_date_str} - {most_recent_date_str}"
-                            f": {num_posts:,} posts."
-                        )
-
-                        # Convert each post into bytes with a new-line (`\n`)
-                        for post in posts:
-                            post_in_bytes = f"{json.dumps(post)}\n".encode(
-                                encoding="utf-8"
-                            )
-                            f.write(post_in_bytes)
-
-                        total_posts += num_posts
-                        logger.info(f"Total posts collected: {total_posts:,}")
-
-                        # Update the time period we're searching.
-                        # ---------------------------------------
-                        # Facebook returns data in backwards order, meaning more recent posts are
-                        # provided first. If we do not have all data it means that we are missing
-                        # OLDER data. So we update the `end` time period (which is the most recent
-                        # time parameter) with the oldest/earliest post we find and ensure we do
-                        # not pull the same data twice by subtracting by one second to make sure
-                        # there is no overlap.
-                        # ---------------------------------------
-                        oldest_date_dt = datetime.datetime.strptime(
-                            oldest_date_str, "%Y-%m-%d %H:%M:%S"
-                        )
-                        oldest_date_dt = oldest_date_dt - datetime.timedelta(seconds=1)
-
-                    # If this is true, we have a bad query. (start_date is a date object)
-                    empty_time = datetime.time(0, 0, 0)
-                    if oldest_date_dt <= datetime.datetime.combine(
-                        start_date, empty_time
-                    ):
-                        logger.info(f"\t|--> end <= start so we have all data.")
-                        break
+    # Each domain is written to its own (checkpointed) segment
+    output = SegmentedOutput(output_file_path, domains)
+    logger.info(f"Segments dir: {output.segments_dir}")
+    incomplete_domains = output.get_incomplete_domains()
+    num_completed = len(domains) - len(incomplete_domains)
+    if num_completed > 0:
+        logger.info(f"Domains completed by a previous run: {num_completed:,}")
+
+    with CrowdTangleClient(ct_token, pool_size=concurrent_domains) as client:
+        # Search several domains at once, under one shared rate limit
+        logger.info(f"Concurrent domains: {concurrent_domains}")
+        logger.info(f"Calls per minute  : {calls_per_minute}")
+        domain_posts = collect_posts(
+            domains,
+            start_date,
+            end_date,
+            client,
+            output,
+            logger,
+            max_concurrent_domains=concurrent_domains,
+            calls_per_minute=calls_per_minute,
+        )
 
-                    # More than 500 queries (~5M posts), we break the script.
-                    query_count += 1
-                    if query_count > 500:
-                        break
+    logger.info(f"Total posts collected: {sum(domain_posts.values()):,}")
 
-                    # If all conditionals are passed, we update the date string for query
-                    end = oldest_date_dt.strftime("%Y-%m-%dT%H:%M:%S")
-                    logger.info(f"\t|--> New end date: {end}")
-                    logger.info(f"\t|--> {'-'*50}")
+    # Keep the segments of incomplete domains, so a later run can continue them
+    incomplete_domains = output.get_incomplete_domains()
+    if incomplete_domains:
+        logger.warning(
+            f"Domains not completed ({len(incomplete_domains)}): {incomplete_domains}"
+        )
+    num_posts = output.concatenate(remove_segments=not incomplete_domains)
+    logger.info(f"Posts written to the output file: {num_posts:,}")
     with open(os.path.join(REPO_ROOT, SUCCESS_FNAME), "w+") as outfile:
         pass
     logger.info("~~~ Script complete! ~~~")
@@ -0,0 +1,320 @@
+"""
+Purpose:
+    Convert raw data files into columnar "post stores": parquet files holding only
+    the fields that the pipeline scripts use (post/user IDs, handles/names, epoch
+    timestamps, reshare counts, post URLs, profile image URLs and, for tweets, the
+    same fields of the retweeted/quoted tweet). See top_fibers_pkg.post_stores.
+
+    The FIB scripts read the post store of a raw file (only the columns and rows
+    they need) instead of parsing its raw JSON, and fall back to the raw JSON for
+    files without an up-to-date post store.
+
+    Note: Files with an up-to-date post store are skipped. Run this after new raw
+        data is moved/downloaded (i.e., after `move_twitter_raw.py` and
+        `crowdtangle_dl_fb_links.py`).
+
+    With --index-profile-images (Twitter only), the script instead backfills the
+    profile image index of each month of FIB results that does not have one
+    (i.e., months calculated before calc_twitter_fib_indices.py saved it). The
+    index is built from the post stores of that month's symlinked data files,
+    which are converted first if needed. get_latest_profile_image_links.py fails
+    for months without an index, so run this once before using its --all-users
+    flag.
+
+Inputs:
+    -d / --data-dir: Full path to the raw posts directory
+    -p / --platform: The platform of the posts you want to convert
+    -w / --workers: The number of files converted in parallel
+    -i / --index-profile-images: Backfill missing profile image indices instead
+    -f / --fib-dir: Full path to the Twitter FIB results directory (with -i)
+    -s / --sym-dir: Full path to the Twitter symbolic links directory (with -i)
+    -n / --num-months: Months of data in each FIB calculation (with -i)
+
+Outputs:
+    One post store saved next to each raw file:
+        - {raw_file}.posts.parquet
+    With --index-profile-images, one index saved in each month directory of FIB
+    results without one (dated like that month's FIB indices file):
+        - {YYYY_mm_dd}__profile_image_links_twitter.parquet
+"""
+import argparse
+import glob
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from top_fibers_pkg.dates import get_earliest_date
+from top_fibers_pkg.fib_helpers import (
+    add_tweet_rows,
+    create_profile_image_df,
+    create_tweet_store,
+)
+from top_fibers_pkg.utils import get_logger
+from top_fibers_pkg.post_stores import (
+    TWITTER_FIB_COLUMNS,
+    convert_to_post_store,
+    has_post_store,
+    load_post_store,
+)
+
+SCRIPT_PURPOSE = (
+    "Convert all raw files contained in the data dir provided into "
+    "columnar post stores. Files with an up-to-date post store are skipped."
+)
+REPO_ROOT = "/home/data/apps/topfibers/repo"
+LOG_DIR = "./logs"
+LOG_FNAME = "convert_raw_to_post_stores.log"
+MATCHING_STR = "*.jsonl.gzip"
+SUCCESS_FNAME = "success.log"
+FIB_OUT_DIR_TWITTER = "/home/data/apps/topfibers/repo/data/derived/fib_results/twitter"
+TWITTER_SYM_DIR = "/home/data/apps/topfibers/repo/data/symbolic_links/twitter"
+FIBER_FILE_SUFFIX = "__fib_indices_twitter.parquet"
+PROFILE_IMAGE_FILE_SUFFIX = "__profile_image_links_twitter.parquet"
+
+
+def parse_cl_args(script_purpose="", logger=None):
+    """
+    Read command line arguments.
+
+    Parameters:
+    --------------
+    - script_purpose (str) : Purpose of the script being utilized. When printing
+        script help message via `python script.py -h`, this will represent the
+        script's description. Default = "" (an empty string)
+    - logger : a logging object
+
+    Returns
+    --------------
+    None
+
+    Exceptions
+    --------------
+    None
+    """
+    logger.info("Parsing command line arguments...")
+
+    # Initiate the parser
+    parser = argparse.ArgumentParser(description=script_purpose)
+
+    help_msg = (
+        "Full path to the raw posts directory (subdirs should be 'twitter' and 'facebook'). "
+        "Ex: /home/data/apps/topfibers/repo/data/raw"
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        metavar="Data dir",
+        help=help_msg,
+    )
+    parser.add_argument(
+        "-p",
+        "--platform",
+        metavar="Platform",
+        help="The platform posts you want to convert. Options: [twitter, facebook]",
+        choices=["twitter", "facebook"],
+        required=True,
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="Number of workers",
+        help="The number of files converted in parallel. Default = 1",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-i",
+        "--index-profile-images",
+        action="store_true",
+        help=(
+            "Instead of converting the data dir, backfill the profile image index "
+            "of each month of Twitter FIB results that does not have one"
+        ),
+    )
+    parser.add_argument(
+        "-f",
+        "--fib-dir",
+        metavar="FIB results dir",
+        help=f"Twitter FIB results directory. Default = {FIB_OUT_DIR_TWITTER}",
+        default=FIB_OUT_DIR_TWITTER,
+    )
+    parser.add_argument(
+        "-s",
+        "--sym-dir",
+        metavar="Symbolic links dir",
+        help=f"Twitter symbolic links directory. Default = {TWITTER_SYM_DIR}",
+        default=TWITTER_SYM_DIR,
+    )
+    parser.add_argument(
+        "-n",
+        "--num-months",
+        metavar="Number of months",
+        help="Months of data used to calculate each month's FIB indices. Default = 3",
+        type=int,
+        default=3,
+    )
+
+    # Read parsed arguments from the command line into "args"
+    args = parser.parse_args()
+
+    if args.index_profile_images:
+        if args.platform != "twitter":
+            parser.error("--index-profile-images only works with `-p twitter`")
+    elif args.data_dir is None:
+        parser.error("the following arguments are required: -d/--data-dir")
+
+    return args
+
+
+def convert_files(files, platform, workers):
+    """
+    Convert `files` that do not have an up-to-date post store.
+
+    Parameters:
+    --------------
+    - files (list) : full paths to raw data files
+    - platform (str) : the platform of the posts. Options: [twitter, facebook]
+    - workers (int) : the number of files converted in parallel
+
+    Returns
+    --------------
+    None
+    """
+    new_files = []
+    for file in files:
+        if has_post_store(file):
+            logger.info(f"Skipping file with an up-to-date post store: {file}")
+        else:
+            new_files.append(file)
+    num_files = len(new_files)
+    logger.info(f"Number of files to convert: {num_files}")
+
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        post_store_paths = executor.map(
+            convert_to_post_store, new_files, repeat(platform)
+        )
+        for fnum, path in enumerate(post_store_paths, start=1):
+            logger.info(f"Saved post store ({fnum}/{num_files}): {path}")
+
+
+def get_unindexed_month_dirs(fib_dir):
+    """
+    Return the month directories of Twitter FIB results that include a FIB
+    indices file but no profile image index.
+
+    Parameters:
+    --------------
+    - fib_dir (str) : full path to the Twitter FIB results directory
+
+    Returns
+    --------------
+    - month_dirs (list) : full paths to the month directories, sorted
+    """
+    month_dirs = []
+    for month_dir in sorted(glob.glob(os.path.join(fib_dir, "*"))):
+        if not glob.glob(os.path.join(month_dir, f"*{FIBER_FILE_SUFFIX}")):
+            continue
+        if glob.glob(os.path.join(month_dir, f"*{PROFILE_IMAGE_FILE_SUFFIX}")):
+            continue
+        month_dirs.append(month_dir)
+    return month_dirs
+
+
+def index_profile_images(month_dir, sym_dir, num_months, workers):
+    """
+    Save the profile image index of one month of Twitter FIB results, built from
+    the post stores of the month's symlinked data files (the same data and time
+    window used by calc_twitter_fib_indices.py).
+
+    Parameters:
+    --------------
+    - month_dir (str) : full path to the month directory of FIB results (YYYY_mm)
+    - sym_dir (str) : full path to the Twitter symbolic links directory
+    - num_months (int) : months of data used to calculate the FIB indices
+    - workers (int) : the number of files converted in parallel
+
+    Returns
+    --------------
+    - output_fname (str or None) : full path to the saved index, or None if the
+        month has no symlinked data files
+    """
+    month = os.path.basename(month_dir)
+    data_files = sorted(glob.glob(os.path.join(sym_dir, month, MATCHING_STR)))
+    if not data_files:
+        logger.warning(f"No data files found for month {month}, skipping!")
+        return None
+    logger.info(f"Number of data files for month {month}: {len(data_files)}")
+
+    # Converting the symlinks saves the post stores next to the raw files
+    convert_files(data_files, "twitter", workers)
+
+    earliest_date_tstamp = get_earliest_date(
+        months_earlier=num_months, as_timestamp=True, month_calculated=month
+    )
+    store = create_tweet_store()
+    for file in data_files:
+        logger.info(f"Loading tweets from the post store of file: {file} ...")
+        table = load_post_store(file, TWITTER_FIB_COLUMNS, earliest_date_tstamp)
+        if table is None:
+            raise Exception(f"No up-to-date post store for file: {file}")
+        rows = zip(*(column.to_pylist() for column in table.columns))
+        add_tweet_rows(rows, earliest_date_tstamp, store)
+
+    # Date the index like the month's (latest) FIB indices file
+    fib_fname = sorted(glob.glob(os.path.join(month_dir, f"*{FIBER_FILE_SUFFIX}")))[-1]
+    date_str = os.path.basename(fib_fname)[: -len(FIBER_FILE_SUFFIX)]
+    output_fname = os.path.join(month_dir, f"{date_str}{PROFILE_IMAGE_FILE_SUFFIX}")
+    create_profile_image_df(store).to_parquet(
+        output_fname, index=False, engine="pyarrow"
+    )
+    return output_fname
+
+
+if __name__ == "__main__":
+    if not (os.getcwd() == REPO_ROOT):
+        sys.exit(
+            "ALL SCRIPTS MUST BE RUN FROM THE REPO ROOT!!\n"
+            f"\tCurrent directory: {os.getcwd()}\n"
+            f"\tRepo root        : {REPO_ROOT}\n"
+        )
+    script_name = os.path.basename(__file__)
+    logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name, also_print=True)
+    logger.info("-" * 50)
+    logger.info(f"Begin script: {__file__}")
+
+    args = parse_cl_args(SCRIPT_PURPOSE, logger)
+    data_dir = args.data_dir
+    platform = args.platform
+    workers = args.workers
+
+    try:
+        if args.index_profile_images:
+            logger.info("Backfilling profile image indices of FIB results here:")
+            logger.info(f"\t- {args.fib_dir}")
+            month_dirs = get_unindexed_month_dirs(args.fib_dir)
+            logger.info(f"Number of months without an index: {len(month_dirs)}")
+            for month_dir in month_dirs:
+                output_fname = index_profile_images(
+                    month_dir, args.sym_dir, args.num_months, workers
+                )
+                if output_fname is not None:
+                    logger.info(f"Saved profile image index: {output_fname}")
+
+        else:
+            logger.info(f"Converting posts for: {platform}")
+
+            # Get all raw files full paths
+            raw_files_dir = os.path.join(data_dir, platform)
+            logger.info(f"Converting files found here: {raw_files_dir}")
+            files = sorted(glob.glob(os.path.join(raw_files_dir, MATCHING_STR)))
+            logger.info(f"Number of files: {len(files)}")
+            convert_files(files, platform, workers)
+
+    except Exception as e:
+        logger.exception("Problem converting raw files!")
+        raise Exception(e)
+
+    with open(os.path.join(REPO_ROOT, SUCCESS_FNAME), "w+") as outfile:
+        pass
+    logger.info("~~~ Script complete! ~~~")
@@ -36,19 +36,39 @@ Author: Matthew DeVerna
 import datetime
 import glob
 import gzip
-import json
+import logging
+import math
 import os
 import sys
 
-from collections import defaultdict
-from top_fibers_pkg.data_model import FbIgPost
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import groupby, repeat
+from operator import itemgetter
+from top_fibers_pkg.json_decoding import get_json_backend
+from top_fibers_pkg.data_model import parse_crowdtangle_timestamp
+from top_fibers_pkg.projection import (
+    FieldProjector,
+    CROWDTANGLE_FIB_FIELDS,
+    CROWDTANGLE_REQUIRED_KEYS,
+)
+from top_fibers_pkg.interned_store import InternedPostStore, merge_partial_stores
+from top_fibers_pkg.parallel import iter_line_chunks, ordered_imap
+from top_fibers_pkg.partial_stores import get_partial_stores
+from top_fibers_pkg.store_cache import load_store_cache, save_store_cache
+from top_fibers_pkg.post_stores import (
+    CROWDTANGLE_FIB_COLUMNS,
+    get_file_shards,
+    has_post_store,
+    load_post_store,
+)
+from top_fibers_pkg.seekable_gzip import HAS_INDEXED_GZIP, iter_shard_lines
 from top_fibers_pkg.dates import get_earliest_date
 from top_fibers_pkg.utils import parse_cl_args_fib, get_logger
 from top_fibers_pkg.fib_helpers import (
-    create_userid_total_reshares,
-    create_userid_reshare_lists,
-    create_fib_frame,
+    create_fib_frame_fused,
     get_top_spreaders,
+    sort_fib_frame,
     create_top_spreader_df,
 )
 
@@ -62,31 +82,344 @@ SCRIPT_PURPOSE = (
 MATCHING_STR = "*.jsonl.gzip"
 SUCCESS_FNAME = "success.log"
 
+# Functions run by worker processes (which do not run the `__main__` block) log to
+# this logger. get_logger configures it (by name) in the main process.
+logger = logging.getLogger(os.path.basename(__file__))
+
 # NOTE: Set the number of top ranked spreaders to select and which type
 NUM_SPREADERS = 50
 SPREADER_TYPE = "fib_index"  # Options: ["total_reshares", "fib_index"]
 
+# NOTE: Set how many rows of the output FIB indices file are sorted. None sorts the
+# entire file. Downstream consumers (e.g., the data-loader) only read the first
+# 50 rows, so setting this to NUM_SPREADERS skips sorting millions of other rows.
+NUM_SORTED_ROWS = None
+
 # Set the number of months to calculate the FIB index from
 NUM_MONTHS = 3
 
+# Number of lines in each chunk of a file that is parsed by a worker (--workers > 1)
+# when files cannot be split into shards (see top_fibers_pkg.seekable_gzip)
+CHUNK_NUM_LINES = 100_000
+
 ### ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Set Functions ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def extract_data_from_files(data_files, earliest_date_tstamp):
+def extract_data_from_lines(lines, earliest_date_tstamp, store=None):
+    """
+    Extract necessary data from raw lines (e.g., an open file or a chunk of a file).
+
+    Parameters:
+    -----------
+    - lines (iterable[bytes]) : raw new-line delimited post JSON lines
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices. If None, all posts are kept.
+    - store (InternedPostStore) : the store to add data to. If None (default), a
+        new store is created. Creating a new store for each file or chunk gives a
+        partial aggregate that can be merged with those of other files/chunks.
+
+    Returns:
+    -----------
+    - store (InternedPostStore) : the store holding all post data (user IDs,
+        usernames, post IDs, timestamps, number of reshares and post URLs)
+    """
+    # CrowdTangle share counts are kept as the last value encountered.
+    if store is None:
+        store = InternedPostStore(reshare_policy="last")
+
+    if earliest_date_tstamp is None:
+        earliest_date_tstamp = -math.inf
+
+    projector = FieldProjector(
+        CROWDTANGLE_FIB_FIELDS, required_keys=CROWDTANGLE_REQUIRED_KEYS
+    )
+    for line in lines:
+        fields = projector.project_line(line)
+        if fields is None:
+            continue
+
+        (
+            post_id,
+            user_id,
+            username,
+            account_name,
+            created_at,
+            reshare_count,
+            post_url,
+        ) = fields
+
+        timestamp = parse_crowdtangle_timestamp(created_at)
+        # Skip anything without a valid time or posted before the earliest date
+        if timestamp is None or timestamp < earliest_date_tstamp:
+            continue
+
+        # IDs may be numeric in the raw data
+        post_id = str(post_id)
+        user_id = str(user_id)
+
+        # This handles certain types of accounts like groups and pages that
+        # do not have "handles" (or don't provide one) but instead have "names"
+        if username in [None, ""]:
+            username = account_name
+        if reshare_count is None:
+            reshare_count = 0
+
+        store.add_post(post_id, user_id, username, timestamp, reshare_count, post_url)
+
+    return store
+
+
+def extract_data_from_file(file, earliest_date_tstamp, store=None):
+    """
+    Extract necessary data from a whole file.
+
+    If the file has an up-to-date post store (see top_fibers_pkg.post_stores),
+    only the needed columns and the rows in the time window are read from the
+    post store, instead of parsing the raw JSON.
+
+    Parameters:
+    -----------
+    - file (str) : path to a data file
+    - earliest_date_tstamp (timestamp) : see `extract_data_from_lines`
+    - store (InternedPostStore) : see `extract_data_from_lines`
+
+    Returns:
+    -----------
+    - store (InternedPostStore) : see `extract_data_from_lines`
+    """
+    table = load_post_store(file, CROWDTANGLE_FIB_COLUMNS, earliest_date_tstamp)
+    if table is None:
+        with gzip.open(file, "rb") as f:
+            return extract_data_from_lines(f, earliest_date_tstamp, store)
+
+    if store is None:
+        store = InternedPostStore(reshare_policy="last")
+
+    # Post store rows are already filtered and in the order of `add_post` arguments
+    for row in zip(*(column.to_pylist() for column in table.columns)):
+        store.add_post(*row)
+
+    return store
+
+
+def extract_data_from_chunk(file_lines, earliest_date_tstamp):
+    """
+    Extract necessary data from a chunk of raw lines read from a file.
+
+    Parameters:
+    -----------
+    - file_lines (tuple) : (file, lines), the path of the file the chunk was
+        read from and the chunk of raw lines. If lines is None, the whole file
+        is read from its post store instead.
+    - earliest_date_tstamp (timestamp) : see `extract_data_from_lines`
+
+    Returns:
+    -----------
+    - (file, store) (tuple) : the file and the partial store of the chunk
+    """
+    file, lines = file_lines
+    if lines is None:
+        return file, extract_data_from_file(file, earliest_date_tstamp)
+    return file, extract_data_from_lines(lines, earliest_date_tstamp)
+
+
+def extract_data_from_shard(file_shard, earliest_date_tstamp):
+    """
+    Extract necessary data from one line-aligned shard of a file.
+
+    Parameters:
+    -----------
+    - file_shard (tuple) : (file, shard), the path of a file and the (start, end)
+        uncompressed byte range to read (see top_fibers_pkg.seekable_gzip)
+    - earliest_date_tstamp (timestamp) : see `extract_data_from_lines`
+
+    Returns:
+    -----------
+    - (file, store) (tuple) : the file and the partial store of the shard
+    """
+    file, shard = file_shard
+    if shard == (0, None):
+        return file, extract_data_from_file(file, earliest_date_tstamp)
+    lines = iter_shard_lines(file, *shard)
+    return file, extract_data_from_lines(lines, earliest_date_tstamp)
+
+
+def iter_file_chunks(data_files):
+    """
+    Yield chunks of raw lines from all data files, in order.
+
+    Parameters:
+    -----------
+    - data_files (list) : list of full paths to data files to parse
+
+    Yields:
+    -----------
+    - (file, lines) (tuple) : the file and its next chunk of at most
+        CHUNK_NUM_LINES raw lines. At least one (possibly empty) chunk is
+        yielded for each file. Files with a post store are yielded as a single
+        (file, None) chunk, to be read from the post store by a worker.
+    """
+    for file in data_files:
+        logger.info(f"\t- Processing: {os.path.basename(file)} ...")
+        if has_post_store(file):
+            yield file, None
+            continue
+        num_chunks = 0
+        for lines in iter_line_chunks(file, CHUNK_NUM_LINES):
+            num_chunks += 1
+            yield file, lines
+        if num_chunks == 0:
+            yield file, []
+
+
+def iter_file_parts(data_files, earliest_date_tstamp, workers):
+    """
+    Parse all data files in a pool of processes, one part at a time.
+
+    If files can be read with a seekable gzip reader, each file is split into (up
+    to) one line-aligned shard per worker, which each worker decompresses and
+    parses on its own. Otherwise, files are read in this process and split into
+    chunks of CHUNK_NUM_LINES lines for the workers to parse.
+
+    Parameters:
+    -----------
+    - data_files (list) : list of full paths to data files to parse
+    - earliest_date_tstamp (timestamp) : see `extract_data_from_lines`
+    - workers (int) : the number of processes
+
+    Yields:
+    -----------
+    - (file, store) (tuple) : the partial store of each part, with the file it
+        belongs to, in the order the parts appear in `data_files`
+    """
+    logger.info(f"Parsing files with {workers} workers...")
+    if HAS_INDEXED_GZIP:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            file_shards = list(
+                executor.map(get_file_shards, data_files, repeat(workers))
+            )
+        parts = (
+            (file, shard)
+            for file, shards in zip(data_files, file_shards)
+            for shard in shards
+        )
+        extract_part = partial(
+            extract_data_from_shard, earliest_date_tstamp=earliest_date_tstamp
+        )
+    else:
+        parts = iter_file_chunks(data_files)
+        extract_part = partial(
+            extract_data_from_chunk, earliest_date_tstamp=earliest_date_tstamp
+        )
+
+    yield from ordered_imap(extract_part, parts, workers)
+
+
+def parse_files_separately(data_files, earliest_date_tstamp, workers=1):
+    """
+    Parse each file into its own partial store.
+
+    With more than one worker, the parts of each file are parsed in a pool of
+    processes and merged in order (see `iter_file_parts`).
+
+    Parameters:
+    -----------
+    - data_files (list) : list of full paths to data files to parse
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices. If None, all posts are kept.
+    - workers (int) : the number of processes used to parse files. Default = 1
+
+    Yields:
+    -----------
+    - store (InternedPostStore) : the partial store of each file, in the order of
+        `data_files`
+    """
+    if workers <= 1:
+        for file in data_files:
+            logger.info(f"\t- Processing: {os.path.basename(file)} ...")
+            yield extract_data_from_file(file, earliest_date_tstamp)
+        return
+
+    file_parts = iter_file_parts(data_files, earliest_date_tstamp, workers)
+    for _, parts in groupby(file_parts, key=itemgetter(0)):
+        yield merge_partial_stores(store for _, store in parts)
+
+
+def extract_cached_data_from_files(
+    data_files, earliest_date_tstamp, workers, cache_dir
+):
+    """
+    Load the cached store of all files and the time window if it exists (see
+    top_fibers_pkg.store_cache). Otherwise, build it from the partial store of
+    each file (parsing only files without an up-to-date saved partial store) and
+    save it.
+
+    Parameters:
+    -----------
+    - data_files (list) : list of full paths to data files to parse
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices
+    - workers (int) : the number of processes used to parse files
+    - cache_dir (str) : directory where partial and cached stores are saved
+
+    Returns:
+    -----------
+    - store (InternedPostStore or None) : the store holding all data in the time
+        window (read-only if it was loaded from the cache), or None if there
+        are no data files
+    """
+    store = load_store_cache(cache_dir, data_files, earliest_date_tstamp)
+    if store is not None:
+        logger.info("Loaded the cached store of these files and time window.")
+        return store
+
+    partial_stores = get_partial_stores(
+        data_files,
+        cache_dir,
+        lambda files: parse_files_separately(files, None, workers),
+        logger,
+    )
+    store = merge_partial_stores(partial_stores)
+    if store is None:
+        return None
+
+    store = store.filter_by_timestamp(earliest_date_tstamp)
+    path = save_store_cache(store, cache_dir, data_files, earliest_date_tstamp)
+    logger.info(f"Saved the store of these files and time window: {path}")
+    return store
+
+
+def extract_data_from_files(
+    data_files, earliest_date_tstamp, workers=1, cache_dir=None
+):
     """
     Extract necessary data from the list of input files.
 
+    With more than one worker, files are split into parts (line-aligned shards
+    or chunks of CHUNK_NUM_LINES lines, see `iter_file_parts`) that are parsed
+    into partial stores in a pool of processes. The partial stores are merged in
+    the order of the parts, so results are identical to parsing all files one
+    after another: when the same post or account shows up in several parts, the
+    values from the latest part win.
+
+    With a `cache_dir`, the partial store of each file is built from all of its
+    posts and saved, so that later runs (e.g., next month's, which shares all
+    but one file) only parse new or changed files. The time window is applied
+    after merging, with the same result as filtering while parsing. The merged
+    store of all files and the window is saved as well, so re-running with the
+    same files and window (e.g., after a crash) does not extract anything.
+
     Parameters:
     -----------
     - data_files (list) : list of full paths to data files to parse
     - earliest_date_tstamp (timestamp) : the earliest date from which to consider
         data for calculating FIB indices
+    - workers (int) : the number of processes used to parse files. Default = 1
+    - cache_dir (str) : directory where the partial store of each file is saved
+        and loaded from. Default = None (parse all files and save nothing)
 
     Returns:
     -----------
-    - userid_username (dict) : maps user IDs to usernames
-    - userid_postids (dict) : maps user IDs to a set of (str) post IDs
-    - postid_timestamp (dict) : maps post IDs to (str) timestamps
-    - postid_num_reshares (dict) : maps post IDs to number of reshares (int)
-    - postid_url (dict) : maps post IDs to (str) post URLs
+    - store (InternedPostStore) : the store holding all post data (user IDs,
+        usernames, post IDs, timestamps, number of reshares and post URLs)
 
     Exceptions:
     -----------
@@ -94,66 +427,34 @@ def extract_data_from_files(data_files, earliest_date_tstamp):
     """
     if not isinstance(data_files, list):
         raise TypeError("`data_files` must be a list!")
-
-    # Initialize data objects to populate
-    userid_username = dict()
-    userid_postids = defaultdict(set)
-
-    postid_timestamp = dict()
-    postid_url = dict()
-    postid_num_reshares = defaultdict(int)
+    if not isinstance(workers, int):
+        raise TypeError("`workers` must be an integer!")
 
     logger.info("Begin extracting data.")
     try:
-        for file in data_files:
-            logger.info(f"\t- Processing: {os.path.basename(file)} ...")
-            with gzip.open(file, "rb") as f:
-                for line in f:
-                    post_obj = FbIgPost(json.loads(line.decode()))
-                    if not post_obj.is_valid():
-                        continue
-
-                    post_id = post_obj.get_post_ID()
-                    post_url = post_obj.get_link_to_post()
-                    timestamp_str = post_obj.get_post_time(timestamp=True)
-                    timestamp = datetime.datetime.fromtimestamp(
-                        int(timestamp_str)
-                    ).timestamp()
-                    # Skip anything posted before the earliest date
-                    if timestamp < earliest_date_tstamp:
-                        continue
-                    user_id = post_obj.get_user_ID()
-                    username = post_obj.get_user_handle()
-
-                    # This handles certain types of accounts like groups and pages that
-                    # do not have "handles" (or don't provide one) but instead have "names"
-                    if username in [None, ""]:
-                        username = post_obj.get_account_name()
-                    reshare_count = post_obj.get_reshare_count()
-                    if reshare_count is None:
-                        reshare_count = 0
-
-                    postid_num_reshares[post_id] = reshare_count
-                    postid_timestamp[post_id] = timestamp_str
-                    postid_url[post_id] = post_url
-                    userid_username[user_id] = username
-                    userid_postids[user_id].add(post_id)
-
-        num_posts = len(postid_num_reshares.keys())
-        num_users = len(userid_username.keys())
-        logger.info(f"Total Posts Ingested = {num_posts:,}")
-        logger.info(f"Total Number of Users = {num_users:,}")
-
-        return (
-            userid_username,
-            dict(userid_postids),
-            postid_timestamp,
-            dict(postid_num_reshares),
-            postid_url,
-        )
+        if cache_dir is not None:
+            store = extract_cached_data_from_files(
+                data_files, earliest_date_tstamp, workers, cache_dir
+            )
+        elif workers <= 1:
+            store = InternedPostStore(reshare_policy="last")
+            for file in data_files:
+                logger.info(f"\t- Processing: {os.path.basename(file)} ...")
+                extract_data_from_file(file, earliest_date_tstamp, store)
+        else:
+            file_parts = iter_file_parts(data_files, earliest_date_tstamp, workers)
+            store = merge_partial_stores(store for _, store in file_parts)
+
+        if store is None:
+            store = InternedPostStore(reshare_policy="last")
+
+        logger.info(f"Total Posts Ingested = {store.num_posts:,}")
+        logger.info(f"Total Number of Users = {store.num_users:,}")
+
+        return store
 
     except Exception as e:
-        logger.exception(f"Problem parsing data file: {file}")
+        logger.exception(f"Problem parsing data files!")
         raise Exception(e)
 
 
@@ -170,6 +471,7 @@ if __name__ == "__main__":
     logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name, also_print=True)
     logger.info("-" * 50)
     logger.info(f"Begin script: {__file__}")
+    logger.info(f"JSON decoding backend: {get_json_backend()}")
 
     # Parse input flags
     args = parse_cl_args_fib(SCRIPT_PURPOSE, logger)
@@ -177,6 +479,8 @@ if __name__ == "__main__":
     output_dir = args.out_dir
     month_calculated = args.month_calculated
     num_months = int(args.num_months)
+    workers = args.workers
+    cache_dir = args.cache_dir
 
     # Retrieve all paths to data files
     logger.info("Data will be extracted from here:")
@@ -192,30 +496,13 @@ if __name__ == "__main__":
     )
 
     # Wrangle data and calculate FIB indices
-    (
-        userid_username,
-        userid_postids,
-        postid_timestamp,
-        postid_num_reshares,
-        postid_url,
-    ) = extract_data_from_files(data_files, earliest_date_tstamp)
+    store = extract_data_from_files(
+        data_files, earliest_date_tstamp, workers, cache_dir
+    )
 
     logger.info("Creating output dataframes...")
     try:
-        userid_total_reshares = create_userid_total_reshares(
-            postid_num_reshares, userid_postids
-        )
-        userid_reshare_lists = create_userid_reshare_lists(
-            postid_num_reshares, userid_postids
-        )
-    except Exception as e:
-        logger.exception(f"Problem creating secondary lookup maps!")
-        raise Exception(e)
-
-    try:
-        fib_frame = create_fib_frame(
-            userid_reshare_lists, userid_username, userid_total_reshares
-        )
+        fib_frame = create_fib_frame_fused(store)
     except Exception as e:
         logger.exception(f"Problem creating FIB frame!")
         raise Exception(e)
@@ -225,20 +512,12 @@ if __name__ == "__main__":
     logger.info(f"\t- Type of spreaders to select: {SPREADER_TYPE}")
     try:
         top_spreaders = get_top_spreaders(fib_frame, NUM_SPREADERS, SPREADER_TYPE)
-        top_spreader_df = create_top_spreader_df(
-            top_spreaders,
-            userid_postids,
-            postid_num_reshares,
-            postid_timestamp,
-            postid_url,
-        )
+        top_spreader_df = create_top_spreader_df(top_spreaders, store)
     except Exception as e:
         logger.exception(f"Problem creating top spreaders df")
         raise Exception(e)
 
-    fib_frame = fib_frame.sort_values("fib_index", ascending=False).reset_index(
-        drop=True
-    )
+    fib_frame = sort_fib_frame(fib_frame, "fib_index", num_sorted=NUM_SORTED_ROWS)
     top_spreader_df = top_spreader_df.sort_values(
         "num_reshares", ascending=False
     ).reset_index(drop=True)
@@ -12,7 +12,7 @@ Inputs:
     - Input files contain Twitter posts.
 
 Output:
-    Two .parquet files containing:
+    Three .parquet files containing:
     1. {YYYY_mm_dd}__fib_indices_twitter.parquet: a pandas dataframe with the following columns:
         - user_id (str) : a unique Twitter user ID
         - fib_index (int) : a specific user's FIB index
@@ -22,6 +22,9 @@ Output:
         - post_id (str) : a unique Twitter post ID
         - num_reshares (int) : the number of times post_id was reshared
         - timestamp (str) : timestamp when post was sent
+    3. {YYYY_mm_dd}__profile_image_links_twitter.parquet: a pandas dataframe with the following columns:
+        - user_id (str) : a unique Twitter user ID (all users in the data)
+        - profile_image_url (str) : the URL of the user's latest profile image
 
     NOTE: YYYY_mm_dd will be representative of the machine's current date
 
@@ -34,21 +37,39 @@ Author: Matthew DeVerna
 ### ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Load Packages ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 import datetime
 import glob
-import gzip
-import json
+import logging
+import math
 import os
 import sys
 
-from collections import defaultdict
-from top_fibers_pkg.data_model import Tweet_v1
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from top_fibers_pkg.json_decoding import get_json_backend
+from top_fibers_pkg.data_model import parse_twitter_v1_timestamp
+from top_fibers_pkg.projection import (
+    FieldProjector,
+    TWITTER_V1_FIB_FIELDS,
+    TWITTER_V1_REQUIRED_KEYS,
+)
+from top_fibers_pkg.interned_store import merge_partial_stores
+from top_fibers_pkg.partial_stores import get_partial_stores
+from top_fibers_pkg.store_cache import load_store_cache, save_store_cache
+from top_fibers_pkg.post_stores import (
+    TWITTER_FIB_COLUMNS,
+    get_file_shards,
+    load_post_store,
+)
+from top_fibers_pkg.seekable_gzip import iter_shard_lines
 from top_fibers_pkg.dates import get_earliest_date
 from top_fibers_pkg.utils import parse_cl_args_fib, get_logger
 from top_fibers_pkg.fib_helpers import (
-    create_userid_total_reshares,
-    create_userid_reshare_lists,
-    create_fib_frame,
+    create_fib_frame_fused,
     get_top_spreaders,
+    sort_fib_frame,
     create_top_spreader_df,
+    create_tweet_store,
+    add_tweet_rows,
+    create_profile_image_df,
 )
 
 REPO_ROOT = "/home/data/apps/topfibers/repo"
@@ -61,158 +82,285 @@ SCRIPT_PURPOSE = (
 MATCHING_STR = "*.jsonl.gzip"
 SUCCESS_FNAME = "success.log"
 
+# Functions run by worker processes (which do not run the `__main__` block) log to
+# this logger. get_logger configures it (by name) in the main process.
+logger = logging.getLogger(os.path.basename(__file__))
+
 # NOTE: Set the number of top ranked spreaders to select and which type
 NUM_SPREADERS = 50
 SPREADER_TYPE = "fib_index"  # Options: ["total_reshares", "fib_index"]
 
+# NOTE: Set how many rows of the output FIB indices file are sorted. None sorts the
+# entire file. Downstream consumers (e.g., the data-loader) only read the first
+# 50 rows, so setting this to NUM_SPREADERS skips sorting millions of other rows.
+NUM_SORTED_ROWS = None
+
 
 ### ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Set Functions ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-def extract_data_from_files(data_files, earliest_date_tstamp):
+def iter_raw_tweet_rows(lines):
+    """
+    Parse raw tweet lines into the same rows as those of a post store's
+    TWITTER_FIB_COLUMNS (see top_fibers_pkg.post_stores).
+
+    Parameters:
+    -----------
+    - lines (iterable[bytes]) : raw new-line delimited tweet JSON lines
+
+    Yields:
+    -----------
+    - row (list) : the post ID, user ID, screen name, timestamp (None if not
+        valid), retweet count and profile image URL of the base tweet, followed
+        by those of the retweeted and quoted tweets (None if not present).
+        Invalid tweets are logged and skipped.
+    """
+    projector = FieldProjector(
+        TWITTER_V1_FIB_FIELDS, required_keys=TWITTER_V1_REQUIRED_KEYS
+    )
+    timestamp_idxs = [
+        idx
+        for idx, path in enumerate(TWITTER_V1_FIB_FIELDS)
+        if path[-1] == "created_at"
+    ]
+
+    for line in lines:
+        # One flat tuple per line: the base tweet's fields followed by those
+        # of the retweeted and quoted tweets (None if not present)
+        fields = projector.project_line(line)
+
+        if fields is None:
+            logger.info("Skipping invalid tweet!!")
+            logger.info("-" * 50)
+            logger.info(line)
+            logger.info("-" * 50)
+            continue
+
+        row = list(fields)
+        for idx in timestamp_idxs:
+            row[idx] = parse_twitter_v1_timestamp(row[idx])
+        yield row
+
+
+def extract_data_from_file(
+    file, earliest_date_tstamp, store=None, shard=(0, None)
+):
+    """
+    Load the tweet data needed for calculating FIB indices from a single file
+    into an InternedPostStore: user IDs/screennames, retweet counts, timestamps,
+    profile image URLs and (lazily derived) tweet URLs.
+
+    If the whole file is read and it has an up-to-date post store (see
+    top_fibers_pkg.post_stores), only the needed columns and the rows in the time
+    window are read from the post store, instead of parsing the raw JSON.
+
+    Parameters:
+    -----------
+    - file (str) : path to a data file
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices. If None, all tweets are kept.
+    - store (InternedPostStore) : the store to add data to. If None (default), a
+        new store is created. Creating a new store for each file gives a partial
+        aggregate that can be merged with those of other files.
+    - shard (tuple) : the (start, end) uncompressed byte range of the file to
+        read (see top_fibers_pkg.seekable_gzip.get_line_shards). Default =
+        (0, None), i.e. the whole file
+
+    Returns:
+    -----------
+    - store (InternedPostStore) : the store holding all tweet data, where...
+        - the retweet count of each tweet is the max number of retweets in data
+        - the username (and profile image URL) of each user will be the last
+            one encountered, which will also be the most recent.
+
+    Exceptions:
+    -----------
+    - Exception
+    """
+    if store is None:
+        store = create_tweet_store()
+
+    try:
+        table = None
+        if shard == (0, None):
+            table = load_post_store(file, TWITTER_FIB_COLUMNS, earliest_date_tstamp)
+
+        if table is not None:
+            logger.info(f"Loading tweets from the post store of file: {file} ...")
+            rows = zip(*(column.to_pylist() for column in table.columns))
+        else:
+            shard_msg = "" if shard == (0, None) else f" (shard: {shard})"
+            logger.info(f"Loading tweets from file: {file}{shard_msg} ...")
+            rows = iter_raw_tweet_rows(iter_shard_lines(file, *shard))
+
+        if earliest_date_tstamp is None:
+            earliest_date_tstamp = -math.inf
+
+        return add_tweet_rows(rows, earliest_date_tstamp, store)
+
+    # Raise this error if something weird happens loading the data
+    except Exception as e:
+        logger.exception(f"Problem parsing data file: {file}")
+        raise Exception(e)
+
+
+def parse_files_separately(data_files, earliest_date_tstamp, workers=1):
+    """
+    Parse each file into its own partial store.
+
+    Parameters:
+    -----------
+    - data_files(list) : a list of paths to files
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices. If None, all tweets are kept.
+    - workers (int) : the number of processes used to parse files. Default = 1
+
+    Yields:
+    -----------
+    - store (InternedPostStore) : the partial store of each file, in the order of
+        `data_files`
+    """
+    if workers <= 1:
+        for file in data_files:
+            yield extract_data_from_file(file, earliest_date_tstamp)
+        return
+
+    logger.info(f"Parsing files with {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Split each file into (up to) one line-aligned shard per worker, so
+        # workers can decompress and parse parts of the same file in parallel.
+        # Without a seekable gzip reader, or if the file has a post store, each
+        # file is a single shard.
+        file_shards = list(
+            executor.map(get_file_shards, data_files, repeat(workers))
+        )
+        shard_files = [
+            file for file, shards in zip(data_files, file_shards) for _ in shards
+        ]
+        all_shards = [shard for shards in file_shards for shard in shards]
+
+        # `map` returns results in order, so merging the shards of each file
+        # preserves the order in which data would have been parsed serially
+        shard_stores = executor.map(
+            extract_data_from_file,
+            shard_files,
+            repeat(earliest_date_tstamp),
+            repeat(None),
+            all_shards,
+        )
+        for shards in file_shards:
+            yield merge_partial_stores(next(shard_stores) for _ in shards)
+
+
+def extract_cached_data_from_files(
+    data_files, earliest_date_tstamp, workers, cache_dir
+):
+    """
+    Load the cached store of all files and the time window if it exists (see
+    top_fibers_pkg.store_cache). Otherwise, build it from the partial store of
+    each file (parsing only files without an up-to-date saved partial store) and
+    save it.
+
+    Parameters:
+    -----------
+    - data_files(list) : a list of paths to files
+    - earliest_date_tstamp (timestamp) : the earliest date from which to consider
+        data for calculating FIB indices
+    - workers (int) : the number of processes used to parse files
+    - cache_dir (str) : directory where partial and cached stores are saved
+
+    Returns:
+    -----------
+    - store (InternedPostStore or None) : the store holding all data in the time
+        window (read-only if it was loaded from the cache), or None if there
+        are no data files
+    """
+    store = load_store_cache(cache_dir, data_files, earliest_date_tstamp)
+    if store is not None:
+        logger.info("Loaded the cached store of these files and time window.")
+        return store
+
+    partial_stores = get_partial_stores(
+        data_files,
+        cache_dir,
+        lambda files: parse_files_separately(files, None, workers),
+        logger,
+    )
+    store = merge_partial_stores(partial_stores)
+    if store is None:
+        return None
+
+    store = store.filter_by_timestamp(earliest_date_tstamp)
+    path = save_store_cache(store, cache_dir, data_files, earliest_date_tstamp)
+    logger.info(f"Saved the store of these files and time window: {path}")
+    return store
+
+
+def extract_data_from_files(
+    data_files, earliest_date_tstamp, workers=1, cache_dir=None
+):
     """
-    Load tweet data into three dictionaries that include only the
-    needed information: user IDs/screennames and retweet counts
+    Load the tweet data needed for calculating FIB indices from all files into
+    an InternedPostStore.
+
+    With more than one worker, each file (or each shard of a file, if it can be
+    read with a seekable gzip reader) is parsed into its own partial store in a
+    pool of processes and the partial stores are then merged in order.
+    This gives identical results to parsing the files one after another: the max
+    retweet count of each tweet wins and the last username encountered wins.
+
+    With a `cache_dir`, the partial store of each file is built from all of its
+    tweets and saved, so that later runs (e.g., next month's, which shares all
+    but one file) only parse new or changed files. The time window is applied
+    after merging, with the same result as filtering while parsing (a tweet's
+    "created_at" never changes and retweeted/quoted tweets are always older than
+    the tweet that embeds them). The merged store of all files and the window
+    is saved as well, so re-running with the same files and window (e.g., after
+    a crash) does not extract anything.
 
     Parameters:
     -----------
     - data_files(list) : a list of paths to files
     - earliest_date_tstamp (timestamp) : the earliest date from which to consider
         data for calculating FIB indices
+    - workers (int) : the number of processes used to parse files. Default = 1
+    - cache_dir (str) : directory where the partial store of each file is saved
+        and loaded from. Default = None (parse all files and save nothing)
 
     Returns:
     -----------
-    - tweetid_max_rts (dict) : {tweet_id_str : max number of retweets in data}
-    - userid_tweetids (dict) : {userid_x : set([tweetids sent by userid_x])}
-    - userid_username (dict) : {userid : username}
-        NOTE: the username will be the last one encountered, which will also be
-        the most recent.
+    - store (InternedPostStore) : the store holding all tweet data (see
+        `extract_data_from_file`)
 
     Exceptions:
     -----------
-    - Exception, TypeError
+    - TypeError
     """
     if not isinstance(data_files, list):
         raise TypeError("`data_files` must be a list!")
     if not all(isinstance(path, str) for path in data_files):
         raise TypeError("All `data_files` must be a string!")
+    if not isinstance(workers, int):
+        raise TypeError("`workers` must be an integer!")
 
-    tweetid_timestamp = dict()
-    tweetid_url = dict()
-    tweetid_max_rts = defaultdict(int)
-
-    userid_tweetids = defaultdict(set)
-    userid_username = dict()
-
-    try:
+    if cache_dir is not None:
+        store = extract_cached_data_from_files(
+            data_files, earliest_date_tstamp, workers, cache_dir
+        )
+    elif workers <= 1:
+        store = None
         for file in data_files:
-            logger.info(f"Loading tweets from file: {file} ...")
-            with gzip.open(file, "rb") as f:
-                for line in f:
-                    tweet = Tweet_v1(json.loads(line.decode()))
-
-                    if not tweet.is_valid():
-                        logger.info("Skipping invalid tweet!!")
-                        logger.info("-" * 50)
-                        logger.info(tweet.post_object)
-                        logger.info("-" * 50)
-                        continue
-
-                    timestamp_str = tweet.get_post_time(timestamp=True)
-                    timestamp = datetime.datetime.fromtimestamp(
-                        int(timestamp_str)
-                    ).timestamp()
-                    # Skip anything posted before the earliest date
-                    if timestamp < earliest_date_tstamp:
-                        continue
-
-                    # Parse the base-level tweet
-                    tweet_id = tweet.get_post_ID()
-                    tweet_url = tweet.get_link_to_post()
-                    user_id = tweet.get_user_ID()
-                    username = tweet.get_user_handle()
-
-                    rt_count = tweet.get_reshare_count()
-                    prev_rt_val = tweetid_max_rts[tweet_id]
-                    if prev_rt_val > rt_count:
-                        rt_count = prev_rt_val
-
-                    # Store the data
-                    tweetid_timestamp[tweet_id] = timestamp_str
-                    tweetid_max_rts[tweet_id] = rt_count
-                    tweetid_url[tweet_id] = tweet_url
-                    userid_tweetids[user_id].add(tweet_id)
-                    userid_username[user_id] = username
-
-                    # Handle retweets
-                    if tweet.is_retweet:
-
-                        # Only keep base retweet objs that occurred on or after the earliest date
-                        timestamp_str = tweet.retweet_object.get_post_time(
-                            timestamp=True
-                        )
-                        timestamp = datetime.datetime.fromtimestamp(
-                            int(timestamp_str)
-                        ).timestamp()
-                        if timestamp >= earliest_date_tstamp:
-                            tweet_id = tweet.retweet_object.get_post_ID()
-                            tweet_url = tweet.retweet_object.get_link_to_post()
-                            user_id = tweet.retweet_object.get_user_ID()
-                            username = tweet.retweet_object.get_user_handle()
-
-                            rt_count = tweet.retweet_object.get_reshare_count()
-                            prev_rt_val = tweetid_max_rts[tweet_id]
-                            if prev_rt_val > rt_count:
-                                rt_count = prev_rt_val
-
-                            # Store the data
-                            tweetid_timestamp[tweet_id] = timestamp_str
-                            tweetid_max_rts[tweet_id] = rt_count
-                            tweetid_url[tweet_id] = tweet_url
-                            userid_tweetids[user_id].add(tweet_id)
-                            userid_username[user_id] = username
-
-                    # Handle quotes
-                    if tweet.is_quote:
-
-                        # Only keep base quote objs that occurred on or after the earliest date
-                        timestamp_str = tweet.quote_object.get_post_time(timestamp=True)
-                        timestamp = datetime.datetime.fromtimestamp(
-                            int(timestamp_str)
-                        ).timestamp()
-                        if timestamp >= earliest_date_tstamp:
-                            tweet_id = tweet.quote_object.get_post_ID()
-                            tweet_url = tweet.quote_object.get_link_to_post()
-                            user_id = tweet.quote_object.get_user_ID()
-                            username = tweet.quote_object.get_user_handle()
-
-                            rt_count = tweet.quote_object.get_reshare_count()
-                            prev_rt_val = tweetid_max_rts[tweet_id]
-                            if prev_rt_val > rt_count:
-                                rt_count = prev_rt_val
-
-                            # Store the data
-                            tweetid_timestamp[tweet_id] = timestamp_str
-                            tweetid_max_rts[tweet_id] = rt_count
-                            tweetid_url[tweet_id] = tweet_url
-                            userid_tweetids[user_id].add(tweet_id)
-                            userid_username[user_id] = username
-
-        num_tweets = len(tweetid_max_rts.keys())
-        num_users = len(userid_tweetids.keys())
-        logger.info(f"Total Tweets Ingested = {num_tweets:,}")
-        logger.info(f"Total Number of Users = {num_users:,}")
-
-        return (
-            dict(tweetid_max_rts),
-            dict(userid_tweetids),
-            userid_username,
-            tweetid_timestamp,
-            tweetid_url,
+            store = extract_data_from_file(file, earliest_date_tstamp, store)
+    else:
+        store = merge_partial_stores(
+            parse_files_separately(data_files, earliest_date_tstamp, workers)
         )
 
-    # Raise this error if something weird happens loading the data
-    except Exception as e:
-        logger.exception(f"Problem parsing data file: {file}")
-        raise Exception(e)
+    if store is None:
+        store = create_tweet_store()
+
+    logger.info(f"Total Tweets Ingested = {store.num_posts:,}")
+    logger.info(f"Total Number of Users = {store.num_users:,}")
+
+    return store
 
 
 # Execute the program
@@ -228,6 +376,7 @@ if __name__ == "__main__":
     logger = get_logger(LOG_DIR, LOG_FNAME, script_name=script_name, also_print=True)
     logger.info("-" * 50)
     logger.info(f"Begin script: {__file__}")
+    logger.info(f"JSON decoding backend: {get_json_backend()}")
 
     # Parse input flags
     args = parse_cl_args_fib(SCRIPT_PURPOSE, logger)
@@ -235,6 +384,8 @@ if __name__ == "__main__":
     output_dir = args.out_dir
     month_calculated = args.month_calculated
     num_months = int(args.num_months)
+    workers = args.workers
+    cache_dir = args.cache_dir
     if output_dir is None:
         output_dir = "."
 
@@ -252,40 +403,20 @@ if __name__ == "__main__":
     )
 
     # Wrangle data and calculate FIB indices
-    (
-        postid_num_reshares,
-        userid_postids,
-        userid_username,
-        postid_timestamp,
-        tweetid_url,
-    ) = extract_data_from_files(data_files, earliest_date_tstamp)
+    store = extract_data_from_files(
+        data_files, earliest_date_tstamp, workers, cache_dir
+    )
 
     logger.info("Creating output dataframes...")
-    userid_total_reshares = create_userid_total_reshares(
-        postid_num_reshares, userid_postids
-    )
-    userid_reshare_lists = create_userid_reshare_lists(
-        postid_num_reshares, userid_postids
-    )
-    fib_frame = create_fib_frame(
-        userid_reshare_lists, userid_username, userid_total_reshares
-    )
+    fib_frame = create_fib_frame_fused(store)
 
     logger.info("Top spreader information:")
     logger.info(f"\t- Num. spreaders to select   : {NUM_SPREADERS}")
     logger.info(f"\t- Type of spreaders to select: {SPREADER_TYPE}")
     top_spreaders = get_top_spreaders(fib_frame, NUM_SPREADERS, SPREADER_TYPE)
-    top_spreader_df = create_top_spreader_df(
-        top_spreaders,
-        userid_postids,
-        postid_num_reshares,
-        postid_timestamp,
-        tweetid_url,
-    )
+    top_spreader_df = create_top_spreader_df(top_spreaders, store)
 
-    fib_frame = fib_frame.sort_values("fib_index", ascending=False).reset_index(
-        drop=True
-    )
+    fib_frame = sort_fib_frame(fib_frame, "fib_index", num_sorted=NUM_SORTED_ROWS)
     top_spreader_df = top_spreader_df.sort_values(
         "num_reshares", ascending=False
     ).reset_index(drop=True)
@@ -303,8 +434,14 @@ if __name__ == "__main__":
     output_rt_fname = os.path.join(
         outdir_with_month, f"{today}__top_spreader_posts_twitter.parquet"
     )
+    output_image_fname = os.path.join(
+        outdir_with_month, f"{today}__profile_image_links_twitter.parquet"
+    )
     fib_frame.to_parquet(output_fib_fname, index=False, engine="pyarrow")
     top_spreader_df.to_parquet(output_rt_fname, index=False, engine="pyarrow")
+    create_profile_image_df(store).to_parquet(
+        output_image_fname, index=False, engine="pyarrow"
+    )
 
     with open(os.path.join(REPO_ROOT, SUCCESS_FNAME), "w+") as outfile:
         pass
@@ -10,6 +10,8 @@
 #   - Output files are marked with the date that they are created. If FIB files already exist for that period
 #   this means you will have two versions of the same file and you must manually remove the old files
 #   - If you would like to specify specific months, uncomment the line just before the loop
+#   - The parsed data of each raw file is saved in $cache_path, so each raw file is only parsed once
+#   across all periods (unless it changes)
 #
 # Inputs:
 #   platform: either "twitter" or "facebook"
@@ -34,11 +36,13 @@ if [ "$1" == "twitter" ]; then
   script_path=/home/data/apps/topfibers/repo/scripts/data_processing/calc_twitter_fib_indices.py
   data_path=/home/data/apps/topfibers/repo/data/symbolic_links/twitter
   out_path=/home/data/apps/topfibers/repo/data/derived/fib_results/twitter
+  cache_path=/home/data/apps/topfibers/repo/data/derived/partial_stores/twitter
 elif [ "$1" == "facebook" ]; then
   echo "#### Calculating Facebook FIB indices ####"
   script_path=/home/data/apps/topfibers/repo/scripts/data_processing/calc_crowdtangle_fib_indices.py
   data_path=/home/data/apps/topfibers/repo/data/symbolic_links/facebook
   out_path=/home/data/apps/topfibers/repo/data/derived/fib_results/facebook
+  cache_path=/home/data/apps/topfibers/repo/data/derived/partial_stores/facebook
 else
   echo "Invalid input. Please enter either 'twitter' or 'facebook'."
   exit 1
@@ -79,7 +83,7 @@ n_months=3
 # months=("2022_01" "2022_05" "2023_01")
 
 for month in "${months[@]}"; do
-    $env_python $script_path -d $data_path/$month -o $out_path -m $month -n $n_months
+    $env_python $script_path -d $data_path/$month -o $out_path -m $month -n $n_months -c $cache_path
 done
 
 echo ~~~ Script complete. ~~~
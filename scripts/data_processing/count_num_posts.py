@@ -3,40 +3,51 @@ Purpose:
     A script to count the number of posts that we have in all raw files contained in
     the data directory provided.
 
-    Note: Previously counted files are skipped.
+    Note: Previously counted files are skipped, unless their size or modification
+        time changed since they were counted (e.g., the current month's file
+        gained new data). Files are counted in parallel with `--workers`. The
+        line count of a file's gzip index is reused if the index is up to date
+        (see top_fibers_pkg.seekable_gzip), but counting never builds one.
 
 Inputs:
     -o / --output-dir: Full path to the output directory where you'd like to save post counts
     -d / --data-dir: Full path to the raw posts directory
     -p / --platform: The platform posts you want to count
+    -w / --workers: The number of files counted in parallel
 
 Outputs:
     File saved in the `output_dir`. Filenames created based on `platform`:
         - {platform}_post_counts_by_file.parquet
+    Columns: file_name, num_posts, date_counted, file_size and file_mtime_ns (the
+    last two are the file's size and modification time when it was counted)
 
 Author: Matthew DeVerna
 """
 import argparse
 import datetime
 import glob
-import gzip
 import os
 import sys
 
+from concurrent.futures import ProcessPoolExecutor
 from top_fibers_pkg.utils import get_logger
+from top_fibers_pkg.seekable_gzip import count_gzip_lines
 
 import pandas as pd
 
 SCRIPT_PURPOSE = (
     "Count the number of posts that we have in all "
     "raw files contained in the data dir provided. "
-    "Previously counted files are skipped."
+    "Previously counted files are skipped, unless they changed."
 )
 REPO_ROOT = "/home/data/apps/topfibers/repo"
 LOG_DIR = "./logs"
 LOG_FNAME = "post_count.log"
 SUCCESS_FNAME = "success.log"
 
+# Recorded for each file, to recount files that changed since they were counted
+FILE_STAT_COLUMNS = ["file_size", "file_mtime_ns"]
+
 
 def parse_cl_args(script_purpose="", logger=None):
     """
@@ -92,6 +103,14 @@ def parse_cl_args(script_purpose="", logger=None):
         choices=["twitter", "facebook"],
         required=True,
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="Number of workers",
+        help="The number of files counted in parallel. Default = 1",
+        type=int,
+        default=1,
+    )
 
     # Read parsed arguments from the command line into "args"
     args = parser.parse_args()
@@ -115,6 +134,7 @@ if __name__ == "__main__":
     output_dir = args.output_dir
     data_dir = args.data_dir
     platform = args.platform
+    workers = args.workers
 
     logger.info(f"Counting posts for: {platform}")
 
@@ -122,10 +142,20 @@ if __name__ == "__main__":
     output_filepath = os.path.join(
         output_dir, f"{platform}_post_counts_by_file.parquet"
     )
-    previously_counted_files = None
+    existing_counts_df = None
+    previous_file_stats = dict()
     if os.path.exists(output_filepath):
         existing_counts_df = pd.read_parquet(output_filepath)
-        previously_counted_files = set(existing_counts_df["file_name"])
+        # Files counted before sizes/modification times were recorded are recounted
+        for column in FILE_STAT_COLUMNS:
+            if column not in existing_counts_df.columns:
+                existing_counts_df[column] = pd.NA
+            existing_counts_df[column] = existing_counts_df[column].astype("Int64")
+        previous_file_stats = {
+            row.file_name: (int(row.file_size), int(row.file_mtime_ns))
+            for row in existing_counts_df.itertuples()
+            if not (pd.isna(row.file_size) or pd.isna(row.file_mtime_ns))
+        }
 
     # Get all raw files full paths
     raw_files_dir = os.path.join(data_dir, platform)
@@ -134,23 +164,49 @@ if __name__ == "__main__":
     num_files = len(files)
     logger.info(f"Number of files: {num_files}")
 
-    data = []
-    for fnum, file in enumerate(files, start=1):
-        logger.info(f"Working on file ({fnum}/{num_files}): {file}")
-        if previously_counted_files is not None and file in previously_counted_files:
-            logger.info("Skipping file because it has already been counted.")
+    new_files = []
+    new_file_stats = []
+    for file in files:
+        file_stat = os.stat(file)
+        stats = (file_stat.st_size, file_stat.st_mtime_ns)
+        if previous_file_stats.get(file) == stats:
+            logger.info(f"Skipping file that has already been counted: {file}")
             continue
+        new_files.append(file)
+        new_file_stats.append(stats)
+    num_new_files = len(new_files)
+    logger.info(f"Number of files to count: {num_new_files}")
 
-        with gzip.open(file, "rb") as f:
-            data.append({"file_name": file, "num_posts": sum(1 for post in f)})
+    data = []
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        all_num_posts = executor.map(count_gzip_lines, new_files)
+        for fnum, (file, (file_size, file_mtime_ns), num_posts) in enumerate(
+            zip(new_files, new_file_stats, all_num_posts), start=1
+        ):
+            logger.info(f"Counted file ({fnum}/{num_new_files}): {file}")
+            data.append(
+                {
+                    "file_name": file,
+                    "num_posts": num_posts,
+                    "file_size": file_size,
+                    "file_mtime_ns": file_mtime_ns,
+                }
+            )
 
     logger.info("Creating counts dataframe...")
     today = datetime.datetime.now().strftime("%Y-%m-%d")
-    counts_df = pd.DataFrame.from_records(data)
+    counts_df = pd.DataFrame.from_records(
+        data, columns=["file_name", "num_posts"] + FILE_STAT_COLUMNS
+    )
+    counts_df["num_posts"] = counts_df["num_posts"].astype("int64")
+    counts_df[FILE_STAT_COLUMNS] = counts_df[FILE_STAT_COLUMNS].astype("Int64")
     counts_df["date_counted"] = today
 
-    if previously_counted_files is not None:
+    if existing_counts_df is not None:
         logger.info("Merging existing counts with new counts...")
+        existing_counts_df = existing_counts_df[
+            ~existing_counts_df["file_name"].isin(new_files)
+        ]
         counts_df = pd.concat([existing_counts_df, counts_df])
 
     logger.info(f"Saving counts dataframe here: {output_filepath} ...")
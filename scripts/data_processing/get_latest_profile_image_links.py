@@ -4,61 +4,51 @@ Purpose:
     Get links to top TWITTER FIBers profile image.
 
     NOTE: This script will update old links to profile images if we have a new one.
-        It does this by iterating through files in reverse chronological order and then
-        removing a user until links for all users have been found. By default, only 
-        FIBers that have been found in the latest month are updated, however, to look for
-        and update ALL top FIBers, make sure to pass the --all-users flag to the script.
+        Links are looked up in the profile image index files saved by
+        calc_twitter_fib_indices.py next to its FIB indices (the latest profile
+        image URL of every user in the data of that run), so no raw data is read.
+        Index files are searched in reverse chronological order and a user is
+        removed once their link has been found. By default, only FIBers that have
+        been found in the latest month are updated (using that month's index),
+        however, to look for and update ALL top FIBers, make sure to pass the
+        --all-users flag to the script.
+
+        Months of FIB results calculated before the index was saved have no index
+        file. The script fails (before writing anything) if any of the months it
+        would search has no index. Backfill them once with:
+            python scripts/data_prep/convert_raw_to_post_stores.py -p twitter -i
 
 Inputs:
-    - Those loaded by top_fibers_pkg.utils.parse_cl_args_fib
+    -a / --all-users: If included, update the links of all top FIBers ever found
 
-    NOTE:
-    - Call the calc_twitter_fib_indices.py -h flag to get input/flag details.
-    - Input files contain Twitter posts.
+    NOTE: Run this after calc_twitter_fib_indices.py for the current month.
 
 Output:
-    Two .parquet files containing:
-    1. {YYYY_mm_dd}__fib_indices_twitter.parquet: a pandas dataframe with the following columns:
-        - user_id (str) : a unique Twitter user ID
-        - fib_index (int) : a specific user's FIB index
-        - total_reshares (int) : total number of reshares earned by user_id
-    2. {YYYY_mm_dd}__top_spreader_posts_twitter.parquet: a pandas dataframe with the following columns:
-        - user_id (str) : a unique Twitter user ID
-        - post_id (str) : a unique Twitter post ID
-        - num_reshares (int) : the number of times post_id was reshared
-        - timestamp (str) : timestamp when post was sent
-
-    NOTE: YYYY_mm_dd will be representative of the machine's current date
-
-What is the FIB-index?
-    Please see our working paper for details.
-    - https://arxiv.org/abs/2207.09524
+    One .parquet file (OUTPUT_FILE) containing a pandas dataframe with the
+    following columns:
+        - user_id (str) : a unique Twitter user ID (of a top FIBer)
+        - profile_image_url (str) : the URL of the user's latest profile image
 
 Author: Matthew DeVerna
 """
 import argparse
 import datetime
 import glob
-import gzip
-import json
 import os
 import sys
 
 import pandas as pd
 
-from dateutil.relativedelta import relativedelta
 from top_fibers_pkg.utils import get_logger
-from top_fibers_pkg.data_model import Tweet_v1
 
 
 SCRIPT_PURPOSE = "Update the profile image links for Top FIBers."
 REPO_ROOT = "/home/data/apps/topfibers/repo"
 LOG_DIR = "./logs"
 LOG_FNAME = "get_latest_profile_image_links.log"
-DATA_DIR = "/home/data/apps/topfibers/repo/data/raw/twitter"
-DATA_FILE_SUFFIX = "__tweets_w_links.jsonl.gzip"
 FIBER_DATA_DIR = "/home/data/apps/topfibers/repo/data/derived/fib_results/twitter/"
 FIBER_FILE_SUFFIX = "__fib_indices_twitter.parquet"
+PROFILE_IMAGE_FILE_SUFFIX = "__profile_image_links_twitter.parquet"
 OUTPUT_FILE = "/home/data/apps/topfibers/repo/data/derived/twitter_profile_links/top_fiber_profile_image_links.parquet"
 SUCCESS_FNAME = "success.log"
 NUM_FIBERS = 50
@@ -104,36 +94,6 @@ def parse_cl_args(script_purpose="", logger=None):
     return args
 
 
-def get_raw_files(update_all):
-    """
-    Return a list of full paths to raw twitter data files.
-
-    Parameters
-    -----------
-    - update_all (boolean) : from the commandline flag. If True, return all data
-        files for all months. Otherwise, return the data file for only the current month.
-
-    Returns
-    -----------
-    - files (list): list containing full path strings to raw twitter data files
-    """
-    if update_all:
-        # Sorts all files in the data directory in reverse chronological order
-        files = sorted(
-            glob.glob(os.path.join(DATA_DIR, f"*{DATA_FILE_SUFFIX}")), reverse=True
-        )
-    else:
-        # Creates a list containing only the file for the latest month
-        now = datetime.datetime.now()
-        files = []
-
-        # For one month, we want the last three months of data
-        for x in range(1, 4):
-            first_day_month = f"{(now - relativedelta(months=x)).strftime('%Y-%m')}-01"
-            files.append(os.path.join(DATA_DIR, f"{first_day_month}{DATA_FILE_SUFFIX}"))
-    return files
-
-
 def get_FIBer_files(update_all):
     """
     Return the full path to the twitter top FIBers files.
@@ -183,14 +143,57 @@ def load_top_fiber_uids(files):
     return fiber_uids
 
 
+def get_profile_image_index_files(update_all):
+    """
+    Return the full paths to the profile image index files saved by
+    calc_twitter_fib_indices.py (one per run, with the latest profile image URL
+    of every user in that run's data), in reverse chronological order, and the
+    month directories that include FIB indices but no index file.
+
+    Parameters
+    -----------
+    - update_all (boolean) : from the commandline flag. If True, return the
+        index files of all months. Otherwise, return those of only the current
+        month.
+
+    Returns
+    -----------
+    - files (list): list containing full path strings to profile image index files
+    - unindexed_month_dirs (list): full paths to month directories with FIB
+        indices but no profile image index file
+    """
+    if update_all:
+        month_dirs = glob.glob(os.path.join(FIBER_DATA_DIR, "*"))
+    else:
+        year_month_str = datetime.datetime.now().strftime("%Y_%m")
+        month_dirs = [os.path.join(FIBER_DATA_DIR, year_month_str)]
+
+    # Month directories are named YYYY_mm and files are prefixed with YYYY_mm_dd
+    files = []
+    unindexed_month_dirs = []
+    for month_dir in sorted(month_dirs, reverse=True):
+        index_pattern = os.path.join(month_dir, f"*{PROFILE_IMAGE_FILE_SUFFIX}")
+        index_files = glob.glob(index_pattern)
+        fiber_files = glob.glob(os.path.join(month_dir, f"*{FIBER_FILE_SUFFIX}"))
+        if fiber_files and not index_files:
+            unindexed_month_dirs.append(month_dir)
+        files.extend(sorted(index_files, reverse=True))
+    return files, unindexed_month_dirs
+
+
 def get_profile_image_links(fiber_uids, files):
     """
     Collect profile image links for all provided user_ids.
 
+    Index files are searched in order, so the link of each user comes from the
+    most recent index that includes them. Only the rows of users that have not
+    been found yet are read from each file.
+
     Parameters
     -----------
     - fiber_uids (set) : set of user IDs for the top FIBers
-    - files (list) : the files to iterate through to find profile image links
+    - files (list) : the profile image index files to look links up in, in
+        reverse chronological order
 
     Returns
     -----------
@@ -199,37 +202,33 @@ def get_profile_image_links(fiber_uids, files):
             - user_id (str) : the top FIBer user ID,
             - profile_image_url : the url to `user_id`'s profile image
     """
-    uid_imageurl_records = []
+    image_link_dfs = []
     num_urls_to_collect = len(fiber_uids)
     urls_collected = 0
-    remaining_uids = True
     for file in files:
-        logger.info(f"Loading tweets from file: {file} ...")
-        with gzip.open(file, "rb") as f:
-            for line in f:
-                tweet = Tweet_v1(json.loads(line.decode()))
-
-                uid = tweet.get_user_ID()
-                if uid in fiber_uids:
-                    profile_image_url = tweet.get_user_profile_image_url()
-                    uid_imageurl_records.append(
-                        {"user_id": uid, "profile_image_url": profile_image_url}
-                    )
-                    fiber_uids.remove(uid)
-                    urls_collected += 1
-                    logger.info(
-                        f"\t- Collected: {urls_collected}/{num_urls_to_collect}"
-                    )
-
-                    if len(fiber_uids) == 0:
-                        remaining_uids = False
-                        break
-
-        if not remaining_uids:
+        if len(fiber_uids) == 0:
             logger.info("All profile image links have been collected!")
             break
 
-    image_link_df = pd.DataFrame.from_records(uid_imageurl_records)
+        logger.info(f"Looking up profile image links in file: {file} ...")
+        links_df = pd.read_parquet(
+            file,
+            engine="pyarrow",
+            columns=["user_id", "profile_image_url"],
+            filters=[("user_id", "in", list(fiber_uids))],
+        )
+        image_link_dfs.append(links_df)
+        fiber_uids.difference_update(links_df["user_id"])
+        urls_collected += len(links_df)
+        logger.info(f"\t- Collected: {urls_collected}/{num_urls_to_collect}")
+
+    if len(fiber_uids) > 0:
+        logger.warning(f"No profile image links found for {len(fiber_uids)} FIBers.")
+
+    image_link_df = pd.concat(
+        image_link_dfs + [pd.DataFrame(columns=["user_id", "profile_image_url"])],
+        ignore_index=True,
+    )
     return image_link_df
 
 
@@ -248,8 +247,17 @@ if __name__ == "__main__":
     args = parse_cl_args(SCRIPT_PURPOSE, logger)
     update_all = args.all_users
 
-    logger.info("Building a list of raw files to load...")
-    raw_files = get_raw_files(update_all)
+    logger.info("Building a list of profile image index files to load...")
+    index_files, unindexed_month_dirs = get_profile_image_index_files(update_all)
+    if unindexed_month_dirs:
+        # Links of these months' FIBers would be missing (or out of date)
+        for month_dir in unindexed_month_dirs:
+            logger.error(f"No profile image index for month: {month_dir}")
+        sys.exit(
+            f"{len(unindexed_month_dirs)} month(s) of FIB results have no profile "
+            "image index! Backfill them with:\n"
+            "\tpython scripts/data_prep/convert_raw_to_post_stores.py -p twitter -i"
+        )
     logger.info("\t- Success.")
 
     logger.info("Building a list of top FIBer files to load...")
@@ -261,7 +269,7 @@ if __name__ == "__main__":
     logger.info("\t- Success.")
 
     logger.info(f"Retrieving profile image links for {len(fiber_uid_set)} FIBers...")
-    image_link_df = get_profile_image_links(fiber_uid_set, raw_files)
+    image_link_df = get_profile_image_links(fiber_uid_set, index_files)
     logger.info("\t- Success.")
 
     logger.info(f"Saving profile image link file here:")
@@ -13,7 +13,16 @@ Purpose:
       SURE TO TEST IT PROPERLY BEFORE USE.
 
 Inputs:
-    None. See below for hardcoded paths/files.
+    -p / --platform: Which social media platform to load data from
+    -w / --workers: The number of files filtered in parallel. Default = 1
+    -l / --compress-level: The gzip compression level of output files (1-9).
+        Default = 6
+    See below for hardcoded paths/files.
+
+    NOTE: Tweets that pass the filter are written as their original raw lines
+        (they are not re-serialized). Each output file is written to a temporary
+        path and renamed once it is complete, so the script can be re-run after
+        an interruption: files whose output already exists are skipped.
 
 Outputs:
     New parsed files will be saved in the specified directory
@@ -21,25 +30,37 @@ Outputs:
 import argparse
 import glob
 import gzip
-import json
 import os
 
 import pandas as pd
 
-from urllib.parse import urlparse
-
-from top_fibers_pkg.utils import load_lines
-from top_fibers_pkg.data_model import Tweet_v1, FbIgPost
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from top_fibers_pkg.domains import DomainMatcher, load_domains
+from top_fibers_pkg.json_decoding import get_json_backend
+from top_fibers_pkg.data_model import FbIgPost
+from top_fibers_pkg.projection import FieldProjector, TWITTER_V1_REQUIRED_KEYS
 
 
 DOMAINS_DIR = "/home/data/apps/topfibers/repo/data/iffy_files"
 RAW_DIR_OLD = "/home/data/apps/topfibers/repo/data/raw_old"
 RAW_DIR_NEW = "/home/data/apps/topfibers/repo/data/raw"
 
+# Fields needed to filter tweets: the URLs of the tweet and of its retweeted tweet
+TWEET_URL_FIELDS = [
+    ["entities", "urls"],
+    ["retweeted_status"],
+    ["retweeted_status", "entities", "urls"],
+]
+
 
-def get_platform():
+def parse_cl_args():
     """
-    Load social media platform data to parse from command line argument.
+    Load the command line arguments.
+
+    Returns
+    ------------
+    - args (argparse.Namespace) : the parsed arguments
     """
     parser = argparse.ArgumentParser(
         description="Parse the tweets/FB posts to match less Iffy News domains."
@@ -50,134 +71,148 @@ def get_platform():
         choices=["twitter", "facebook"],
         help="Which social media platform to load data from. Options: ['twitter', 'facebook']",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="Number of workers",
+        help="The number of files filtered in parallel. Default = 1",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-l",
+        "--compress-level",
+        metavar="Compression level",
+        help="The gzip compression level (1-9) of output files. Default = 6",
+        type=int,
+        choices=range(1, 10),
+        default=6,
+    )
 
     args = parser.parse_args()
-    return args.platform
-
-
-def load_domains(domains_dir):
-    """
-    Loads the **latest** iffy list of domains given the proper directory path.
-    Prepare them for matching by stripping extra text (e.g., "https://", "http://", "*")
-
-    Parameters
-    ------------
-    - domains_dir (str) : path to the iffy_list directory
-
-    Returns
-    ------------
-    - domains (list) : list of domains
-    """
-    all_domains_files = sorted(glob.glob(os.path.join(domains_dir, "*iffy_list.txt")))
-    latest_domains_filepath = all_domains_files[-1]
-
-    # Load domains to match in below query and clean up
-    domains = load_lines(latest_domains_filepath)
-    domains = [domain.replace("https://", "") for domain in domains]
-    domains = [domain.replace("http://", "") for domain in domains]
-    domains = [domain.replace("www.", "") for domain in domains]
-    domains = [domain.rstrip("/*") for domain in domains]
-    return domains
-
-
-def get_base_domain(url):
-    """
-    Extract the base domain from a full URL
-
-    Parameters
-    ------------
-    - url (str) : full URL
-
-    Returns
-    ------------
-    - base_domain (str) : base domain
-    """
-    parsed_url = urlparse(url)
-    domain_parts = parsed_url.netloc.split(".")
-    base_domain = ".".join(domain_parts[-2:])
-    return base_domain
+    return args
 
 
-def get_tweets(file_path, domains_set):
+def get_tweets(file_path, domain_matcher):
     """
-    Extract tweets from `file_path` that contain the domains we want.
+    Extract tweets from `file_path` that contain the domains we want, i.e. all of
+    whose URLs match one of the domains.
 
     Parameters
     ------------
     - file_path (str) : path to the raw tweet file
-    - domains_set (set) : set of domains
+    - domain_matcher (DomainMatcher) : matcher compiled from the list of domains
 
     Yields
     ------------
-    - tweet_dict (dict) : tweet dictionary
+    - line (bytes) : the raw line of the tweet, as is (including its new line)
     """
+    projector = FieldProjector(
+        TWEET_URL_FIELDS, required_keys=TWITTER_V1_REQUIRED_KEYS
+    )
     with gzip.open(file_path, "rb") as f:
         for line in f:
-            tweet_dict = json.loads(line.decode())
-            tweet = Tweet_v1(tweet_dict)
+            fields = projector.project_line(line)
 
-            if not tweet.is_valid():
+            if fields is None:
                 print("Skipping invalid tweet!!")
                 print("-" * 50)
-                print(tweet.post_object)
+                print(line)
                 print("-" * 50)
                 continue
 
             # We want to check the retweeted status object if it has domains bc they are
             # the same for the original tweet and the retweet. We don't want to check
             # the quoted status object because they can contain different domains.
-            if tweet.is_retweet:
-                tweet = tweet.retweet_object
+            urls, retweeted_status, retweet_urls = fields
+            if retweeted_status is not None:
+                urls = retweet_urls
 
-            # Get list of all tweet URL objects
-            urls = tweet.get_value(["entities", "urls"])
+            if all(
+                domain_matcher.matches(u.get("expanded_url", u.get("url")))
+                for u in urls or []
+            ):
+                if not line.endswith(b"\n"):
+                    line += b"\n"
+                yield line
 
-            # Collect a set of domains
-            base_domains = set()
-            for u in urls:
-                url = u.get("expanded_url", u.get("url"))
-                base_domain = get_base_domain(url)
-                base_domains.add(base_domain)
 
-            if base_domains.issubset(domains_set):
-                yield tweet_dict
+def filter_file(file_path, output_path, domain_matcher, compress_level=6):
+    """
+    Write the tweets of `file_path` that contain the domains we want (see
+    `get_tweets`) to `output_path`.
+
+    The file is written to a temporary path first and then renamed, so an
+    interrupted run never leaves a truncated output file behind.
+
+    Parameters
+    ------------
+    - file_path (str) : path to the raw tweet file
+    - output_path (str) : path to the output (gzip compressed) file
+    - domain_matcher (DomainMatcher) : matcher compiled from the list of domains
+    - compress_level (int) : gzip compression level (1-9). Default = 6
+
+    Returns
+    ------------
+    - num_tweets (int) : the number of tweets written
+    """
+    num_tweets = 0
+    tmp_path = f"{output_path}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=compress_level) as f:
+        for line in get_tweets(file_path, domain_matcher):
+            f.write(line)
+            num_tweets += 1
+    os.replace(tmp_path, output_path)
+    return num_tweets
 
 
 if __name__ == "__main__":
-    # Get platform from command-line flag
-    platform = get_platform()
+    # Get settings from command-line flags
+    args = parse_cl_args()
+    platform = args.platform
+
+    if platform == "facebook":
+        print("Facebook not developed yet. Passing and will do nothing.")
+        raise SystemExit()
+
+    # This shouldn't happen
+    elif platform != "twitter":
+        raise TypeError(
+            f"Platform must be 'twitter' or 'facebook'. Currently: {platform}"
+        )
 
-    # Load domains list
-    domains_set = set(load_domains(DOMAINS_DIR))
+    print(f"JSON decoding backend: {get_json_backend()}")
+
+    # Load domains list and compile it once for matching
+    domain_matcher = DomainMatcher(load_domains(DOMAINS_DIR))
 
     # Get a list of the full paths to each file that we want to parse through
     files_to_clean = glob.glob(
         os.path.join(os.path.join(RAW_DIR_OLD, platform), "*.gzip")
     )
 
+    # Skip files that were completely parsed by a previous (interrupted) run
+    input_paths = []
+    output_paths = []
     for file in sorted(files_to_clean):
         # Create the new output file path
         basename = os.path.basename(file)
         output_path = os.path.join(RAW_DIR_NEW, platform, basename.replace("_OLD", ""))
-
-        with gzip.open(output_path, "wb") as f:
-            if platform == "twitter":
-                for tweet_dict in get_tweets(file, domains_set):
-                    json_str = json.dumps(tweet_dict)
-                    f.write(json_str.encode("utf-8"))
-                    f.write(b"\n")
-                print(f"\t- Completed: {basename}")
-
-            elif platform == "facebook":
-                if "fb_posts" not in file:
-                    raise TypeError("")
-                print("Facebook not developed yet. Passing and will do nothing.")
-                pass
-
-            # This shouldn't happen
-            else:
-                raise TypeError(
-                    f"Platform must be 'twitter' or 'facebook'. Currently: {platform}"
-                )
+        if os.path.exists(output_path):
+            print(f"\t- Skipping (already parsed): {basename}")
+            continue
+        input_paths.append(file)
+        output_paths.append(output_path)
+
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1)) as executor:
+        all_num_tweets = executor.map(
+            filter_file,
+            input_paths,
+            output_paths,
+            repeat(domain_matcher),
+            repeat(args.compress_level),
+        )
+        for file, num_tweets in zip(input_paths, all_num_tweets):
+            print(f"\t- Completed: {os.path.basename(file)} ({num_tweets:,} tweets)")
 
     print("-- Script complete. ---")
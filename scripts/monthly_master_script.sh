@@ -33,6 +33,8 @@ TWITTER_SYM_DIR="/home/data/apps/topfibers/repo/data/symbolic_links/twitter"
 FIB_OUT_DIR_TWITTER="/home/data/apps/topfibers/repo/data/derived/fib_results/twitter"
 FIB_OUT_DIR_FACBOOK="/home/data/apps/topfibers/repo/data/derived/fib_results/facebook"
 POST_COUNTS_DIR="/home/data/apps/topfibers/repo/data/derived/post_counts"
+PARTIAL_STORE_DIR_TWITTER="/home/data/apps/topfibers/repo/data/derived/partial_stores/twitter"
+PARTIAL_STORE_DIR_FACEBOOK="/home/data/apps/topfibers/repo/data/derived/partial_stores/facebook"
 
 # Logs, dates, and files
 LOG_DIR="/home/data/apps/topfibers/repo/logs"
@@ -82,6 +84,20 @@ fi
 # Remove after checking for successful completion
 rm success.log
 
+### Convert the new Facebook data into post stores
+# Log file saved here: ./logs/convert_raw_to_post_stores.log
+# -------------------------------------
+echo "$(date -Is) : Converting Facebook data into post stores..." >> $MASTER_LOG
+$PYTHON_ENV scripts/data_prep/convert_raw_to_post_stores.py -d $RAW_DATA_DIR -p facebook
+if [ -e success.log ]; then
+   echo "$(date -Is) : SUCCESS." >> $MASTER_LOG
+else
+   echo "$(date -Is) : FAILED. Exiting <${SCRIPT_NAME}>." >> $MASTER_LOG
+   exit 1
+fi
+# Remove after checking for successful completion
+rm success.log
+
 ### Running the below script completes the following things:
 #    1. Copies the latest Iffy news domains file to the Lisa-Moe shared drive
 #    2. Creates a tavern job to pull the Twitter data for the past month
@@ -114,6 +130,20 @@ rm success.log
 # Remove after checking for successful completion
 # rm success.log
 
+### Convert the new Twitter data into post stores
+# Log file saved here: ./logs/convert_raw_to_post_stores.log
+# -------------------------------------
+# echo "$(date -Is) : Converting Twitter data into post stores..." >> $MASTER_LOG
+# $PYTHON_ENV scripts/data_prep/convert_raw_to_post_stores.py -d $RAW_DATA_DIR -p twitter
+# if [ -e success.log ]; then
+#    echo "$(date -Is) : SUCCESS." >> $MASTER_LOG
+# else
+#    echo "$(date -Is) : FAILED. Exiting <${SCRIPT_NAME}>." >> $MASTER_LOG
+#    exit 1
+# fi
+# Remove after checking for successful completion
+# rm success.log
+
 ### Create the symbolic links
 # -------------------------------------
 # TWITTER
@@ -147,7 +177,7 @@ rm success.log
 # TWITTER
 # Log file saved here: UPDATE ME
 # echo "$(date -Is) : Calculating FIB indices for Twitter..." >> $MASTER_LOG
-# $PYTHON_ENV scripts/data_processing/calc_twitter_fib_indices.py -d $TWITTER_SYM_DIR/${CURR_YYYY_MM} -o $FIB_OUT_DIR_TWITTER -m $CURR_YYYY_MM -n 3
+# $PYTHON_ENV scripts/data_processing/calc_twitter_fib_indices.py -d $TWITTER_SYM_DIR/${CURR_YYYY_MM} -o $FIB_OUT_DIR_TWITTER -m $CURR_YYYY_MM -n 3 -c $PARTIAL_STORE_DIR_TWITTER
 # if [ -e success.log ]; then
 #    echo "$(date -Is) : SUCCESS." >> $MASTER_LOG
 # else
@@ -160,7 +190,7 @@ rm success.log
 # FACEBOOK
 # Log file saved here: UPDATE ME
 echo "$(date -Is) : Calculating FIB indices for Facebook..." >> $MASTER_LOG
-$PYTHON_ENV scripts/data_processing/calc_crowdtangle_fib_indices.py -d $FACEBOOK_SYM_DIR/${CURR_YYYY_MM} -o $FIB_OUT_DIR_FACBOOK -m $CURR_YYYY_MM -n 3
+$PYTHON_ENV scripts/data_processing/calc_crowdtangle_fib_indices.py -d $FACEBOOK_SYM_DIR/${CURR_YYYY_MM} -o $FIB_OUT_DIR_FACBOOK -m $CURR_YYYY_MM -n 3 -c $PARTIAL_STORE_DIR_FACEBOOK
 if [ -e success.log ]; then
    echo "$(date -Is) : SUCCESS." >> $MASTER_LOG
 else
@@ -176,6 +206,11 @@ rm success.log
 # NOTE: The script updates images for FIBers found for the new month.
 #    To update links for ALL FIBers found since the inception of this project,
 #    include either "-a" or "--all-users" when executing the script below.
+#    Links are looked up in the profile image index files saved by
+#    calc_twitter_fib_indices.py (above), so no raw data is read. Months
+#    calculated before the index was saved have none and the script fails
+#    for them; backfill them once with:
+#    $PYTHON_ENV scripts/data_prep/convert_raw_to_post_stores.py -p twitter -i
 # -------------------------------------
 # echo "$(date -Is) : Updating new top FIBer Twitter profile image links..." >> $MASTER_LOG
 # $PYTHON_ENV scripts/data_processing/get_latest_profile_image_links.py